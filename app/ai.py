@@ -1,18 +1,15 @@
 import argparse
 import json
+import os
 import pickle
+import threading
 import traceback
-from io import BytesIO
+from dataclasses import dataclass
 from logging import getLogger
 from pathlib import Path
-
-import torch
-import torch.nn.functional as F
-import torchvision.transforms as transforms
-from PIL import Image
+from typing import Any, Callable, NamedTuple, Optional
 
 from app.config import set_logger
-from app.utils import get_model
 
 set_logger()
 logger = getLogger(__name__)
@@ -22,151 +19,482 @@ MODEL_WEIGHTS_FILE = BASE_PATH / "xp1_weights_best_acc.tar"
 PKL_PATH = BASE_PATH / "xp1.pkl"
 CLASS_NAMES_JSON_FILE = BASE_PATH / "new_plantnet300K_species_id_2_name.json"
 NUM_CLASSES = 8
+TOP_K = 3
+# CPU で推論する場合、重みファイルをメモリマップで読み込み、そのままモデルのパラメータにする。
+# 重みはページキャッシュ上の1つを全プロセスで共有するため、uvicorn のワーカーを増やしても
+# ワーカーごとに重みのコピーを持たない。
+# 共有されるのは eager のときだけで、torchscript・dynamic_int8・onnx は変換済みモデルを
+# 各プロセスのメモリに読み込むため効果がない（load_model でその旨をログに出す）
+MODEL_WEIGHTS_MMAP = os.getenv("MODEL_WEIGHTS_MMAP", "1") == "1"
+# 配布用の重みファイル（scripts/export_weights.py で作成する）。
+# 学習時のチェックポイントからモデルの重みだけを取り出し、モデル名・画像サイズ・クラスIDの順序を
+# 一緒に保存したもの。あればこちらを weights_only で読み込み、xp1.pkl とチェックポイントは使わない
+DEPLOY_WEIGHTS_FILE = BASE_PATH / "xp1_weights_best_acc.weights.pt"
+MODEL_DEPLOY_WEIGHTS = os.getenv("MODEL_DEPLOY_WEIGHTS", "1") == "1"
+DEPLOY_WEIGHTS_FORMAT = "spga-weights"
+DEPLOY_WEIGHTS_VERSION = 1
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-if not MODEL_WEIGHTS_FILE.exists():
-    logger.error(
-        f"モデルの重みファイルが見つかりません: {MODEL_WEIGHTS_FILE}. "
-        "このファイルは、モデルの学習済み重みを含む必要があります。"
-    )
-    raise FileNotFoundError(MODEL_WEIGHTS_FILE)
-if not PKL_PATH.exists():
-    logger.error(
-        f"pklファイルが見つかりません: {PKL_PATH}. "
-        "このファイルは、モデルの設定やパラメータを含む必要があります。"
-    )
-    raise FileNotFoundError(PKL_PATH)
-if not CLASS_NAMES_JSON_FILE.exists():
-    logger.error(
-        f"クラス名のJSONファイルが見つかりません: {CLASS_NAMES_JSON_FILE}. "
-        "このファイルは、モデルのクラスIDと名前をマッピングするために必要です。"
-    )
-    raise FileNotFoundError(CLASS_NAMES_JSON_FILE)
+class Prediction(NamedTuple):
+    """予測結果。top_k は確信度の高い順の (クラスID, 確信度)"""
 
-with open(CLASS_NAMES_JSON_FILE, "r", encoding="utf-8") as f:
-    id_to_name_map: dict = json.load(f)
+    class_id: str
+    confidence: float
+    top_k: tuple[tuple[str, float], ...] = ()
 
-with open(PKL_PATH, "rb") as f:
-    results = pickle.load(f)
 
-params = results["params"]
-model_name = params["model"]
-image_size = params["image_size"]
-crop_size = params["crop_size"]
+@dataclass
+class LoadedModel:
+    """推論に必要なものをまとめたもの"""
 
-class_ids = list(id_to_name_map.keys())
+    model: Any
+    device: Any
+    preprocess: Callable
+    preprocessor: Any
+    model_name: str
+    backend: str
+    image_size: int
+    crop_size: int
+    class_ids: list[str]
+    id_to_name_map: dict
+    # 予測結果のキャッシュのキーに使う、モデルと重みを識別する文字列
+    identity: str = ""
+    # 読み込んだ重みファイル（配布用の重みファイルかチェックポイント）。変換済みモデルの保存先の基準
+    weights_file: Optional[Path] = None
 
-args_for_get_model = argparse.Namespace(model=model_name, pretrained=False)
 
-try:
-    model = get_model(args_for_get_model, n_classes=NUM_CLASSES)
-    logger.info(f"モデル '{model_name}' を {NUM_CLASSES} クラスで初期化しました。")
-except Exception as e:
-    logger.error(f"モデルの初期化中にエラー (get_model): {e}")
-    logger.error(traceback.format_exc())
+def model_identity(model_name: str, backend: str, weights_file: Path) -> str:
+    """モデル名・バックエンド・重みファイル（名前・更新時刻・サイズ）から作る識別子"""
+    stat = weights_file.stat()
+    return f"{model_name}/{backend}/{weights_file.name}:{stat.st_mtime_ns}:{stat.st_size}"
 
-model.to(device)
-model.eval()
 
-try:
-    checkpoint = torch.load(MODEL_WEIGHTS_FILE, map_location=device)
-    state_dict_to_load = None
+def _check_files(deploy: bool = False):
+    """deploy が True の場合は配布用の重みファイルを使うため、チェックポイントと pkl は確認しない"""
+    if not deploy and not MODEL_WEIGHTS_FILE.exists():
+        logger.error(
+            f"モデルの重みファイルが見つかりません: {MODEL_WEIGHTS_FILE}. "
+            "このファイルは、モデルの学習済み重みを含む必要があります。"
+        )
+        raise FileNotFoundError(MODEL_WEIGHTS_FILE)
+    if not deploy and not PKL_PATH.exists():
+        logger.error(
+            f"pklファイルが見つかりません: {PKL_PATH}. "
+            "このファイルは、モデルの設定やパラメータを含む必要があります。"
+        )
+        raise FileNotFoundError(PKL_PATH)
+    if not CLASS_NAMES_JSON_FILE.exists():
+        logger.error(
+            f"クラス名のJSONファイルが見つかりません: {CLASS_NAMES_JSON_FILE}. "
+            "このファイルは、モデルのクラスIDと名前をマッピングするために必要です。"
+        )
+        raise FileNotFoundError(CLASS_NAMES_JSON_FILE)
+
+
+def _extract_state_dict(checkpoint):
+    """学習時のチェックポイントからモデルの state_dict を取り出す"""
     if (
         isinstance(checkpoint, dict)
         and "model" in checkpoint
         and isinstance(checkpoint["model"], dict)
     ):
-        state_dict_to_load = checkpoint["model"]
+        return checkpoint["model"]
     elif isinstance(checkpoint, dict) and "model_state_dict" in checkpoint:
-        state_dict_to_load = checkpoint["model_state_dict"]
+        return checkpoint["model_state_dict"]
     elif isinstance(checkpoint, dict) and "state_dict" in checkpoint:
-        state_dict_to_load = checkpoint["state_dict"]
+        return checkpoint["state_dict"]
     elif isinstance(checkpoint, dict) and not any(
         key in ["epoch", "optimizer", "lr_scheduler", "model"]
         for key in checkpoint.keys()
     ):
-        state_dict_to_load = checkpoint
+        return checkpoint
     elif not isinstance(checkpoint, dict):
-        state_dict_to_load = checkpoint
+        return checkpoint
+    return None
 
-    if state_dict_to_load is None:
-        logger.error("チェックポイントの構造が予期したものではありません。")
-        logger.error(
-            f"チェックポイントのトップレベルキー: {list(checkpoint.keys()) if isinstance(checkpoint, dict) else 'N/A'}"
-        )
 
-    incompatible_keys = model.load_state_dict(state_dict_to_load, strict=False)
-    if not incompatible_keys.missing_keys and not incompatible_keys.unexpected_keys:
-        logger.info(f"モデルの重みを '{MODEL_WEIGHTS_FILE}' から正常にロードしました。")
-    else:
-        logger.info(
-            f"モデルの重みを '{MODEL_WEIGHTS_FILE}' からロードしました。一部互換性のないキーがありました:"
-        )
-        if incompatible_keys.missing_keys:
-            logger.info(
-                f"モデルに存在するがチェックポイントにないキー: {incompatible_keys.missing_keys}"
+def load_checkpoint(path: Path, device) -> tuple[Any, bool]:
+    """
+    チェックポイントを読み込む。戻り値は (チェックポイント, メモリマップで読み込んだか)。
+    古い形式（zip でない）のファイルはメモリマップできないため、通常の読み込みを行う。
+    """
+    import torch
+
+    if MODEL_WEIGHTS_MMAP and device.type == "cpu":
+        try:
+            return torch.load(path, map_location=device, mmap=True), True
+        except RuntimeError as e:
+            logger.warning(
+                f"'{path}' をメモリマップで読み込めないため、通常の読み込みを行います: {e}"
             )
-        if incompatible_keys.unexpected_keys:
+    return torch.load(path, map_location=device), False
+
+
+def _init_model(model_name: str, device):
+    """学習時と同じ構成のモデルを作る（重みは初期値のまま）"""
+    from app.utils import get_model
+
+    args_for_get_model = argparse.Namespace(model=model_name, pretrained=False)
+
+    try:
+        model = get_model(args_for_get_model, n_classes=NUM_CLASSES)
+        logger.info(f"モデル '{model_name}' を {NUM_CLASSES} クラスで初期化しました。")
+    except Exception as e:
+        logger.error(f"モデルの初期化中にエラー (get_model): {e}")
+        logger.error(traceback.format_exc())
+        raise
+
+    model.to(device)
+    model.eval()
+    return model
+
+
+def build_eager_model(model_name: str, device, weights: Optional[tuple[dict, bool]] = None):
+    """
+    学習時と同じ構成のモデルを作り、重みを読み込む。
+    weights は配布用の重みファイルから読み込んだ (state_dict, メモリマップしたか)。
+    省略した場合は学習時のチェックポイントから読み込む。
+    """
+    model = _init_model(model_name, device)
+    weights_file = MODEL_WEIGHTS_FILE if weights is None else DEPLOY_WEIGHTS_FILE
+
+    try:
+        if weights is None:
+            checkpoint, mmapped = load_checkpoint(MODEL_WEIGHTS_FILE, device)
+            state_dict_to_load = _extract_state_dict(checkpoint)
+
+            if state_dict_to_load is None:
+                logger.error("チェックポイントの構造が予期したものではありません。")
+                logger.error(
+                    f"チェックポイントのトップレベルキー: {list(checkpoint.keys()) if isinstance(checkpoint, dict) else 'N/A'}"
+                )
+        else:
+            state_dict_to_load, mmapped = weights
+
+        # メモリマップした場合は、重みをコピーせずにパラメータとして使う (assign=True)
+        incompatible_keys = model.load_state_dict(
+            state_dict_to_load, strict=False, assign=mmapped
+        )
+        if not incompatible_keys.missing_keys and not incompatible_keys.unexpected_keys:
+            logger.info(f"モデルの重みを '{weights_file}' から正常にロードしました。")
+        else:
             logger.info(
-                f"チェックポイントに存在するがモデルにないキー (無視されました): {incompatible_keys.unexpected_keys}"
+                f"モデルの重みを '{weights_file}' からロードしました。一部互換性のないキーがありました:"
             )
-except Exception as e:
-    logger.error(f"モデル重みのロード中にエラーが発生しました: {e}")
-    logger.error(traceback.format_exc())
-
-logger.info(f"デバイス '{device}' を使用します。")
+            if incompatible_keys.missing_keys:
+                logger.info(
+                    f"モデルに存在するがチェックポイントにないキー: {incompatible_keys.missing_keys}"
+                )
+            if incompatible_keys.unexpected_keys:
+                logger.info(
+                    f"チェックポイントに存在するがモデルにないキー (無視されました): {incompatible_keys.unexpected_keys}"
+                )
+    except Exception as e:
+        logger.error(f"モデル重みのロード中にエラーが発生しました: {e}")
+        logger.error(traceback.format_exc())
 
-preprocess = transforms.Compose(
-    [
-        transforms.Resize(image_size),
-        transforms.CenterCrop(crop_size),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ]
-)
+    return model
 
 
-def predict_minimal(
-    image_binary: bytes = None,
-):
+def load_deploy_weights(device) -> Optional[tuple[dict, dict, bool]]:
     """
-    指定された設定と重みファイルで単一画像を予測する最小限の関数。
-    クラスIDとクラス名表示に対応。
+    配布用の重みファイルを読み込む。戻り値は (メタデータ, state_dict, メモリマップで読み込んだか)。
+    テンソルと基本的な型しか含まないため weights_only で読み込め、CPU ではメモリマップする。
+    ファイルがない、チェックポイントより古い、形式が違う場合は None を返す（チェックポイントを使う）。
     """
+    import torch
+
+    if not MODEL_DEPLOY_WEIGHTS or not DEPLOY_WEIGHTS_FILE.exists():
+        return None
+    if (
+        MODEL_WEIGHTS_FILE.exists()
+        and MODEL_WEIGHTS_FILE.stat().st_mtime > DEPLOY_WEIGHTS_FILE.stat().st_mtime
+    ):
+        logger.warning(
+            f"配布用の重みファイル '{DEPLOY_WEIGHTS_FILE}' がチェックポイントより古いため使用しません。"
+            "scripts/export_weights.py で作り直してください。"
+        )
+        return None
 
-    # 画像の読み込み部分を修正
+    mmap = MODEL_WEIGHTS_MMAP and device.type == "cpu"
     try:
-        img = Image.open(BytesIO(image_binary)).convert("RGB")
+        artifact = torch.load(
+            DEPLOY_WEIGHTS_FILE, map_location=device, mmap=mmap, weights_only=True
+        )
+        if (
+            artifact.get("format") != DEPLOY_WEIGHTS_FORMAT
+            or artifact.get("version") != DEPLOY_WEIGHTS_VERSION
+        ):
+            raise ValueError(
+                f"未対応の形式です: {artifact.get('format')} (version {artifact.get('version')})"
+            )
+        return artifact["metadata"], artifact["state_dict"], mmap
     except Exception as e:
-        logger.error(f"画像 の読み込み中にエラー: {e}")
-        return
+        logger.warning(
+            f"配布用の重みファイル '{DEPLOY_WEIGHTS_FILE}' を読み込めないため、チェックポイントを使用します: {e}"
+        )
+        return None
 
-    img_tensor = preprocess(img).unsqueeze(0).to(device)
 
-    with torch.no_grad():
-        outputs = model(img_tensor)
-        probabilities = F.softmax(outputs, dim=1)
-        confidence, predicted_idx_tensor = torch.max(probabilities, 1)
+def export_deploy_weights(output: Path = DEPLOY_WEIGHTS_FILE) -> Path:
+    """
+    学習時のチェックポイントから配布用の重みファイルを作る。
+    オプティマイザなどの学習時の状態は含めず、モデルの重みとモデルの構築に必要な値だけを保存する。
+    """
+    import torch
+
+    _check_files()
+
+    with open(CLASS_NAMES_JSON_FILE, "r", encoding="utf-8") as f:
+        id_to_name_map: dict = json.load(f)
+
+    with open(PKL_PATH, "rb") as f:
+        params = pickle.load(f)["params"]
+
+    device = torch.device("cpu")
+    checkpoint, _ = load_checkpoint(MODEL_WEIGHTS_FILE, device)
+    state_dict = _extract_state_dict(checkpoint)
+    if state_dict is None:
+        raise ValueError(f"'{MODEL_WEIGHTS_FILE}' からモデルの重みを取り出せません。")
+
+    model = _init_model(params["model"], device)
+    incompatible_keys = model.load_state_dict(state_dict, strict=False)
+    # 足りない重みがあると初期値のまま配布されてしまうため、書き出さない
+    if incompatible_keys.missing_keys:
+        raise ValueError(
+            f"チェックポイントにモデルの重みが足りません: {incompatible_keys.missing_keys}"
+        )
+    if incompatible_keys.unexpected_keys:
+        logger.info(
+            f"モデルにないキーは書き出しません: {incompatible_keys.unexpected_keys}"
+        )
+
+    artifact = {
+        "format": DEPLOY_WEIGHTS_FORMAT,
+        "version": DEPLOY_WEIGHTS_VERSION,
+        "metadata": {
+            "model": params["model"],
+            "image_size": params["image_size"],
+            "crop_size": params["crop_size"],
+            "num_classes": NUM_CLASSES,
+            "class_ids": list(id_to_name_map.keys()),
+            "source": MODEL_WEIGHTS_FILE.name,
+        },
+        # モデルに読み込んだ後の state_dict を保存するため、キーはモデルの構成と一致する
+        "state_dict": {
+            key: value.detach().contiguous()
+            for key, value in model.state_dict().items()
+        },
+    }
+    # 書き込み中のファイルを読み込まないよう、一時ファイルに書いてから置き換える
+    tmp = output.with_name(output.name + ".tmp")
+    torch.save(artifact, tmp)
+    os.replace(tmp, output)
+    logger.info(f"配布用の重みファイルを '{output}' に書き出しました。")
+    return output
+
+
+def load_model(backend: Optional[str] = None) -> LoadedModel:
+    """
+    設定ファイルと重みファイルからモデルを構築する（重い処理）。
+    backend を省略した場合は環境変数 INFERENCE_BACKEND の値を使う。
+    """
+    import torch
+    import torchvision.transforms as transforms
+
+    from app import backends
+    from app.preprocess import FastPreprocessor
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    deploy = load_deploy_weights(device)
+    _check_files(deploy=deploy is not None)
+
+    with open(CLASS_NAMES_JSON_FILE, "r", encoding="utf-8") as f:
+        id_to_name_map: dict = json.load(f)
+
+    if deploy is not None:
+        metadata, state_dict, mmapped = deploy
+        model_name = metadata["model"]
+        image_size = metadata["image_size"]
+        crop_size = metadata["crop_size"]
+        # クラスIDの順序はモデルの出力の順序なので、重みと一緒に保存したものを使う
+        class_ids = metadata["class_ids"]
+        if set(class_ids) != set(id_to_name_map):
+            logger.warning(
+                f"配布用の重みファイルのクラスIDが '{CLASS_NAMES_JSON_FILE}' と一致しません。"
+            )
+        weights_file = DEPLOY_WEIGHTS_FILE
+        weights = (state_dict, mmapped)
+    else:
+        with open(PKL_PATH, "rb") as f:
+            results = pickle.load(f)
+
+        params = results["params"]
+        model_name = params["model"]
+        image_size = params["image_size"]
+        crop_size = params["crop_size"]
 
-    predicted_class_index = predicted_idx_tensor.item()
-    prediction_confidence = confidence.item()
+        class_ids = list(id_to_name_map.keys())
+        weights_file = MODEL_WEIGHTS_FILE
+        weights = None
 
-    logger.info(f"--- 予測結果 ({NUM_CLASSES} クラス中) ---")
-    logger.info(
-        f"予測されたクラスインデックス: {predicted_class_index} (0 から {NUM_CLASSES - 1} の範囲)"
+    model, backend = backends.prepare(
+        backend or backends.INFERENCE_BACKEND,
+        lambda: build_eager_model(model_name, device, weights),
+        weights_file,
+        crop_size,
+        device,
     )
 
-    # ★★★ IDとクラス名表示の追加 ★★★
-    predicted_id_str = "N/A"
+    logger.info(f"デバイス '{device}' で推論バックエンド '{backend}' を使用します。")
+    if MODEL_WEIGHTS_MMAP and device.type == "cpu" and backend != "eager":
+        logger.info(
+            f"推論バックエンド '{backend}' では MODEL_WEIGHTS_MMAP は効果がありません"
+            "（重みはプロセスごとに読み込まれ、ワーカー間で共有されません）。"
+        )
+
+    preprocess = transforms.Compose(
+        [
+            transforms.Resize(image_size),
+            transforms.CenterCrop(crop_size),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ]
+    )
+
+    return LoadedModel(
+        model=model,
+        device=device,
+        preprocess=preprocess,
+        preprocessor=FastPreprocessor(image_size, crop_size),
+        model_name=model_name,
+        backend=backend,
+        image_size=image_size,
+        crop_size=crop_size,
+        class_ids=class_ids,
+        id_to_name_map=id_to_name_map,
+        identity=model_identity(model_name, backend, weights_file),
+        weights_file=weights_file,
+    )
+
+
+class ModelRegistry:
+    """
+    モデルを初回利用時（もしくは warm_up() の呼び出し時）に一度だけロードする。
+    import 時には torch もモデルも読み込まない。
+    """
+
+    def __init__(self, loader: Callable[[], LoadedModel] = load_model):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._loaded: Optional[LoadedModel] = None
+        self.error: Optional[BaseException] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._loaded is not None
+
+    @property
+    def identity(self) -> Optional[str]:
+        """ロード済みのモデルの識別子。ロード前は None"""
+        loaded = self._loaded
+        return None if loaded is None else loaded.identity
+
+    def get(self) -> LoadedModel:
+        loaded = self._loaded
+        if loaded is not None:
+            return loaded
+        with self._lock:
+            if self._loaded is None:
+                try:
+                    self._loaded = self._loader()
+                    self.error = None
+                except BaseException as e:
+                    self.error = e
+                    raise
+            return self._loaded
+
+    def warm_up(self):
+        """バックグラウンドでのロード用。例外は記録するだけで送出しない。"""
+        try:
+            self.get()
+            logger.info("モデルのウォームアップが完了しました。")
+        except Exception as e:
+            logger.error(f"モデルのウォームアップに失敗しました: {e}")
 
+
+registry = ModelRegistry()
+
+
+def _class_id(class_ids: list[str], predicted_class_index: int) -> str:
     if class_ids and 0 <= predicted_class_index < len(class_ids):
-        predicted_id_str = class_ids[predicted_class_index]
+        return class_ids[predicted_class_index]
+    return "N/A"
+
+
+def predict_batch(image_binaries: list[bytes]) -> list[Optional[Prediction]]:
+    """
+    複数の画像をまとめて1回の推論で予測する。
+    入力と同じ順序で予測結果のリストを返す。読み込めなかった画像はNoneになる。
+    """
+    import torch
+    import torch.nn.functional as F
+
+    loaded = registry.get()
+    class_ids = loaded.class_ids
 
-    if predicted_id_str != "N/A":
+    results: list[Optional[Prediction]] = [None] * len(image_binaries)
+    batch_tensor, valid_indices = loaded.preprocessor(image_binaries)
+    if not valid_indices:
+        return results
+
+    batch_tensor = batch_tensor.to(loaded.device)
+
+    with torch.no_grad():
+        outputs = loaded.model(batch_tensor)
+        probabilities = F.softmax(outputs, dim=1)
+        top_confidences, top_indices = torch.topk(
+            probabilities, min(TOP_K, probabilities.shape[1]), dim=1
+        )
+
+    for i, confidences, indices in zip(
+        valid_indices, top_confidences.tolist(), top_indices.tolist()
+    ):
+        predicted_class_index = indices[0]
+        prediction_confidence = confidences[0]
+        logger.info(f"--- 予測結果 ({NUM_CLASSES} クラス中) ---")
         logger.info(
-            f"ID: {predicted_id_str} Name: {id_to_name_map.get(predicted_id_str)}"
+            f"予測されたクラスインデックス: {predicted_class_index} (0 から {NUM_CLASSES - 1} の範囲)"
         )
 
-    logger.info(f"確信度 (Softmax確率): {prediction_confidence:.4f}")
-    return predicted_id_str, prediction_confidence
+        predicted_id_str = _class_id(class_ids, predicted_class_index)
+
+        if predicted_id_str != "N/A":
+            logger.info(
+                f"ID: {predicted_id_str} Name: {loaded.id_to_name_map.get(predicted_id_str)}"
+            )
+
+        logger.info(f"確信度 (Softmax確率): {prediction_confidence:.4f}")
+        results[i] = Prediction(
+            predicted_id_str,
+            prediction_confidence,
+            tuple(
+                (_class_id(class_ids, index), confidence)
+                for index, confidence in zip(indices, confidences)
+            ),
+        )
+
+    return results
+
+
+def predict_minimal(
+    image_binary: bytes = None,
+):
+    """
+    指定された設定と重みファイルで単一画像を予測する最小限の関数。
+    クラスIDとクラス名表示に対応。
+    """
+    prediction = predict_batch([image_binary])[0]
+    if prediction is None:
+        return None
+    return prediction.class_id, prediction.confidence
@@ -0,0 +1,147 @@
+import os
+from logging import getLogger
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+logger = getLogger(__name__)
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+
+# eager:        学習時と同じ fp32 のモデルをそのまま使う
+# torchscript:  trace + freeze した TorchScript（読み込み時に optimize_for_inference を適用）
+# dynamic_int8: Linear 層を動的 int8 量子化した上で TorchScript 化したもの
+# onnx:         ONNX にエクスポートして ONNX Runtime で実行する（onnxruntime が必要）
+BACKENDS = ("eager", "torchscript", "dynamic_int8", "onnx")
+
+
+def artifact_path(weights_file: Path, backend: str) -> Path:
+    """変換済みモデルの保存先（重みファイルと同じディレクトリ）"""
+    suffix = ".onnx" if backend == "onnx" else ".pt"
+    return weights_file.with_name(f"{weights_file.stem}.{backend}{suffix}")
+
+
+def _is_fresh(artifact: Path, weights_file: Path) -> bool:
+    return (
+        artifact.exists() and artifact.stat().st_mtime >= weights_file.stat().st_mtime
+    )
+
+
+class OnnxModel:
+    """ONNX Runtime のセッションを torch のモデルと同じように呼び出すためのラッパー"""
+
+    def __init__(self, path: Path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch_tensor: torch.Tensor) -> torch.Tensor:
+        (outputs,) = self.session.run(
+            None, {self.input_name: batch_tensor.cpu().numpy()}
+        )
+        return torch.from_numpy(outputs)
+
+    def eval(self):
+        return self
+
+
+def load_artifact(backend: str, weights_file: Path, device: torch.device):
+    """キャッシュ済みの変換済みモデルがあれば読み込む。なければNoneを返す。"""
+    if backend == "eager":
+        return None
+    path = artifact_path(weights_file, backend)
+    if not _is_fresh(path, weights_file):
+        return None
+    try:
+        if backend == "onnx":
+            model = OnnxModel(path)
+        else:
+            model = torch.jit.load(str(path), map_location=device)
+            model.eval()
+            if backend == "torchscript":
+                model = torch.jit.optimize_for_inference(model)
+        logger.info(f"変換済みモデル '{path}' を読み込みました。")
+        return model
+    except Exception as e:
+        logger.warning(f"変換済みモデル '{path}' の読み込みに失敗しました: {e}")
+        return None
+
+
+def convert(
+    model: torch.nn.Module,
+    backend: str,
+    weights_file: Path,
+    crop_size: int,
+    device: torch.device,
+):
+    """eager のモデルを指定のバックエンド向けに変換し、ディスクにキャッシュする"""
+    if backend == "eager":
+        return model
+    if backend not in BACKENDS:
+        raise ValueError(f"未対応の推論バックエンドです: {backend} ({BACKENDS})")
+
+    path = artifact_path(weights_file, backend)
+    example = torch.randn(1, 3, crop_size, crop_size, device=device)
+    model.eval()
+
+    if backend == "onnx":
+        torch.onnx.export(
+            model,
+            example,
+            str(path),
+            input_names=["input"],
+            output_names=["logits"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=17,
+        )
+        converted = OnnxModel(path)
+    else:
+        if backend == "dynamic_int8":
+            if device.type != "cpu":
+                logger.warning("int8 量子化モデルは CPU でのみ実行できます。")
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example)
+            traced = torch.jit.freeze(traced)
+        # optimize_for_inference の結果は保存できないため、読み込み時に毎回適用する
+        torch.jit.save(traced, str(path))
+        converted = traced
+        if backend == "torchscript":
+            converted = torch.jit.optimize_for_inference(traced)
+
+    logger.info(f"モデルを '{backend}' に変換し '{path}' に保存しました。")
+    return converted
+
+
+def prepare(
+    backend: str,
+    build_eager_model,
+    weights_file: Path,
+    crop_size: int,
+    device: torch.device,
+) -> tuple[object, str]:
+    """
+    指定のバックエンドのモデルを用意する。
+    キャッシュがあれば eager のモデルを作らずに読み込み、変換に失敗した場合は eager に戻す。
+    戻り値は (モデル, 実際に使うバックエンド名)。
+    """
+    cached: Optional[object] = load_artifact(backend, weights_file, device)
+    if cached is not None:
+        return cached, backend
+
+    model = build_eager_model()
+    if backend == "eager":
+        return model, backend
+    try:
+        return convert(model, backend, weights_file, crop_size, device), backend
+    except Exception as e:
+        logger.error(f"モデルの '{backend}' への変換に失敗したため eager を使用します: {e}")
+        return model, "eager"
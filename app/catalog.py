@@ -0,0 +1,175 @@
+import difflib
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+from logging import getLogger
+from types import MappingProxyType
+from typing import Iterable, Optional
+
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import models
+from app.rules import get_catalog_version, get_catalog_version_async
+
+logger = getLogger(__name__)
+
+# catalog_versions の名前
+PLANTS = "plants"
+# 植物のマスタデータが更新されたかを確認する間隔（秒）
+PLANT_CATALOG_CHECK_INTERVAL = float(os.getenv("PLANT_CATALOG_CHECK_INTERVAL", "60"))
+# 表記ゆれの候補として扱う類似度の下限 (difflib.SequenceMatcher.ratio)
+PLANT_CATALOG_FUZZY_CUTOFF = float(os.getenv("PLANT_CATALOG_FUZZY_CUTOFF", "0.6"))
+
+_SPACES = re.compile(r"[\s・･\-_]+")
+# ひらがなをカタカナにそろえる（ぁ-ゖ → ァ-ヶ）
+_HIRAGANA_TO_KATAKANA = {code: code + 0x60 for code in range(0x3041, 0x3097)}
+
+
+def normalize(text: str) -> str:
+    """
+    表記ゆれを吸収した名前。全角・半角 (NFKC)、大文字・小文字、ひらがな・カタカナ、
+    空白と区切り記号の違いを無視する
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _SPACES.sub("", text.translate(_HIRAGANA_TO_KATAKANA))
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogPlant:
+    """plants の1行。Plant と同じ名前の属性を持つ"""
+
+    id: int
+    name_jp: Optional[str]
+    name_en: str
+    description: Optional[str]
+    previewImageUrl: Optional[str]
+    originalContentUrl: Optional[str]
+
+    @classmethod
+    def from_plant(cls, plant: models.Plant) -> "CatalogPlant":
+        return cls(
+            id=plant.id,
+            name_jp=plant.name_jp,
+            name_en=plant.name_en,
+            description=plant.description,
+            previewImageUrl=plant.previewImageUrl,
+            originalContentUrl=plant.originalContentUrl,
+        )
+
+
+class PlantCatalog:
+    """植物IDと名前で植物を引ける読み取り専用の表"""
+
+    def __init__(self, plants: Iterable[CatalogPlant], version: int = 0):
+        self.version = version
+        by_id, by_name, by_normalized = {}, {}, {}
+        for plant in plants:
+            by_id[plant.id] = plant
+            for name in (plant.name_jp, plant.name_en):
+                if name:
+                    by_name.setdefault(name, plant)
+                    by_normalized.setdefault(normalize(name), plant)
+        self.by_id = MappingProxyType(by_id)
+        self.by_name = MappingProxyType(by_name)
+        self.by_normalized = MappingProxyType(by_normalized)
+        self._normalized_names = tuple(by_normalized)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def ids(self) -> list[int]:
+        return list(self.by_id)
+
+    def get(self, plant_id: int) -> Optional[CatalogPlant]:
+        return self.by_id.get(plant_id)
+
+    def resolve(self, text: str) -> Optional[CatalogPlant]:
+        """
+        植物ID・日本語名・英語名のいずれかに一致する植物。
+        完全に一致するものがなければ、表記ゆれを無視して一致するものを返す
+        """
+        text = text.strip()
+        plant = self.by_name.get(text)
+        if plant is not None:
+            return plant
+        key = normalize(text)
+        if key.isdecimal():
+            return self.by_id.get(int(key))
+        return self.by_normalized.get(key)
+
+    def suggest(
+        self, text: str, limit: int = 3, cutoff: float = PLANT_CATALOG_FUZZY_CUTOFF
+    ) -> list[CatalogPlant]:
+        """名前が似ている植物（似ている順）"""
+        matches = difflib.get_close_matches(
+            normalize(text), self._normalized_names, n=limit, cutoff=cutoff
+        )
+        return [self.by_normalized[match] for match in matches]
+
+
+def load_catalog(session: Session) -> PlantCatalog:
+    """plants テーブル全体を読み込む"""
+    version = get_catalog_version(session, PLANTS)
+    plants = session.exec(select(models.Plant).order_by(models.Plant.id)).all()
+    return PlantCatalog(map(CatalogPlant.from_plant, plants), version)
+
+
+async def load_catalog_async(session: AsyncSession) -> PlantCatalog:
+    version = await get_catalog_version_async(session, PLANTS)
+    plants = (await session.exec(select(models.Plant).order_by(models.Plant.id))).all()
+    return PlantCatalog(map(CatalogPlant.from_plant, plants), version)
+
+
+class CatalogRegistry:
+    """
+    植物の表をメモリに保持する。
+    check_interval 秒ごとに catalog_versions を確認し、変わっていれば読み込み直す。
+    表は作り直すたびに置き換えるだけなので、読み込み中も古い表を参照できる。
+    """
+
+    def __init__(self, check_interval: float = PLANT_CATALOG_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._catalog: Optional[PlantCatalog] = None
+        self._checked_at = 0.0
+
+    def _fresh(self) -> Optional[PlantCatalog]:
+        if self._catalog is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return self._catalog
+        return None
+
+    def _replace(self, catalog: PlantCatalog):
+        self._catalog = catalog
+        self._checked_at = time.monotonic()
+        logger.info(f"植物の一覧を読み込みました: {len(catalog)} 件")
+
+    def get(self, session: Session) -> PlantCatalog:
+        catalog = self._fresh()
+        if catalog is not None:
+            return catalog
+        if self._catalog is not None and get_catalog_version(session, PLANTS) == self._catalog.version:
+            self._checked_at = time.monotonic()
+            return self._catalog
+        self._replace(load_catalog(session))
+        return self._catalog
+
+    async def get_async(self, session: AsyncSession) -> PlantCatalog:
+        catalog = self._fresh()
+        if catalog is not None:
+            return catalog
+        if (
+            self._catalog is not None
+            and await get_catalog_version_async(session, PLANTS) == self._catalog.version
+        ):
+            self._checked_at = time.monotonic()
+            return self._catalog
+        self._replace(await load_catalog_async(session))
+        return self._catalog
+
+    def invalidate(self):
+        self._catalog = None
+
+
+registry = CatalogRegistry()
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import datetime
+from logging import getLogger
+from typing import Optional
+
+from sqlalchemy import event, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import models
+from app.crud.utils import get_create_user_async
+
+logger = getLogger(__name__)
+
+# メモリに保持するユーザー数
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "10000"))
+# この秒数を過ぎたらデータベースから読み直す（他のプロセスの更新を反映するため）
+CONVERSATION_CACHE_TTL = float(os.getenv("CONVERSATION_CACHE_TTL", "300"))
+
+
+class StaleStateError(Exception):
+    """会話の状態が別のプロセスで先に更新されていた"""
+
+
+@dataclass(frozen=True)
+class ConversationState:
+    """users テーブルのうち会話の状態に関する列"""
+
+    user_id: str
+    current_predict: Optional[str] = None
+    delete_mode: bool = False
+    awaiting_device_id: int = 0
+    version: int = 0
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "ConversationState":
+        return cls(
+            user_id=user.id,
+            current_predict=_as_predict(user.current_predict),
+            delete_mode=bool(user.delete_mode),
+            awaiting_device_id=int(user.awaiting_device_id or 0),
+            version=user.version or 0,
+        )
+
+
+def _as_predict(value) -> Optional[str]:
+    # current_predict は文字列の列なので、データベースから読んだときと同じ型にそろえる
+    return None if value is None else str(value)
+
+
+class ConversationStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.conflicts = 0
+        self.stale = 0
+        self.messages = 0
+        self.commits = 0
+        self._watched = set()
+
+    def count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def watch_commits(self, engine):
+        """engine（非同期エンジンの場合は sync_engine）のコミット数を数える"""
+        if id(engine) in self._watched:
+            return
+        self._watched.add(id(engine))
+        event.listen(engine, "commit", lambda conn: self.count("commits"))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "conflicts": self.conflicts,
+                "stale": self.stale,
+                "messages": self.messages,
+                "commits": self.commits,
+                "commits_per_message": self.commits / self.messages if self.messages else 0.0,
+            }
+
+
+class ConversationStateStore:
+    """
+    ユーザーごとの会話の状態を LRU でメモリに保持する。
+
+    - get() はキャッシュにあっても users.version だけを主キーで読み、キャッシュと違う場合
+      （別のプロセス、例えば別の Webhook のワーカーが更新した場合）は読み直す。
+      ttl 秒を過ぎた状態も読み直す
+    - update() は users を書き換えてからキャッシュに反映する（write-through）。
+      version が読み込んだときと同じ場合だけ更新し、違う場合は別のプロセスが先に
+      更新しているので、ロールバックしてキャッシュを捨て StaleStateError を送出する
+    - update() のコミットには、同じセッションで行った他の変更（登録の追加・削除）も含まれる
+    """
+
+    def __init__(
+        self,
+        max_size: int = CONVERSATION_CACHE_SIZE,
+        ttl: float = CONVERSATION_CACHE_TTL,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = ConversationStats()
+        self._states: OrderedDict[str, tuple[ConversationState, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _cached(self, user_id: str) -> Optional[ConversationState]:
+        with self._lock:
+            entry = self._states.get(user_id)
+            if entry is None:
+                return None
+            state, loaded_at = entry
+            if time.monotonic() - loaded_at >= self.ttl:
+                del self._states[user_id]
+                return None
+            self._states.move_to_end(user_id)
+            return state
+
+    def _put(self, state: ConversationState):
+        with self._lock:
+            self._states[state.user_id] = (state, time.monotonic())
+            self._states.move_to_end(state.user_id)
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    async def get(self, session: AsyncSession, user_id: str) -> ConversationState:
+        """会話の状態を返す。ユーザーがいなければ作成する"""
+        state = self._cached(user_id)
+        if state is not None:
+            version = (
+                await session.exec(
+                    select(models.User.version).where(models.User.id == user_id)
+                )
+            ).first()
+            if version == state.version:
+                self.stats.count("hits")
+                return state
+            self.invalidate(user_id)
+            self.stats.count("stale")
+        self.stats.count("misses")
+        user = await get_create_user_async(session, user_id)
+        state = ConversationState.from_user(user)
+        self._put(state)
+        return state
+
+    async def update(
+        self, session: AsyncSession, state: ConversationState, **changes
+    ) -> ConversationState:
+        """状態を changes で更新してコミットし、新しい状態を返す"""
+        if "current_predict" in changes:
+            changes["current_predict"] = _as_predict(changes["current_predict"])
+        new_state = replace(state, **changes, version=state.version + 1)
+        result = await session.exec(
+            update(models.User)
+            .where(models.User.id == state.user_id, models.User.version == state.version)
+            .values(**changes, version=new_state.version, updated_at=datetime.now())
+        )
+        if result.rowcount != 1:
+            await session.rollback()
+            self.invalidate(state.user_id)
+            self.stats.count("conflicts")
+            raise StaleStateError(
+                f"{state.user_id} の会話の状態は別の処理で更新されています (version={state.version})"
+            )
+        await session.commit()
+        self._put(new_state)
+        self.stats.count("writes")
+        return new_state
+
+
+store = ConversationStateStore()
@@ -1,11 +1,22 @@
 import logging
+from typing import Optional
 
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import models
+from app.sensor import NUM_CHANNELS
 
 logger = logging.getLogger(__name__)
 
+# 登録できるセンサー番号
+DEVICE_IDS = range(NUM_CHANNELS)
+
+
+def valid_device_id(device_id: int) -> bool:
+    """存在するセンサーの番号か。存在しないセンサーの登録は水やりの判定で読み取りに失敗する"""
+    return device_id in DEVICE_IDS
+
 
 def get_create_user(db: Session, user_id: str):
     user = db.exec(select(models.User).where(models.User.id == user_id)).first()
@@ -20,6 +31,8 @@ def get_create_user(db: Session, user_id: str):
 
 
 def plant_regist(db: Session, plant_id: int, user_id: int, device_id: int = 0):
+    if not valid_device_id(device_id):
+        return False
     registed = db.exec(
         select(models.Registed).where(
             models.Registed.plant_id == plant_id,
@@ -36,3 +49,75 @@ def plant_regist(db: Session, plant_id: int, user_id: int, device_id: int = 0):
         return True
     else:
         return False
+
+
+async def get_create_user_async(db: AsyncSession, user_id: str):
+    """get_create_user の非同期版"""
+    user = (
+        await db.exec(select(models.User).where(models.User.id == user_id))
+    ).first()
+    if user is None:
+        new_user = models.User(id=user_id)
+        db.add(new_user)
+        await db.commit()
+        logger.info(f"Created new user: {new_user.id}")
+        return new_user
+    else:
+        return user
+
+
+async def plant_regist_async(
+    db: AsyncSession, plant_id: int, user_id: int, device_id: int = 0, commit: bool = True
+):
+    """plant_regist の非同期版。commit=False の場合は登録をセッションに追加するだけ"""
+    if not valid_device_id(device_id):
+        return False
+    registed = (
+        await db.exec(
+            select(models.Registed).where(
+                models.Registed.plant_id == plant_id,
+                models.Registed.device_id == device_id,
+                models.Registed.user_id == user_id,
+            )
+        )
+    ).first()
+    if registed is None:
+        new_registed = models.Registed(
+            plant_id=plant_id, device_id=device_id, user_id=user_id
+        )
+        db.add(new_registed)
+        if commit:
+            await db.commit()
+        return True
+    else:
+        return False
+
+
+def registed_plants_query(user_id: str, limit: Optional[int] = None, offset: int = 0):
+    """
+    ユーザーの登録を (植物ID, 日本語の植物名, デバイスID) の組で登録順に取得するクエリ。
+    植物名は結合して1回のSELECT文で取得する（登録ごとに plants を読まない）
+    """
+    query = (
+        select(models.Registed.plant_id, models.Plant.name_jp, models.Registed.device_id)
+        .join(models.Plant, models.Plant.id == models.Registed.plant_id)
+        .where(models.Registed.user_id == user_id)
+        .order_by(models.Registed.id)
+        .offset(offset)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def list_registed_plants(
+    db: Session, user_id: str, limit: Optional[int] = None, offset: int = 0
+) -> list[tuple[int, str, int]]:
+    return list(db.exec(registed_plants_query(user_id, limit, offset)).all())
+
+
+async def list_registed_plants_async(
+    db: AsyncSession, user_id: str, limit: Optional[int] = None, offset: int = 0
+) -> list[tuple[int, str, int]]:
+    """list_registed_plants の非同期版"""
+    return list((await db.exec(registed_plants_query(user_id, limit, offset))).all())
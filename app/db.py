@@ -1,13 +1,136 @@
+import os
 from datetime import datetime
 
 from dotenv import load_dotenv
+from logging import getLogger
+
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.schema import CreateColumn
 from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 load_dotenv()
 
-DB_URL = "sqlite:///./app.db"
+logger = getLogger(__name__)
+
+DB_URL = os.getenv("DB_URL", "sqlite:///./app.db")
+# リクエストハンドラ用の非同期エンジン（同じデータベースファイルを aiosqlite で開く）
+ASYNC_DB_URL = os.getenv(
+    "ASYNC_DB_URL", DB_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+)
+
+# 接続ごとに設定する SQLite の PRAGMA
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+
+# コネクションプール（Webhook のワーカーと水やりチェックのスレッドで共有する）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+def _sqlite_pragma_listener(
+    journal_mode: str,
+    synchronous: str,
+    busy_timeout_ms: int,
+    cache_size_kb: int,
+    mmap_size: int,
+):
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        # 負の値は KiB 単位
+        cursor.execute(f"PRAGMA cache_size=-{int(cache_size_kb)}")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.close()
+
+    return set_sqlite_pragma
+
+
+def create_sqlite_engine(
+    url: str = DB_URL,
+    journal_mode: str = SQLITE_JOURNAL_MODE,
+    synchronous: str = SQLITE_SYNCHRONOUS,
+    busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+    cache_size_kb: int = SQLITE_CACHE_SIZE_KB,
+    mmap_size: int = SQLITE_MMAP_SIZE,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    **kwargs,
+):
+    """
+    複数スレッドから同時に使う前提で SQLite のエンジンを作成する。
+    WAL にすることで書き込み中も読み込みがブロックされず、
+    busy_timeout の間はロックの解放を待つため "database is locked" になりにくい。
+    """
+    engine = create_engine(
+        url,
+        echo=False,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": busy_timeout_ms / 1000,
+        },
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        **kwargs,
+    )
+
+    event.listen(
+        engine,
+        "connect",
+        _sqlite_pragma_listener(
+            journal_mode, synchronous, busy_timeout_ms, cache_size_kb, mmap_size
+        ),
+    )
+    return engine
+
+
+def create_async_sqlite_engine(
+    url: str = ASYNC_DB_URL,
+    journal_mode: str = SQLITE_JOURNAL_MODE,
+    synchronous: str = SQLITE_SYNCHRONOUS,
+    busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+    cache_size_kb: int = SQLITE_CACHE_SIZE_KB,
+    mmap_size: int = SQLITE_MMAP_SIZE,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    **kwargs,
+):
+    """
+    create_sqlite_engine と同じ設定の非同期エンジンを作成する。
+    クエリは aiosqlite の接続ごとのスレッドで実行されるため、イベントループを塞がない。
+    """
+    engine = create_async_engine(
+        url,
+        echo=False,
+        connect_args={"timeout": busy_timeout_ms / 1000},
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        **kwargs,
+    )
+    event.listen(
+        engine.sync_engine,
+        "connect",
+        _sqlite_pragma_listener(
+            journal_mode, synchronous, busy_timeout_ms, cache_size_kb, mmap_size
+        ),
+    )
+    return engine
+
 
-engine = create_engine(DB_URL, echo=False)
+engine = create_sqlite_engine()
+async_engine = create_async_sqlite_engine()
 
 
 class BaseModel(SQLModel):
@@ -27,7 +150,69 @@ def get_db():
         yield session
 
 
+def async_session() -> AsyncSession:
+    """
+    非同期セッションを作成する。
+    コミット後に属性を読むたびに再読み込み（暗黙の I/O）が起きないよう expire_on_commit=False にする。
+    """
+    return AsyncSession(async_engine, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with async_session() as session:
+        yield session
+
+
 def create_db_and_tables():
     from app import models  # noqa: F401
 
     SQLModel.metadata.create_all(engine)
+    migrate_columns()
+    migrate_indexes()
+
+
+def migrate_columns(bind=None) -> list[str]:
+    """
+    既存のテーブルに、後から追加した列を ALTER TABLE で追加する。
+    create_all は既存のテーブルを変更しないため。NOT NULL の列には server_default が必要。
+    追加した列を "テーブル.列" のリストで返す。
+    """
+    from app import models  # noqa: F401
+
+    bind = bind or engine
+    inspector = inspect(bind)
+    preparer = bind.dialect.identifier_preparer
+    added = []
+    with bind.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    logger.warning(
+                        f"{table.name}.{column.name} は NOT NULL で server_default がないため追加できません"
+                    )
+                    continue
+                ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"
+                )
+                added.append(f"{table.name}.{column.name}")
+    if added:
+        logger.info(f"列を追加しました: {', '.join(added)}")
+    return added
+
+
+def migrate_indexes(bind=None):
+    """
+    既存のデータベースに、後から追加したインデックスを作成する。
+    create_all はテーブルがすでにある場合インデックスを作らないため。
+    """
+    from app import models  # noqa: F401
+
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind or engine, checkfirst=True)
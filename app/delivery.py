@@ -0,0 +1,546 @@
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import Iterable, Optional, Union
+
+from linebot.v3.messaging import (
+    ApiException,
+    MessagingApi,
+    MulticastRequest,
+    PushMessageRequest,
+    TextMessage,
+)
+from sqlalchemy import event, update
+from sqlmodel import Session, func, select
+
+from app import db, models
+
+logger = getLogger(__name__)
+
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "4"))
+# LINE Messaging API のレート制限（プッシュは 2,000、マルチキャストは 200 リクエスト/秒）
+DELIVERY_RATE = float(os.getenv("DELIVERY_RATE", "2000"))
+DELIVERY_MULTICAST_RATE = float(os.getenv("DELIVERY_MULTICAST_RATE", "200"))
+DELIVERY_BURST = int(os.getenv("DELIVERY_BURST", "100"))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", "8"))
+DELIVERY_BACKOFF_SECONDS = float(os.getenv("DELIVERY_BACKOFF_SECONDS", "2"))
+DELIVERY_BACKOFF_MAX_SECONDS = float(os.getenv("DELIVERY_BACKOFF_MAX_SECONDS", "600"))
+DELIVERY_POLL_SECONDS = float(os.getenv("DELIVERY_POLL_SECONDS", "1"))
+DELIVERY_TIMEOUT_SECONDS = float(os.getenv("DELIVERY_TIMEOUT_SECONDS", "10"))
+# 新しいメッセージが追加されてから取り出すまで待つ秒数（同じ本文をまとめるため）
+DELIVERY_LINGER_SECONDS = float(os.getenv("DELIVERY_LINGER_SECONDS", "0.5"))
+# 1回に取り出す送信待ちメッセージの上限
+DELIVERY_CLAIM_LIMIT = int(os.getenv("DELIVERY_CLAIM_LIMIT", "5000"))
+# 送信中のままこの秒数を過ぎたメッセージは、結果を保存できなかったものとして送信待ちに戻す
+DELIVERY_SENDING_TIMEOUT_SECONDS = float(
+    os.getenv("DELIVERY_SENDING_TIMEOUT_SECONDS", "300")
+)
+# 送信結果の保存（database is locked など）を諦めるまでに試す回数
+DELIVERY_FINISH_ATTEMPTS = int(os.getenv("DELIVERY_FINISH_ATTEMPTS", "3"))
+# 同じ本文をこの人数以上に送る場合はマルチキャストでまとめる
+DELIVERY_MULTICAST_MIN_RECIPIENTS = int(
+    os.getenv("DELIVERY_MULTICAST_MIN_RECIPIENTS", "2")
+)
+# 1回のプッシュで送れるメッセージ数、マルチキャストの送信先数の上限（LINEの仕様）
+MAX_MESSAGES_PER_PUSH = 5
+MAX_MULTICAST_RECIPIENTS = 500
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+_WAKE_ON_COMMIT = "delivery_wake_on_commit"
+
+
+class TokenBucket:
+    """毎秒 rate 個補充され、最大 capacity 個まで貯まるトークン"""
+
+    def __init__(self, rate: float, capacity: int):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate は正の値、capacity は1以上を指定してください")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """トークンを1つ取る。取れなかった場合は次に取れるまでの秒数を返す"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """トークンが取れるまで待つ。stop_event がセットされたら False を返す"""
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return True
+            if stop_event is None:
+                time.sleep(wait)
+            elif stop_event.wait(wait):
+                return False
+
+    def drain(self):
+        """貯まったトークンを捨てる（429 が返ってきたとき用）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+
+@dataclass
+class _Batch:
+    """1回のプッシュもしくはマルチキャストで送るメッセージ"""
+
+    user_ids: list[str]
+    ids: list[int]
+    texts: list[str]
+    retry_key: str
+    attempts: int
+
+    @property
+    def multicast(self) -> bool:
+        return len(self.user_ids) > 1
+
+
+def coalesce(
+    rows: Iterable[models.OutboxMessage],
+    multicast_min_recipients: int = DELIVERY_MULTICAST_MIN_RECIPIENTS,
+) -> list[_Batch]:
+    """
+    送信待ちのメッセージを送信単位にまとめる。
+
+    - 同じ本文を multicast_min_recipients 人以上に送る場合は、最大500人ずつのマルチキャストにする
+    - 残りはユーザーごとに最大5件ずつ1回のプッシュにする
+    - 再送するメッセージは前回と同じ retry_key のまとまりのまま送る
+
+    送信単位は含まれる最も古いメッセージの順に並べる。
+    """
+    rows = list(rows)
+    position = {row.id: i for i, row in enumerate(rows)}
+    retried: dict[str, list[models.OutboxMessage]] = {}
+    fresh: list[models.OutboxMessage] = []
+    for row in rows:
+        if row.retry_key:
+            retried.setdefault(row.retry_key, []).append(row)
+        else:
+            fresh.append(row)
+    groups = list(retried.values())
+
+    recipients_by_text: dict[str, dict[str, models.OutboxMessage]] = {}
+    for row in fresh:
+        # 同じユーザーへの同じ本文の2件目以降はプッシュで送る
+        recipients_by_text.setdefault(row.text, {}).setdefault(row.user_id, row)
+    multicast_ids = set()
+    for recipients in recipients_by_text.values():
+        members = list(recipients.values())
+        for i in range(0, len(members), MAX_MULTICAST_RECIPIENTS):
+            chunk = members[i : i + MAX_MULTICAST_RECIPIENTS]
+            if len(chunk) >= max(2, multicast_min_recipients):
+                groups.append(chunk)
+                multicast_ids.update(row.id for row in chunk)
+
+    per_user: dict[str, list[models.OutboxMessage]] = {}
+    for row in fresh:
+        if row.id in multicast_ids:
+            continue
+        group = per_user.get(row.user_id)
+        if group is None or len(group) >= MAX_MESSAGES_PER_PUSH:
+            group = per_user[row.user_id] = []
+            groups.append(group)
+        group.append(row)
+
+    groups.sort(key=lambda group: position[group[0].id])
+    batches = []
+    for group in groups:
+        user_ids = list(dict.fromkeys(row.user_id for row in group))
+        batches.append(
+            _Batch(
+                user_ids=user_ids,
+                ids=[row.id for row in group],
+                texts=[group[0].text] if len(user_ids) > 1 else [row.text for row in group],
+                retry_key=group[0].retry_key or str(uuid.uuid4()),
+                attempts=max(row.attempts for row in group),
+            )
+        )
+    return batches
+
+
+class DeliveryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pushes = 0
+        self.multicasts = 0
+        self.messages = 0
+        self.retries = 0
+        self.failures = 0
+
+    def record(self, batch: _Batch, outcome: str):
+        with self._lock:
+            if batch.multicast:
+                self.multicasts += 1
+            else:
+                self.pushes += 1
+            if outcome == SENT:
+                self.messages += len(batch.ids)
+            elif outcome == PENDING:
+                self.retries += 1
+            else:
+                self.failures += len(batch.ids)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = self.pushes + self.multicasts
+            return {
+                "pushes": self.pushes,
+                "multicasts": self.multicasts,
+                "messages": self.messages,
+                "messages_per_call": self.messages / calls if calls else 0.0,
+                "retries": self.retries,
+                "failures": self.failures,
+            }
+
+
+class DeliveryService:
+    """
+    LINEへのプッシュメッセージを outbox_messages テーブル経由で送信する。
+
+    - send() はメッセージをセッションに追加するだけで、コミットは呼び出し側で行う
+      （通知履歴と同じトランザクションで保存できる）
+    - 送信スレッドが送信予定を過ぎたメッセージを取り出し、同じ本文は最大500人への
+      マルチキャストに、残りはユーザーごとに最大5件を1回のプッシュにまとめてワーカーに渡す
+    - ワーカーはトークンバケットで送信数を制限し、1つの ApiClient（コネクションプール）で送信する
+    - 429・5xx・通信エラーは指数バックオフで再送する。再送には同じ X-Line-Retry-Key を
+      使うため、LINE側で受け付け済みのリクエストが二重に届くことはない
+    - 送信結果を保存できずに送信中のまま sending_timeout_seconds を過ぎたメッセージは、
+      送信スレッドが送信待ちに戻す（同じ retry_key で送り直すので二重には届かない）
+    """
+
+    def __init__(
+        self,
+        line_bot_api: MessagingApi,
+        engine=None,
+        workers: int = DELIVERY_WORKERS,
+        rate: float = DELIVERY_RATE,
+        multicast_rate: float = DELIVERY_MULTICAST_RATE,
+        burst: int = DELIVERY_BURST,
+        max_attempts: int = DELIVERY_MAX_ATTEMPTS,
+        backoff_seconds: float = DELIVERY_BACKOFF_SECONDS,
+        backoff_max_seconds: float = DELIVERY_BACKOFF_MAX_SECONDS,
+        poll_seconds: float = DELIVERY_POLL_SECONDS,
+        timeout_seconds: float = DELIVERY_TIMEOUT_SECONDS,
+        linger_seconds: float = DELIVERY_LINGER_SECONDS,
+        claim_limit: int = DELIVERY_CLAIM_LIMIT,
+        multicast_min_recipients: int = DELIVERY_MULTICAST_MIN_RECIPIENTS,
+        sending_timeout_seconds: float = DELIVERY_SENDING_TIMEOUT_SECONDS,
+        finish_attempts: int = DELIVERY_FINISH_ATTEMPTS,
+    ):
+        if workers < 1:
+            raise ValueError("workers は1以上を指定してください")
+        self.line_bot_api = line_bot_api
+        self.engine = engine
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.multicast_bucket = TokenBucket(multicast_rate, burst)
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.poll_seconds = poll_seconds
+        self.timeout_seconds = timeout_seconds
+        self.linger_seconds = linger_seconds
+        self.claim_limit = claim_limit
+        self.multicast_min_recipients = multicast_min_recipients
+        self.sending_timeout_seconds = sending_timeout_seconds
+        self.finish_attempts = max(1, finish_attempts)
+        self.stats = DeliveryStats()
+        # ワーカーが処理中・処理待ちの送信がこの数以下になったら次を取り出す
+        self.refill_threshold = workers
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._arrived = False
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _session(self) -> Session:
+        return Session(self.engine or db.engine)
+
+    # 送信するメッセージの追加
+
+    def send(self, session: Session, user_id: str, text: str):
+        """メッセージを送信待ちに追加する。コミットされると送信スレッドを起こす"""
+        now = datetime.now()
+        # default_factory を使うと行ごとに datetime.now のシグネチャを調べるため、値を渡す
+        session.add(
+            models.OutboxMessage(
+                user_id=user_id,
+                text=text,
+                next_attempt_at=now,
+                created_at=now,
+                updated_at=now,
+            )
+        )
+        if not session.info.get(_WAKE_ON_COMMIT):
+            session.info[_WAKE_ON_COMMIT] = True
+            event.listen(session, "after_commit", self._after_commit, once=True)
+
+    def _after_commit(self, session: Session):
+        session.info.pop(_WAKE_ON_COMMIT, None)
+        self._arrived = True
+        self._wake.set()
+
+    # 送信スレッド
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="line-delivery"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="line-delivery-dispatcher", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"LINEへの送信を開始しました (workers={self.workers}, rate={self.bucket.rate:g}/s)"
+        )
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _run(self):
+        try:
+            self._recover()
+        except Exception as e:
+            logger.exception(f"送信中だったメッセージを戻せませんでした: {e}")
+        next_reclaim = time.monotonic() + self.sending_timeout_seconds
+        while not self._stop_event.is_set():
+            if time.monotonic() >= next_reclaim:
+                next_reclaim = time.monotonic() + self.sending_timeout_seconds / 4
+                try:
+                    self._recover(
+                        datetime.now() - timedelta(seconds=self.sending_timeout_seconds)
+                    )
+                except Exception as e:
+                    logger.exception(f"送信中のままのメッセージを戻せませんでした: {e}")
+            if self._arrived:
+                # 同じ判定で追加されるメッセージを待ってからまとめて取り出す
+                self._arrived = False
+                self._stop_event.wait(self.linger_seconds)
+            try:
+                batches = self._claim()
+            except Exception as e:
+                logger.exception(f"送信待ちのメッセージを取得できませんでした: {e}")
+                batches = []
+            for batch in batches:
+                self._executor.submit(self._deliver, batch)
+            if not batches:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def _recover(self, before: Optional[datetime] = None):
+        """
+        送信中のメッセージを送信待ちに戻す（retry_key はそのまま）。
+        before を省略すると前回の停止時に送信中だったものをすべて、指定するとその日時より前に
+        送信中にしたもの（送信結果を保存できなかったもの）だけを戻す。
+        """
+        statement = update(models.OutboxMessage).where(
+            models.OutboxMessage.status == SENDING
+        )
+        if before is not None:
+            statement = statement.where(models.OutboxMessage.updated_at < before)
+        with self._session() as session:
+            result = session.exec(statement.values(status=PENDING))
+            session.commit()
+        if result.rowcount:
+            logger.info(f"送信中だったメッセージを送信待ちに戻しました: {result.rowcount} 件")
+
+    def _claim(self) -> list[_Batch]:
+        """送信予定を過ぎたメッセージ（最大 claim_limit 件）を送信単位にまとめて送信中にする"""
+        with self._lock:
+            if self._in_flight > self.refill_threshold:
+                return []
+        with self._session() as session:
+            rows = session.exec(
+                select(models.OutboxMessage)
+                .where(
+                    models.OutboxMessage.status == PENDING,
+                    models.OutboxMessage.next_attempt_at <= datetime.now(),
+                )
+                .order_by(models.OutboxMessage.next_attempt_at, models.OutboxMessage.id)
+                .limit(self.claim_limit)
+            ).all()
+            if not rows:
+                return []
+            # 再送するまとまりが上限で途切れないよう、同じ retry_key の残りも取得する
+            retry_keys = {row.retry_key for row in rows if row.retry_key}
+            if retry_keys:
+                seen = {row.id for row in rows}
+                rows.extend(
+                    row
+                    for row in session.exec(
+                        select(models.OutboxMessage).where(
+                            models.OutboxMessage.status == PENDING,
+                            models.OutboxMessage.retry_key.in_(retry_keys),
+                        )
+                    )
+                    if row.id not in seen
+                )
+            batches = coalesce(rows, self.multicast_min_recipients)
+            now = datetime.now()
+            # 主キーによる一括 UPDATE（executemany）
+            session.execute(
+                update(models.OutboxMessage),
+                [
+                    {
+                        "id": id,
+                        "status": SENDING,
+                        "retry_key": batch.retry_key,
+                        "updated_at": now,
+                    }
+                    for batch in batches
+                    for id in batch.ids
+                ],
+            )
+            session.commit()
+        with self._lock:
+            self._in_flight += len(batches)
+        return batches
+
+    # ワーカー
+
+    def _deliver(self, batch: _Batch):
+        try:
+            bucket = self.multicast_bucket if batch.multicast else self.bucket
+            if not bucket.acquire(self._stop_event):
+                # 停止中。次回の起動時に送信する
+                return
+            outcome, error = self._push(batch)
+            self.stats.record(batch, outcome)
+            self._finish(batch, outcome, error)
+        except Exception as e:
+            logger.exception(f"{batch.user_ids[0]} へのメッセージの送信中にエラーが発生しました: {e}")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._wake.set()
+
+    def _push(self, batch: _Batch) -> tuple[str, Optional[str]]:
+        messages = [TextMessage(text=text) for text in batch.texts]
+        try:
+            if batch.multicast:
+                self.line_bot_api.multicast_with_http_info(
+                    MulticastRequest(to=batch.user_ids, messages=messages),
+                    x_line_retry_key=batch.retry_key,
+                    _request_timeout=self.timeout_seconds,
+                )
+            else:
+                self.line_bot_api.push_message_with_http_info(
+                    PushMessageRequest(to=batch.user_ids[0], messages=messages),
+                    x_line_retry_key=batch.retry_key,
+                    _request_timeout=self.timeout_seconds,
+                )
+            return SENT, None
+        except ApiException as e:
+            status = e.status or 0
+            if status == 409:
+                # 同じ retry_key のリクエストはLINE側で受け付け済み
+                return SENT, None
+            error = f"{status} {e.reason}"
+            if status == 429:
+                (self.multicast_bucket if batch.multicast else self.bucket).drain()
+                return PENDING, error
+            if status >= 500:
+                return PENDING, error
+            return FAILED, error
+        except Exception as e:
+            # タイムアウトや接続エラー
+            return PENDING, repr(e)
+
+    def backoff(self, attempts: int) -> float:
+        """attempts 回目の失敗後に再送するまでの秒数（上限付きの指数バックオフ＋ジッター）"""
+        delay = min(self.backoff_max_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _finish(self, batch: _Batch, outcome: str, error: Optional[str]):
+        now = datetime.now()
+        attempts = batch.attempts + 1
+        values = {"attempts": attempts, "last_error": error}
+        if outcome == SENT:
+            values.update(status=SENT, sent_at=now)
+        elif outcome == PENDING and attempts < self.max_attempts:
+            values.update(
+                status=PENDING,
+                next_attempt_at=now + timedelta(seconds=self.backoff(attempts)),
+            )
+        else:
+            values.update(status=FAILED)
+            logger.error(
+                f"{batch.user_ids[0]} など {len(batch.user_ids)} 人へのメッセージを送信できませんでした: {error}"
+            )
+        for attempt in range(self.finish_attempts):
+            try:
+                with self._session() as session:
+                    session.exec(
+                        update(models.OutboxMessage)
+                        .where(models.OutboxMessage.id.in_(batch.ids))
+                        .values(**values)
+                    )
+                    session.commit()
+                return
+            except Exception:
+                # 保存できなかった場合も送信中のままになり、送信スレッドが送信待ちに戻す
+                if attempt + 1 >= self.finish_attempts or self._stop_event.wait(
+                    0.1 * 2**attempt
+                ):
+                    raise
+
+    def pending_count(self) -> int:
+        with self._session() as session:
+            return session.exec(
+                select(func.count())
+                .select_from(models.OutboxMessage)
+                .where(models.OutboxMessage.status.in_((PENDING, SENDING)))
+            ).one()
+
+
+class DirectSender:
+    """outbox を使わずにその場でプッシュする（スクリプトやベンチマーク用）"""
+
+    def __init__(self, line_bot_api: MessagingApi):
+        self.line_bot_api = line_bot_api
+
+    def send(self, session: Session, user_id: str, text: str):
+        self.line_bot_api.push_message_with_http_info(
+            push_message_request=PushMessageRequest(
+                to=user_id,
+                messages=[TextMessage(text=text)],
+            )
+        )
+
+
+# 水やりの通知の送信先
+Sender = Union[DeliveryService, DirectSender]
@@ -0,0 +1,133 @@
+import asyncio
+import inspect
+import os
+from functools import partial
+from logging import getLogger
+from typing import Callable, Optional
+
+from linebot.v3.webhooks import MessageEvent
+
+logger = getLogger(__name__)
+
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "256"))
+WEBHOOK_ADMISSION_TIMEOUT = float(os.getenv("WEBHOOK_ADMISSION_TIMEOUT", "1.0"))
+
+
+class DispatcherBusyError(Exception):
+    """処理待ちのイベントが上限に達している"""
+
+
+def event_key(event) -> str:
+    """イベントの順序を保証する単位（送信元）"""
+    source = getattr(event, "source", None)
+    for attr in ("user_id", "group_id", "room_id"):
+        value = getattr(source, attr, None)
+        if value:
+            return value
+    return ""
+
+
+class EventDispatcher:
+    """
+    Webhookイベントをイベントループ上のタスクで処理するディスパッチャ。
+
+    - ハンドラは add() で登録したコルーチン関数（ブロッキングする処理はハンドラの中で
+      asyncio.to_thread やスレッドプールに渡す）
+    - 同じキー（ユーザー）のイベントは受信順に1つずつ処理する
+    - 処理待ちの件数が max_pending に達すると submit() が DispatcherBusyError を送出する
+    """
+
+    def __init__(
+        self,
+        max_pending: int = WEBHOOK_MAX_PENDING,
+        admission_timeout: float = WEBHOOK_ADMISSION_TIMEOUT,
+    ):
+        self.max_pending = max_pending
+        self.admission_timeout = admission_timeout
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tails: dict[str, asyncio.Task] = {}
+        # (イベントの型, メッセージの型 | None) -> ハンドラ
+        self._handlers: dict[tuple[type, Optional[type]], Callable] = {}
+        self.pending = 0
+
+    def add(self, event: type, message: Optional[type] = None):
+        """
+        イベントのハンドラを登録するデコレータ（WebhookHandler.add と同じ指定方法）。
+        message を指定すると MessageEvent のうちそのメッセージの型のものだけを処理する。
+        """
+
+        def decorator(func: Callable) -> Callable:
+            if not inspect.iscoroutinefunction(func):
+                raise TypeError(f"ハンドラはコルーチン関数にしてください: {func.__name__}")
+            self._handlers[(event, message)] = func
+            return func
+
+        return decorator
+
+    def resolve(self, event) -> Optional[Callable]:
+        """イベントのハンドラを返す。メッセージの型を指定したハンドラを優先する"""
+        func = None
+        if isinstance(event, MessageEvent):
+            func = self._handlers.get((type(event), type(event.message)))
+        if func is None:
+            func = self._handlers.get((type(event), None))
+        return func
+
+    def start(self):
+        self._slots = asyncio.Semaphore(self.max_pending)
+
+    async def shutdown(self):
+        """受け付け済みのイベントを処理し終えるまで待つ"""
+        if self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+    async def submit(self, key: str, func: Callable, *args):
+        """イベントを受け付ける。処理の完了は待たない。"""
+        (task,) = await self.submit_all([(key, func, args)])
+        return task
+
+    async def submit_all(self, events: list[tuple[str, Callable, tuple]]):
+        """
+        (key, func, args) のイベントをまとめて受け付ける。
+        全件分の空きを確保できない場合は1件も受け付けずに DispatcherBusyError を送出する
+        （一部だけ処理した Webhook が再送されて、同じイベントを2回処理しないように）。
+        """
+        if self._slots is None:
+            raise RuntimeError("ディスパッチャが開始されていません")
+        acquired = 0
+        try:
+            async with asyncio.timeout(self.admission_timeout):
+                for _ in events:
+                    await self._slots.acquire()
+                    acquired += 1
+        except TimeoutError:
+            for _ in range(acquired):
+                self._slots.release()
+            raise DispatcherBusyError(
+                f"処理待ちのイベントが上限 ({self.max_pending}) に達しています"
+            )
+
+        tasks = []
+        for key, func, args in events:
+            self.pending += 1
+            previous = self._tails.get(key)
+            task = asyncio.create_task(self._run(previous, func, args))
+            self._tails[key] = task
+            task.add_done_callback(partial(self._on_done, key))
+            tasks.append(task)
+        return tasks
+
+    async def _run(self, previous: Optional[asyncio.Task], func, args):
+        if previous is not None:
+            # 同じユーザーの前のイベントが終わるまで待つ（失敗しても続行）
+            await asyncio.wait([previous])
+        try:
+            await func(*args)
+        except Exception as e:
+            logger.exception(f"イベント処理中にエラーが発生しました: {e}")
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        self.pending -= 1
+        self._slots.release()
+        if self._tails.get(key) is task:
+            del self._tails[key]
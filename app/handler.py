@@ -1,146 +1,294 @@
 import logging
-import re
 import threading
 import time
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Callable, Optional, Union
 
-import spidev
-from linebot.v3.messaging import MessagingApi, PushMessageRequest, TextMessage
-from sqlmodel import Session, desc, select
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, desc, func, select
 
-from app import db, models
+from app import db, models, notifications, rules, sensor, timeseries
+from app.delivery import Sender
+from app.rules import WateringRule, as_rule
 
 logger = logging.getLogger(__name__)
 
 
-def handler(line_bot_api: MessagingApi, stop_event: threading.Event):
+@dataclass(frozen=True)
+class RegistrationRow:
+    """水やりチェックに必要な登録情報（植物名を含む）"""
+
+    user_id: str
+    plant_id: int
+    device_id: int
+    plant_name_jp: str
+
+
+@dataclass(frozen=True, slots=True)
+class PlannedNotification:
+    """判定の結果記録する通知。判定を別のプロセスで行えるよう、モデルではなく値で持つ"""
+
+    user_id: str
+    plant_id: int
+    notification_type: str
+    message: str
+    sent_at: datetime
+    humidity: Optional[float]
+
+    def to_model(self) -> models.NotificationHistory:
+        return models.NotificationHistory(
+            user_id=self.user_id,
+            plant_id=self.plant_id,
+            notification_type=self.notification_type,
+            message=self.message,
+            sent_at=self.sent_at,
+            humidity=self.humidity,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class NotificationSnapshot:
+    """判定に使う最新の通知の列（別のプロセスに渡す用）"""
+
+    notification_type: str
+    sent_at: datetime
+    humidity: Optional[float]
+
+    @classmethod
+    def of(cls, notification) -> Optional["NotificationSnapshot"]:
+        if notification is None:
+            return None
+        return cls(notification.notification_type, notification.sent_at, notification.humidity)
+
+
+def handler(
+    sender: Sender,
+    stop_event: threading.Event,
+    watering_scheduler=None,
+):
     logger.info("水やりチェックシステムを開始します...")
 
-    # 1秒もしくは30分ごとに湿度を取る。
-    # 登録テーブルからすべてのデータを取る。
+    # 毎分すべての登録を判定する代わりに、判定が必要な登録だけを判定する。
+    # 判定の時刻とセンサー値のしきい値は WateringScheduler が管理する。
+    if watering_scheduler is None:
+        from app.scheduler import WateringScheduler
+
+        watering_scheduler = WateringScheduler()
 
     try:
         while not stop_event.is_set():
-            with Session(db.engine) as session:
-                logger.info("水やりチェックを開始します...")
-                current_time = datetime.now()
-                users_list = get_users(session)
-                current_month = current_time.month
-                current_hour = current_time.hour
-                # if current_hour < 8 or current_hour > 21:
-                if False:
-                    logger.info(
-                        "現在の時間は水やりチェックの時間外です。スキップします。"
-                    )
-                    time.sleep(600)
-
-                for user in users_list:
-                    session.refresh(user)
-                    # ユーザーの登録済み植物を取得
-                    logger.info(f"ユーザー {user.id} の水やりチェックを開始します...")
-                    logger.info(f"登録済み植物: {user.registed_plants}")
-                    for registed in user.registed_plants:
-                        latest_notification = get_latest_notification(
-                            session, user.id, registed.plant_id
-                        )
-                        plant_watering_data = get_watering_data(
-                            session, current_month, registed.plant_id
-                        )
-                        humidity = get_humidity(registed.device_id)  # 湿度データを取得
-                        # 水やり効果の判定（前回通知から湿度変化をチェック）
-                        effectiveness = check_watering_effectiveness(
-                            session,
-                            user.id,
-                            registed.plant_id,
-                            humidity,
-                            plant_watering_data,
-                        )
-                        if effectiveness:
-                            logger.info(f"水やり効果判定: {effectiveness['status']}")
-                            # 効果判定結果を記録
-                            effectiveness_notification = models.NotificationHistory(
-                                user_id=user.id,
-                                plant_id=registed.plant_id,
-                                notification_type="watering_feedback",
-                                message=f"{registed.plant.name_jp}: {effectiveness['message']}",
-                                humidity=humidity,
-                            )
-                            line_bot_api.push_message_with_http_info(
-                                push_message_request=PushMessageRequest(
-                                    to=user.id,
-                                    messages=[
-                                        TextMessage(
-                                            text=effectiveness_notification.message
-                                        ),
-                                    ],
-                                )
-                            )
-                            session.add(effectiveness_notification)
-                            session.commit()
-
-                        if (
-                            latest_notification
-                            and latest_notification.sent_at
-                            > current_time.replace(hour=0, minute=0, second=0)
-                        ):
-                            logger.info(
-                                f"{user.id} の植物 {registed.plant_id} は最近通知済みのためスキップ"
-                            )
-                            continue
-
-                        logger.debug(
-                            f"🔍 デバッグ: 検索対象のregisted.plant_id: {registed.plant_id}"
-                        )
-
-                        # 最新の水やり履歴を取得（通知履歴を使用）
-                        latest_watering = get_latest_notification(
-                            session, user.id, registed.plant_id
+            try:
+                # まとめて取得したデータが通知ごとのコミットで再読み込みされないようにする
+                with Session(db.engine, expire_on_commit=False) as session:
+                    current_time = datetime.now()
+                    current_hour = current_time.hour
+                    # if current_hour < 8 or current_hour > 21:
+                    if False:
+                        logger.info(
+                            "現在の時間は水やりチェックの時間外です。スキップします。"
                         )
+                        time.sleep(600)
 
-                        if check_watering_schedule(
-                            plant_watering_data,
-                            current_time,
-                            humidity,
-                            last_watering_date=(
-                                latest_watering.sent_at if latest_watering else None
-                            ),
-                        ):
-                            notification = record_notification_history(
-                                session,
-                                user.id,
-                                registed.plant,
-                                plant_watering_data,
-                                humidity,
-                            )
-                            # line bot api 挿入用の場所
-                            line_bot_api.push_message_with_http_info(
-                                push_message_request=PushMessageRequest(
-                                    to=user.id,
-                                    messages=[
-                                        TextMessage(text=notification.message),
-                                    ],
-                                )
-                            )
-
-                # 1分間待機
-                logger.info("60秒間待機します...")
-                for _ in range(60):
-                    if stop_event.is_set():
-                        logger.info("水やりチェックシステムを停止します。")
-                        return
-                    time.sleep(1)
+                    evaluated = watering_scheduler.run_due(
+                        session, sender, current_time
+                    )
+                    if evaluated:
+                        logger.info(f"水やりチェックを行いました: {evaluated} 件")
+            except Exception as e:
+                # 1回の判定の失敗で水やりチェックのスレッドを止めない
+                logger.exception(f"水やりチェック中にエラーが発生しました: {e}")
+
+            # 時系列ストアの書き込みと保持期間を過ぎたデータの削除
+            try:
+                timeseries.store.maintain()
+            except Exception as e:
+                logger.error(f"センサー値の保守中にエラーが発生しました: {e}")
+
+            # 次の判定時刻・センサー値のしきい値越え・登録の変更まで待機
+            watering_scheduler.wait(stop_event)
+        logger.info("水やりチェックシステムを停止します。")
     except Exception as e:
         logger.info(f"エラーが発生しました: {e}")
         import traceback
 
         traceback.print_exc()
+    finally:
+        # 書き込み前の通知履歴を残さない
+        try:
+            notifications.buffer.flush()
+        except Exception as e:
+            logger.error(f"通知履歴を書き込めませんでした: {e}")
+
+
+def run_watering_check(
+    session: Session,
+    sender: Sender,
+    current_time: datetime,
+    read_humidity: Callable[[int], int] = None,
+):
+    """
+    全登録の水やりチェックを1回行う。
+    必要なデータはまとめて数回のクエリで取得し、判定はメモリ上で行う。
+    通知履歴は最後にまとめて書き込む。
+    session は expire_on_commit=False で作成しておくこと。
+    """
+    from app.partition import EvaluationTask, evaluator
+
+    read_humidity = read_humidity or get_humidity
+    registrations = get_registrations(session)
+    waterings = get_watering_data_by_plant(session, current_time.month)
+    latest_notifications = get_latest_notifications(session)
+
+    tasks = []
+    for registed in registrations:
+        plant_watering_data = waterings.get(registed.plant_id)
+        if plant_watering_data is None:
+            logger.warning(
+                f"植物 {registed.plant_id} の {current_time.month} 月の水やりデータがありません"
+            )
+            continue
+        humidity = read_humidity(registed.device_id)  # 湿度データを取得
+        latest = latest_notifications.get((registed.user_id, registed.plant_id))
+        tasks.append(
+            EvaluationTask(
+                registed, plant_watering_data, NotificationSnapshot.of(latest), humidity
+            )
+        )
+    # 判定はプロセスに分けて行い、通知の記録と送信はこのプロセスでまとめて行う
+    for planned in evaluator.evaluate(tasks, current_time):
+        apply_plan(session, sender, planned)
+    notifications.buffer.flush(session)
+
+
+def plan_registration(
+    registed: RegistrationRow,
+    plant_watering_data: WateringRule,
+    latest_notification: Optional[Union[models.NotificationHistory, NotificationSnapshot]],
+    humidity: float,
+    current_time: datetime,
+) -> tuple[PlannedNotification, ...]:
+    """
+    1件の登録について水やり効果とスケジュールを判定し、記録する通知を返す。
+    データベースにも通知のバッファにもアクセスしないため、別のプロセスで実行できる。
+    """
+    planned = []
+    today = current_time.replace(hour=0, minute=0, second=0)
+    # 水やり効果の判定（前回通知から湿度変化をチェック）
+    effectiveness = check_watering_effectiveness(
+        latest_notification,
+        humidity,
+        plant_watering_data,
+    )
+    # 水やりスケジュールの判定には効果判定の記録後の最新の通知を使う
+    latest_watering = latest_notification
+    if effectiveness:
+        logger.info(f"水やり効果判定: {effectiveness['status']}")
+        # 効果判定結果を記録
+        latest_watering = PlannedNotification(
+            user_id=registed.user_id,
+            plant_id=registed.plant_id,
+            notification_type="watering_feedback",
+            message=f"{registed.plant_name_jp}: {effectiveness['message']}",
+            sent_at=current_time,
+            humidity=humidity,
+        )
+        planned.append(latest_watering)
+
+    if latest_notification and latest_notification.sent_at > today:
+        logger.info(
+            f"{registed.user_id} の植物 {registed.plant_id} は最近通知済みのためスキップ"
+        )
+        return tuple(planned)
+
+    if check_watering_schedule(
+        plant_watering_data,
+        current_time,
+        humidity,
+        last_watering_date=(latest_watering.sent_at if latest_watering else None),
+    ):
+        planned.append(
+            PlannedNotification(
+                user_id=registed.user_id,
+                plant_id=registed.plant_id,
+                notification_type="watering",
+                message=watering_message(registed.plant_name_jp, plant_watering_data),
+                sent_at=current_time,
+                humidity=humidity,
+            )
+        )
+    return tuple(planned)
+
+
+def apply_plan(
+    session: Session,
+    sender: Sender,
+    planned: tuple[PlannedNotification, ...],
+    latest_notification: Optional[models.NotificationHistory] = None,
+) -> Optional[models.NotificationHistory]:
+    """plan_registration の通知を notifications.buffer に追加し、最新の通知を返す"""
+    latest = latest_notification
+    for notification in planned:
+        try:
+            model = notification.to_model()
+            notifications.buffer.add(model, sender, session)
+        except Exception as e:
+            logger.error(f"⚠️ 通知履歴の記録に失敗しました: {e}")
+            # 通知履歴の記録に失敗してもメイン処理は継続
+            continue
+        latest = model
+        if notification.notification_type == "watering":
+            logger.info(
+                f"✅ 通知履歴を記録しました: {notification.user_id} -> 植物 {notification.plant_id}"
+            )
+    return latest
+
+
+def get_registrations(session: Session) -> list[RegistrationRow]:
+    """全ユーザーの登録済み植物を植物名と一緒に取得"""
+    rows = session.exec(
+        select(
+            models.Registed.user_id,
+            models.Registed.plant_id,
+            models.Registed.device_id,
+            models.Plant.name_jp,
+        )
+        .join(models.Plant, models.Plant.id == models.Registed.plant_id)
+        .order_by(models.Registed.user_id, models.Registed.id)
+    ).all()
+    return [RegistrationRow(*row) for row in rows]
+
 
+def get_watering_data_by_plant(session: Session, month: int) -> dict[int, WateringRule]:
+    """指定した月の水やりの規則を植物IDごとに取得（メモリ上の規則の表を使う）"""
+    return rules.registry.get(session).for_month(month)
 
-def get_users(session: Session):
-    """全ユーザーを取得"""
-    users = session.exec(select(models.User)).all()
 
-    return users
+def get_latest_notifications(
+    session: Session,
+) -> dict[tuple[str, int], models.NotificationHistory]:
+    """(ユーザー, 植物) ごとの最新の通知履歴をまとめて取得"""
+    ranked = select(
+        models.NotificationHistory,
+        func.row_number()
+        .over(
+            partition_by=(
+                models.NotificationHistory.user_id,
+                models.NotificationHistory.plant_id,
+            ),
+            order_by=desc(models.NotificationHistory.sent_at),
+        )
+        .label("rank"),
+    ).subquery()
+    latest = aliased(models.NotificationHistory, ranked)
+    rows = session.exec(select(latest).where(ranked.c.rank == 1)).all()
+    result = {(n.user_id, n.plant_id): n for n in rows}
+    # まだ書き込んでいない通知を重ねる
+    for key, notification in notifications.buffer.overlay().items():
+        stored = result.get(key)
+        if stored is None or notification.sent_at >= stored.sent_at:
+            result[key] = notification
+    return result
 
 
 def get_watering_data(session: Session, month: int, plant_id: int):
@@ -156,7 +304,7 @@ def get_watering_data(session: Session, month: int, plant_id: int):
 
 
 def get_latest_notification(session: Session, user_id: str, plant_id: int):
-    """特定のユーザーと植物の最新の通知履歴を取得"""
+    """特定のユーザーと植物の最新の通知履歴を取得（書き込み前の通知を含む）"""
     notification = session.exec(
         select(models.NotificationHistory)
         .where(
@@ -165,44 +313,26 @@ def get_latest_notification(session: Session, user_id: str, plant_id: int):
         )
         .order_by(desc(models.NotificationHistory.sent_at))
     ).first()
+    buffered = notifications.buffer.latest(user_id, plant_id)
+    if buffered is not None and (
+        notification is None or buffered.sent_at >= notification.sent_at
+    ):
+        return buffered
 
     return notification
 
 
 def get_humidity(channel: int):
-    spi = spidev.SpiDev()
-    spi.open(0, 0)
-    spi.max_speed_hz = 1350000  # 1.35MHz
-    if not 0 <= channel <= 7:
-        raise ValueError("チャンネルは0〜7を指定してください")
-
-    # SPI通信で送る3バイト（MCP3008は10bit ADC）
-    cmd = [1, (8 + channel) << 4, 0]
-    response = spi.xfer2(cmd)
-
-    # 応答（10bit）を結合してアナログ値に変換
-    value = ((response[1] & 3) << 8) + response[2]
-    return value
+    """センサーのサンプラーが貯めた直近の平均値を返す"""
+    return sensor.sampler.read(channel)
 
 
 def check_watering_effectiveness(
-    session: Session,
-    user_id: str,
-    plant_id: int,
+    latest_notification: Optional[models.NotificationHistory],
     current_humidity: int,
-    watering_data: models.Watering,
+    watering_data: WateringRule,
 ):
     """前回通知時の湿度と現在の湿度を比較して水やり効果を判定"""
-    # 最新の水やり通知履歴を取得
-    latest_notification = session.exec(
-        select(models.NotificationHistory)
-        .where(
-            models.NotificationHistory.user_id == user_id,
-            models.NotificationHistory.plant_id == plant_id,
-        )
-        .order_by(desc(models.NotificationHistory.sent_at))
-    ).first()
-
     if not latest_notification:
         return None  # 判定できない
 
@@ -252,49 +382,43 @@ def check_watering_effectiveness(
 
 
 def check_watering_schedule(
-    watering_data: models.Watering,
+    watering_data: Union[WateringRule, models.Watering],
     current_time: datetime,
     humidity: float = None,
     last_watering_date: datetime = None,
 ):
     """水やりが必要かどうかを判定"""
-    logger.info(watering_data)
-    frequency = watering_data.frequency.lower()
-    logger.info(f"Frequency: {frequency}")
+    rule = as_rule(watering_data)
+    logger.info(rule)
 
-    has_number = re.search(r"\d+", frequency)
-
-    if has_number:
+    if rule.interval_days is not None:
         # 数字がある場合：前回水をあげた日付との比較
         if last_watering_date is None:
             logger.warning("    ⚠️ 前回の水やり日付が不明です")
             return True  # 初回は水やりを推奨
 
-        # 数字を抽出
-        days_match = re.search(r"(\d+)", frequency)
-        if days_match:
-            target_days = int(days_match.group(1))
+        target_days = rule.interval_days
+
+        # 前回の水やりからの経過日数を計算
+        days_since_last_watering = (
+            current_time.date() - last_watering_date.date()
+        ).days
 
-            # 前回の水やりからの経過日数を計算
-            days_since_last_watering = (
-                current_time.date() - last_watering_date.date()
-            ).days
+        logger.info(
+            f"    📅 前回の水やりから{days_since_last_watering}日経過（目安: {target_days}日に1回）"
+        )
 
+        if days_since_last_watering >= target_days:
+            return True
+        else:
             logger.info(
-                f"    📅 前回の水やりから{days_since_last_watering}日経過（目安: {target_days}日に1回）"
+                f"    ⏳ あと{target_days - days_since_last_watering}日後に水やり予定"
             )
-
-            if days_since_last_watering >= target_days:
-                return True
-            else:
-                logger.info(
-                    f"    ⏳ あと{target_days - days_since_last_watering}日後に水やり予定"
-                )
-                return False
+            return False
 
     else:
         # 数字がない場合：湿度比較
-        humidity_when_dry = watering_data.humidity_when_dry
+        humidity_when_dry = rule.humidity_when_dry
         if humidity is None:
             logger.warning("⚠️ 湿度データが取得できません")
             return False
@@ -308,38 +432,9 @@ def check_watering_schedule(
             logger.info("    🚫 まだ湿っています")
             return False
 
-    return False
-
 
-def record_notification_history(
-    session: Session,
-    user_id: str,
-    plant: models.Plant,
-    watering_data: models.Watering,
-    humidity: float = None,
-):
-    """通知履歴を記録する"""
-    try:
-        current_time = datetime.now()
-
-        # 新しい通知履歴を作成
-        new_notification = models.NotificationHistory(
-            user_id=user_id,
-            plant_id=plant.id,
-            notification_type="watering",
-            message=f"{plant.name_jp}の水やりが必要です。\n水やり頻度: {watering_data.frequency}\n水やり量: {watering_data.amount}",
-            sent_at=current_time,
-            humidity=humidity,
-        )
-        session.add(new_notification)
-        session.commit()
-
-        logger.info(f"✅ 通知履歴を記録しました: {user_id} -> {plant.name_jp}")
-        return new_notification
-    except Exception as notification_error:
-        logger.error(f"⚠️ 通知履歴の記録に失敗しました: {notification_error}")
-        # 通知履歴の記録に失敗してもメイン処理は継続
-        return False
+def watering_message(plant_name_jp: str, watering_data: WateringRule) -> str:
+    return f"{plant_name_jp}の水やりが必要です。\n水やり頻度: {watering_data.frequency}\n水やり量: {watering_data.amount}"
 
 
 if __name__ == "__main__":
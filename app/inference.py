@@ -0,0 +1,214 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import partial
+from logging import getLogger
+from typing import Callable, Optional
+
+from app.prediction_cache import PredictionCache
+
+logger = getLogger(__name__)
+
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "20"))
+MAX_QUEUE_SIZE = int(os.getenv("INFERENCE_MAX_QUEUE_SIZE", "256"))
+
+PredictBatchFn = Callable[[list[bytes]], list]
+
+
+@dataclass
+class _Request:
+    image_binary: bytes
+    future: Future
+    cache_keys: list[str] = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class InferenceStats:
+    """バッチサイズとキュー待ち時間の統計"""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Counter = Counter()
+        self._queue_waits = deque(maxlen=window)
+        self._batch_latencies = deque(maxlen=window)
+
+    def record(self, batch_size: int, queue_waits: list[float], latency: float):
+        with self._lock:
+            self.batches += 1
+            self.items += batch_size
+            self.batch_sizes[batch_size] += 1
+            self._queue_waits.extend(queue_waits)
+            self._batch_latencies.append(latency)
+
+    @staticmethod
+    def _percentile(values: list[float], q: float) -> float:
+        if not values:
+            return 0.0
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = list(self._queue_waits)
+            latencies = list(self._batch_latencies)
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+                "queue_wait_ms": {
+                    "p50": self._percentile(waits, 0.50) * 1000,
+                    "p95": self._percentile(waits, 0.95) * 1000,
+                    "p99": self._percentile(waits, 0.99) * 1000,
+                    "max": max(waits, default=0.0) * 1000,
+                },
+                "batch_latency_ms": {
+                    "p50": self._percentile(latencies, 0.50) * 1000,
+                    "p99": self._percentile(latencies, 0.99) * 1000,
+                },
+            }
+
+
+class BatchInferenceEngine:
+    """
+    画像をキューに集め、時間窓と最大バッチサイズでまとめて推論するエンジン。
+    submit() は Future を返し、推論結果はバッチ実行後に各呼び出し元へ返される。
+    """
+
+    def __init__(
+        self,
+        predict_batch: PredictBatchFn,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        max_queue_size: int = MAX_QUEUE_SIZE,
+        cache: Optional[PredictionCache] = None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size は1以上を指定してください")
+        self.predict_batch = predict_batch
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = InferenceStats()
+        self._queue: queue.Queue[_Request] = queue.Queue(maxsize=max_queue_size)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="batch-inference", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"推論エンジンを開始しました (max_batch_size={self.max_batch_size}, max_wait={self.max_wait * 1000:.0f}ms)"
+        )
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # 停止後に残ったリクエストは失敗として返す
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(RuntimeError("推論エンジンは停止しています"))
+
+    def submit(self, image_binary: bytes, timeout: Optional[float] = None) -> Future:
+        """
+        画像を推論キューに追加する。キューが満杯の場合は queue.Full を送出する
+        （timeout を指定した場合はその秒数だけ空きを待つ）。
+        キャッシュに結果がある場合は推論せずに完了済みの Future を返す。
+        """
+        if self._thread is None:
+            raise RuntimeError("推論エンジンが開始されていません")
+        future: Future = Future()
+        cache_keys = []
+        if self.cache is not None:
+            cache_keys = self.cache.keys(image_binary)
+            cached = self.cache.get(cache_keys)
+            if cached is not None:
+                future.set_result(cached)
+                return future
+        request = _Request(image_binary, future, cache_keys)
+        if timeout is None:
+            # 空きを待たない（待つと predict_async の実行スレッドを塞ぎ続ける）
+            self._queue.put_nowait(request)
+        else:
+            self._queue.put(request, timeout=timeout)
+        return future
+
+    def predict(self, image_binary: bytes, timeout: Optional[float] = None):
+        """submit() して結果を待つ同期版"""
+        return self.submit(image_binary, timeout=timeout).result(timeout)
+
+    async def predict_async(self, image_binary: bytes, timeout: Optional[float] = None):
+        """
+        submit() して結果を待つ非同期版。
+        キャッシュキーの計算とキューへの追加はイベントループを塞がないよう別スレッドで行う。
+        """
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(
+            None, partial(self.submit, image_binary, timeout=timeout)
+        )
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    def _collect_batch(self) -> list[_Request]:
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        # 最初のリクエストがキューに入った時刻から max_wait 以内に来たものをまとめる
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started_at = time.perf_counter()
+            try:
+                results = self.predict_batch([r.image_binary for r in batch])
+            except Exception as e:
+                logger.exception(f"バッチ推論中にエラーが発生しました: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            finished_at = time.perf_counter()
+            self.stats.record(
+                len(batch),
+                [started_at - r.enqueued_at for r in batch],
+                finished_at - started_at,
+            )
+            for request, result in zip(batch, results):
+                if self.cache is not None and result is not None:
+                    self.cache.put(request.cache_keys, result)
+                request.future.set_result(result)
@@ -0,0 +1,348 @@
+"""
+推論を FastAPI とは別のプロセスで行うための、推論デーモンとクライアント。
+
+デーモンは torch とモデルを持ち、Unix ドメインソケットで複数のクライアント（uvicorn の
+ワーカー）からの要求を受け付ける。各クライアントの画像は BatchInferenceEngine で
+まとめて推論する。画像のバイト列は pickle せず、クライアントが作った共有メモリに書き込み、
+ソケットではその位置（オフセットと長さ）だけを送る。
+
+    uv run python -m app.inference_service
+    INFERENCE_MODE=remote uv run uvicorn app.main:app --workers 4
+
+メッセージは 4 バイトのビッグエンディアンの長さ + JSON。
+- 推論: {"op": "predict", "shm": 共有メモリ名, "images": [[offset, length], ...]}
+        -> {"predictions": [[class_id, confidence, [[class_id, confidence], ...]] | null, ...]}
+- 状態: {"op": "status"} -> {"model_loaded": bool, "model": 識別子 | null, "error": str | null}
+失敗した場合は {"error": メッセージ} を返す。
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+from logging import getLogger
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Optional
+
+from app.ai import Prediction
+
+logger = getLogger(__name__)
+
+# local: 各ワーカーのプロセスで推論する, remote: 推論デーモンに推論させる
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "local")
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "/tmp/spga-inference.sock")
+# クライアントごとの共有メモリの初期サイズ。足りない場合は作り直す
+INFERENCE_SHM_SIZE = int(os.getenv("INFERENCE_SHM_SIZE", str(8 * 1024 * 1024)))
+INFERENCE_CLIENT_TIMEOUT = float(os.getenv("INFERENCE_CLIENT_TIMEOUT", "30"))
+
+_LENGTH = struct.Struct(">I")
+
+
+class InferenceServiceError(Exception):
+    """推論デーモンがエラーを返した、もしくは接続できなかった"""
+
+
+def _encode(message: dict) -> bytes:
+    body = json.dumps(message, ensure_ascii=False).encode()
+    return _LENGTH.pack(len(body)) + body
+
+
+def _to_json(prediction: Optional[Prediction]):
+    if prediction is None:
+        return None
+    return [prediction.class_id, prediction.confidence, [list(k) for k in prediction.top_k]]
+
+
+def _from_json(value) -> Optional[Prediction]:
+    if value is None:
+        return None
+    class_id, confidence, top_k = value
+    return Prediction(class_id, confidence, tuple((c, p) for c, p in top_k))
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+    # 共有メモリはクライアントのものなので、デーモンの終了時に削除させない
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class InferenceServer:
+    """
+    Unix ドメインソケットで推論要求を受け付ける。
+    接続ごとに要求を順に処理し、推論は全接続で共有する engine に渡してまとめて行う。
+    """
+
+    def __init__(self, engine, path: str = INFERENCE_SOCKET, registry=None):
+        self.engine = engine
+        self.path = path
+        self.registry = registry
+        self.connections = 0
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info(f"推論デーモンを開始しました ({self.path})")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        attached: dict[str, shared_memory.SharedMemory] = {}
+        try:
+            while True:
+                try:
+                    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                    message = json.loads(await reader.readexactly(length))
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    response = await self._dispatch(message, attached)
+                except Exception as e:
+                    logger.exception(f"推論の要求の処理中にエラーが発生しました: {e}")
+                    response = {"error": str(e)}
+                writer.write(_encode(response))
+                await writer.drain()
+        finally:
+            self.connections -= 1
+            for shm in attached.values():
+                shm.close()
+            writer.close()
+
+    async def _dispatch(self, message: dict, attached: dict) -> dict:
+        op = message.get("op")
+        if op == "status":
+            registry = self.registry
+            return {
+                "model_loaded": registry is None or registry.ready,
+                "model": registry.identity if registry is not None else None,
+                "error": str(registry.error) if registry and registry.error else None,
+            }
+        if op != "predict":
+            raise ValueError(f"不明な要求です: {op}")
+
+        name = message["shm"]
+        shm = attached.get(name)
+        if shm is None:
+            # クライアントが共有メモリを作り直した場合は古いものを閉じる
+            for old in attached.values():
+                old.close()
+            attached.clear()
+            shm = attached[name] = _attach(name)
+        self.requests += 1
+        views = [shm.buf[offset : offset + length] for offset, length in message["images"]]
+        try:
+            # 失敗したものがあっても、ビューを解放する前にすべての推論が終わるのを待つ
+            results = await asyncio.gather(
+                *(self.engine.predict_async(view) for view in views),
+                return_exceptions=True,
+            )
+        finally:
+            # 共有メモリを閉じられるよう、切り出したビューを解放する
+            for view in views:
+                view.release()
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return {"predictions": [_to_json(result) for result in results]}
+
+
+class _Connection:
+    """推論デーモンへの1本の接続。lock を持っている間に要求を1つずつ送る"""
+
+    def __init__(self, path: str, timeout: float, on_disconnect: Callable[[], None]):
+        self.path = path
+        self.timeout = timeout
+        self.on_disconnect = on_disconnect
+        self.lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                raise InferenceServiceError(
+                    f"推論デーモン ({self.path}) に接続できません: {e}"
+                ) from e
+            self._sock = sock
+        return self._sock
+
+    def _recv_exactly(self, sock: socket.socket, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = sock.recv(size)
+            if not chunk:
+                raise ConnectionError("推論デーモンとの接続が切れました")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def request(self, message: dict) -> dict:
+        """
+        要求を送って応答を返す。lock を持った状態で呼ぶ。
+        デーモンの再起動などで使い回した接続が切れていた場合（応答を1バイトも受け取る前の
+        ConnectionError）だけ1回接続し直す。タイムアウトした要求はデーモンが処理中の
+        可能性があるため、送り直さずに InferenceServiceError を送出する。
+        """
+        for attempt in range(2):
+            sock = self._connect()
+            received = False
+            try:
+                sock.sendall(_encode(message))
+                first = sock.recv(_LENGTH.size)
+                if not first:
+                    raise ConnectionError("推論デーモンとの接続が切れました")
+                received = True
+                header = first + self._recv_exactly(sock, _LENGTH.size - len(first))
+                (length,) = _LENGTH.unpack(header)
+                response = json.loads(self._recv_exactly(sock, length))
+                break
+            except ConnectionError as e:
+                self.close()
+                if attempt or received:
+                    raise InferenceServiceError(f"推論デーモンとの通信に失敗しました: {e}") from e
+            except TimeoutError as e:
+                self.close()
+                raise InferenceServiceError(
+                    f"推論デーモンが {self.timeout} 秒以内に応答しませんでした"
+                ) from e
+            except OSError as e:
+                self.close()
+                raise InferenceServiceError(f"推論デーモンとの通信に失敗しました: {e}") from e
+        if "error" in response and len(response) == 1:
+            raise InferenceServiceError(response["error"])
+        return response
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            self.on_disconnect()
+
+
+class InferenceClient:
+    """
+    推論デーモンのクライアント。predict_batch() は app.ai.predict_batch と同じ形で使える。
+    推論用の接続では要求を1つずつ送る（BatchInferenceEngine のスレッドから呼ぶ想定）。
+    status() と model_identity() は別の接続を使うため、推論中のバッチを待たない。
+    """
+
+    def __init__(
+        self,
+        path: str = INFERENCE_SOCKET,
+        shm_size: int = INFERENCE_SHM_SIZE,
+        timeout: float = INFERENCE_CLIENT_TIMEOUT,
+    ):
+        self.path = path
+        self.shm_size = shm_size
+        self.timeout = timeout
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._identity: Optional[str] = None
+        self._data = _Connection(path, timeout, self._forget_identity)
+        self._control = _Connection(path, timeout, self._forget_identity)
+
+    def _forget_identity(self):
+        # 接続が切れた場合はデーモンが再起動してモデルが変わった可能性がある
+        self._identity = None
+
+    def _buffer(self, size: int) -> shared_memory.SharedMemory:
+        if self._shm is None or self._shm.size < size:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+            capacity = self.shm_size
+            while capacity < size:
+                capacity *= 2
+            self._shm = shared_memory.SharedMemory(create=True, size=capacity)
+        return self._shm
+
+    def predict_batch(self, image_binaries: list[bytes]) -> list[Optional[Prediction]]:
+        with self._data.lock:
+            shm = self._buffer(sum(len(b) for b in image_binaries))
+            images = []
+            offset = 0
+            for image_binary in image_binaries:
+                shm.buf[offset : offset + len(image_binary)] = image_binary
+                images.append([offset, len(image_binary)])
+                offset += len(image_binary)
+            response = self._data.request(
+                {"op": "predict", "shm": shm.name, "images": images}
+            )
+        return [_from_json(value) for value in response["predictions"]]
+
+    def status(self) -> dict:
+        with self._control.lock:
+            status = self._control.request({"op": "status"})
+            self._identity = status.get("model")
+            return status
+
+    def model_identity(self) -> Optional[str]:
+        """
+        推論デーモンのモデルの識別子。接続が切れるまで同じ値を使う
+        （デーモンが再起動してモデルが変わった場合は接続し直したときに読み直す）。
+        デーモンに接続できない場合やモデルのロード前は None を返す。
+        """
+        identity = self._identity
+        if identity is None:
+            try:
+                identity = self.status().get("model")
+            except InferenceServiceError:
+                return None
+        return identity
+
+    def close(self):
+        with self._control.lock:
+            self._control.close()
+        with self._data.lock:
+            self._data.close()
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+                self._shm = None
+
+
+async def serve(path: str = INFERENCE_SOCKET):
+    from app import ai
+    from app.inference import BatchInferenceEngine
+
+    # 要求を受け付ける前にモデルをロードしておく
+    ai.registry.warm_up()
+    engine = BatchInferenceEngine(ai.predict_batch)
+    engine.start()
+    server = InferenceServer(engine, path, registry=ai.registry)
+    await server.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+        engine.stop()
+
+
+def main() -> int:
+    asyncio.run(serve())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
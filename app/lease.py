@@ -0,0 +1,208 @@
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import Callable, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session
+
+from app import db, models
+
+logger = getLogger(__name__)
+
+# リースの有効期間（秒）。この間ハートビートがなければ他のプロセスが引き継ぐ
+LEASE_TTL_SECONDS = float(os.getenv("LEASE_TTL_SECONDS", "30"))
+# リースを更新する（持っていないプロセスは取得を試みる）間隔（秒）。TTL より十分短くする
+LEASE_HEARTBEAT_SECONDS = float(os.getenv("LEASE_HEARTBEAT_SECONDS", "10"))
+
+
+def default_holder() -> str:
+    """プロセスごとに異なるリースの持ち主の名前"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class DatabaseLease:
+    """
+    leases テーブルの1行を使い、複数のプロセスのうち1つだけが name の処理を担当するようにする。
+
+    - acquire() はリースが空いている・期限切れ・自分が持っている場合だけ、1回の UPDATE で
+      holder と expires_at を書き換える。SQLite は書き込みを直列化するため、
+      同時に取得しようとしても成功するのは1つだけ
+    - 持っている間は ttl_seconds より短い間隔で acquire() を呼び、期限を延ばす（ハートビート）
+    - release() で解放すると、他のプロセスは期限を待たずに引き継げる
+    """
+
+    def __init__(
+        self,
+        name: str,
+        holder: Optional[str] = None,
+        ttl_seconds: float = LEASE_TTL_SECONDS,
+        engine=None,
+    ):
+        if ttl_seconds <= 0:
+            raise ValueError("ttl_seconds は正の値を指定してください")
+        self.name = name
+        self.holder = holder or default_holder()
+        self.ttl_seconds = ttl_seconds
+        self.engine = engine
+        # 自分が持っているリースの期限（持っていない場合は None）
+        self.expires_at: Optional[datetime] = None
+
+    def _session(self) -> Session:
+        return Session(self.engine or db.engine)
+
+    @property
+    def held(self) -> bool:
+        """期限内のリースを持っているか（データベースにはアクセスしない）"""
+        return self.expires_at is not None and datetime.now() < self.expires_at
+
+    def acquire(self) -> bool:
+        """リースを取得もしくは更新する。取得できたかを返す"""
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        with self._session() as session:
+            session.execute(
+                insert(models.Lease)
+                .values(name=self.name, expires_at=now, created_at=now, updated_at=now)
+                .on_conflict_do_nothing(index_elements=["name"])
+            )
+            result = session.exec(
+                update(models.Lease)
+                .where(
+                    models.Lease.name == self.name,
+                    or_(
+                        models.Lease.holder == self.holder,
+                        models.Lease.holder.is_(None),
+                        models.Lease.expires_at <= now,
+                    ),
+                )
+                .values(
+                    holder=self.holder,
+                    expires_at=expires_at,
+                    heartbeat_at=now,
+                    updated_at=now,
+                )
+            )
+            session.commit()
+        self.expires_at = expires_at if result.rowcount == 1 else None
+        return self.expires_at is not None
+
+    def release(self):
+        """持っているリースを解放する"""
+        if self.expires_at is None:
+            return
+        self.expires_at = None
+        now = datetime.now()
+        with self._session() as session:
+            session.exec(
+                update(models.Lease)
+                .where(models.Lease.name == self.name, models.Lease.holder == self.holder)
+                .values(holder=None, expires_at=now, updated_at=now)
+            )
+            session.commit()
+
+    def current_holder(self) -> Optional[str]:
+        """期限内のリースを持っているプロセス（いなければ None）"""
+        with self._session() as session:
+            lease = session.get(models.Lease, self.name)
+            if lease is None or lease.expires_at <= datetime.now():
+                return None
+            return lease.holder
+
+
+class LeaseRunner:
+    """
+    リースを持っている間だけ on_start() で開始した処理を動かす。
+
+    - リースを持っていないプロセスは heartbeat_seconds ごとに取得を試み、持っていたプロセスが
+      停止（release）するか応答しなくなる（期限切れ）と引き継ぐ
+    - リースの更新に失敗したまま期限が過ぎたら on_stop() で処理を止める。
+      引き継いだプロセスと同時に動かさないため、期限の時刻には必ず確認する
+    """
+
+    def __init__(
+        self,
+        lease: DatabaseLease,
+        on_start: Callable[[], None],
+        on_stop: Callable[[], None],
+        heartbeat_seconds: float = LEASE_HEARTBEAT_SECONDS,
+    ):
+        if heartbeat_seconds >= lease.ttl_seconds:
+            raise ValueError("heartbeat_seconds はリースの有効期間より短くしてください")
+        self.lease = lease
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self.heartbeat_seconds = heartbeat_seconds
+        self.active = False
+        self.takeovers = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"lease-{self.lease.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                self._tick()
+                wait = self.heartbeat_seconds
+                if self.active and self.lease.expires_at is not None:
+                    # 更新に失敗し続けても期限の時刻には確認して止める
+                    remaining = (self.lease.expires_at - datetime.now()).total_seconds()
+                    wait = max(0.0, min(wait, remaining))
+                self._stop_event.wait(wait)
+        finally:
+            self._deactivate()
+            self._release_quietly()
+
+    def _tick(self):
+        try:
+            acquired = self.lease.acquire()
+        except Exception as e:
+            # データベースが一時的に使えない場合は、期限内なら処理を続ける
+            logger.warning(f"リース {self.lease.name} を更新できませんでした: {e}")
+            acquired = self.lease.held
+        if acquired and not self.active:
+            logger.info(f"リース {self.lease.name} を取得しました ({self.lease.holder})")
+            try:
+                self.on_start()
+            except Exception as e:
+                logger.exception(f"リース {self.lease.name} の処理を開始できませんでした: {e}")
+                self._release_quietly()
+                return
+            self.active = True
+            self.takeovers += 1
+        elif not acquired and self.active:
+            logger.warning(f"リース {self.lease.name} を失ったため処理を停止します")
+            self._deactivate()
+
+    def _deactivate(self):
+        if not self.active:
+            return
+        self.active = False
+        try:
+            self.on_stop()
+        except Exception as e:
+            logger.exception(f"リース {self.lease.name} の処理を停止できませんでした: {e}")
+
+    def _release_quietly(self):
+        try:
+            self.lease.release()
+        except Exception as e:
+            logger.error(f"リース {self.lease.name} を解放できませんでした: {e}")
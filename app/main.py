@@ -1,47 +1,103 @@
+import asyncio
 import os
+import queue
+import re
 import sys
-import threading
+import unicodedata
 from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
+from typing import Optional
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
-from linebot.v3 import WebhookHandler
+from fastapi.responses import JSONResponse
+from linebot.v3 import WebhookParser
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.messaging import (
     ApiClient,
+    AsyncApiClient,
+    AsyncMessagingApi,
+    AsyncMessagingApiBlob,
     Configuration,
     ImageMessage,
     MessagingApi,
-    MessagingApiBlob,
     ReplyMessageRequest,
     TextMessage,
 )
 from linebot.v3.webhooks import ImageMessageContent, MessageEvent
-from sqlmodel import Session, or_, select
+from sqlmodel import select
 
-from app import db, models
-from app.ai import predict_minimal
-from app.crud.utils import get_create_user, plant_regist
-from app.handler import handler as watch_handler
+from app import ai, catalog, conversation, db, models, rules
+from app.ai import predict_batch
+from app.conversation import StaleStateError
+from app.crud.utils import (
+    DEVICE_IDS,
+    list_registed_plants_async,
+    plant_regist_async,
+    valid_device_id,
+)
+from app.delivery import DELIVERY_WORKERS, DeliveryService
+from app.dispatcher import DispatcherBusyError, EventDispatcher, event_key
+from app.inference import BatchInferenceEngine
+from app.inference_service import INFERENCE_MODE, InferenceClient, InferenceServiceError
+from app.prediction_cache import PredictionCache
+from app.scheduler import REGISTRATIONS, watering_scheduler
+from app.worker import WATERING_MODE, WateringWorker, create_runner
 
-stop_event = threading.Event()
+if INFERENCE_MODE == "remote":
+    # 推論は推論デーモン (python -m app.inference_service) に任せ、このプロセスでは torch を読み込まない
+    inference_client: Optional[InferenceClient] = InferenceClient()
+    # 予測結果のキャッシュはモデルと重みごとに分ける
+    prediction_cache = PredictionCache(model_identity=inference_client.model_identity)
+    inference_engine = BatchInferenceEngine(
+        inference_client.predict_batch, cache=prediction_cache
+    )
+else:
+    inference_client = None
+    prediction_cache = PredictionCache(model_identity=lambda: ai.registry.identity)
+    inference_engine = BatchInferenceEngine(predict_batch, cache=prediction_cache)
+dispatcher = EventDispatcher()
 
 
 async def lifespan(app: FastAPI):
+    global async_api_client, async_line_bot_api, async_line_bot_api_blob
     db.create_db_and_tables()
+    conversation.store.stats.watch_commits(db.async_engine.sync_engine)
+    async with db.async_session() as session:
+        await catalog.registry.get_async(session)
+    # aiohttp のセッションはイベントループ上で作成する
+    async_api_client = AsyncApiClient(configuration)
+    async_line_bot_api = AsyncMessagingApi(async_api_client)
+    async_line_bot_api_blob = AsyncMessagingApiBlob(async_api_client)
+    inference_engine.start()
+    dispatcher.start()
+    if WATERING_MODE == "lease":
+        # 水やりの仕組みはリースを取得できた1つのワーカーだけで動かす
+        watering_runner.start()
     executor = ThreadPoolExecutor()
-    executor.submit(watch_handler, line_bot_api, stop_event)
+    if MODEL_WARMUP and inference_client is None:
+        # 起動を待たせないよう、モデルはバックグラウンドでロードする
+        executor.submit(ai.registry.warm_up)
     try:
         yield
     finally:
-        stop_event.set()
+        await dispatcher.shutdown()
+        watering_runner.stop()
         executor.shutdown(wait=True)
+        inference_engine.stop()
+        if inference_client is not None:
+            inference_client.close()
+        prediction_cache.close()
+        await async_api_client.close()
+        await db.async_engine.dispose()
 
 
 load_dotenv()
 app = FastAPI(lifespan=lifespan)
 logger = getLogger("uvicorn.error")
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+# 「一覧」で1回に表示する植物の数
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "20"))
 channel_secret = os.getenv("LINE_CHANNEL_SECRET", None)
 channel_access_token = os.getenv("LINE_CHANNEL_ACCESS_TOKEN", None)
 if channel_secret is None:
@@ -52,10 +108,20 @@ if channel_access_token is None:
     sys.exit(1)
 
 configuration = Configuration(access_token=channel_access_token)
+# 送信のワーカーがコネクションを使い回せるようにする
+configuration.connection_pool_maxsize = max(
+    configuration.connection_pool_maxsize, DELIVERY_WORKERS
+)
+# 水やりの通知の送信用
 api_client = ApiClient(configuration)
-line_bot_api_blob = MessagingApiBlob(api_client)
 line_bot_api = MessagingApi(api_client)
-handler = WebhookHandler(channel_secret)
+delivery_service = DeliveryService(line_bot_api)
+watering_runner = create_runner(WateringWorker(delivery_service, watering_scheduler))
+# Webhook ハンドラからの返信用（lifespan で作成する）
+async_api_client: AsyncApiClient = None
+async_line_bot_api: AsyncMessagingApi = None
+async_line_bot_api_blob: AsyncMessagingApiBlob = None
+parser = WebhookParser(channel_secret)
 
 
 @app.post("/callback")
@@ -67,153 +133,238 @@ async def handle_callback(request: Request):
     body = body.decode("utf-8")
 
     try:
-        handler.handle(body, signature)
+        events = parser.parse(body, signature)
     except InvalidSignatureError:
         raise HTTPException(status_code=400, detail="Invalid signature")
 
+    # 署名の検証だけを行ってすぐに応答し、イベントはワーカーで処理する
+    submissions = []
+    for event in events:
+        func = dispatcher.resolve(event)
+        if func is None:
+            logger.info(f"イベント {type(event).__name__} のハンドラがありません")
+            continue
+        submissions.append((event_key(event), func, (event,)))
+    try:
+        # 503 を返すと Webhook 全体が再送されるため、全件受け付けるか1件も受け付けないかにする
+        await dispatcher.submit_all(submissions)
+    except DispatcherBusyError as e:
+        logger.warning(e)
+        raise HTTPException(status_code=503, detail="Server busy")
+
     return "OK"
 
 
-@handler.add(MessageEvent)
-def handle_message(event: MessageEvent):
+@app.get("/ready")
+async def readiness():
+    if inference_client is not None:
+        try:
+            status = await asyncio.to_thread(inference_client.status)
+        except InferenceServiceError as e:
+            status = {"model_loaded": False, "error": str(e)}
+    else:
+        status = {
+            "model_loaded": ai.registry.ready,
+            "error": str(ai.registry.error) if ai.registry.error else None,
+        }
+    if not status["model_loaded"]:
+        return JSONResponse(status_code=503, content=status)
+    return {"model_loaded": True}
+
+
+@app.get("/inference/stats")
+async def inference_stats():
+    return {
+        **inference_engine.stats.snapshot(),
+        "cache": prediction_cache.stats(),
+    }
+
+
+@app.get("/conversation/stats")
+async def conversation_stats():
+    return {**conversation.store.stats.snapshot(), "cached_users": len(conversation.store)}
+
+
+@app.get("/delivery/stats")
+async def delivery_stats():
+    return delivery_service.stats.snapshot()
+
+
+@dispatcher.add(MessageEvent)
+async def handle_message(event: MessageEvent):
     # テキストメッセージを受け取ったときの処理
-    # rs = req_dict.get(event.source.user_id, RequestState())
+    # 会話の状態はメモリ上の conversation.store から読み、変更したときだけ書き込む
     text: str = event.message.text
-    with Session(db.engine) as session:
-        user = get_create_user(session, event.source.user_id)
-        if user.delete_mode:
-            plant = session.exec(
-                select(models.Plant).where(
-                    or_(
-                        models.Plant.id == text,
-                        models.Plant.name_jp == text,
-                        models.Plant.name_en == text,
-                    )
-                )
-            ).first()
-            if "キャンセル" == text or "終了" == text:
-                user.delete_mode = False
-                session.add(user)
-                session.commit()
-                reply_text = "削除モードを終了しました。"
-            elif plant is None:
-                reply_text = "指定された植物は登録されていません。もう一度IDもしくは植物名を送信してください。"
-            else:
-                # 植物を削除
-                registed = session.exec(
+    conversation.store.stats.count("messages")
+    async with db.async_session() as session:
+        try:
+            reply_text = await _reply_to_text(session, event.source.user_id, text)
+        except StaleStateError as e:
+            logger.warning(e)
+            reply_text = "他の操作と重なったため処理できませんでした。もう一度送信してください。"
+
+    # LINEに返信
+    await async_line_bot_api.reply_message_with_http_info(
+        ReplyMessageRequest(
+            reply_token=event.reply_token,
+            messages=[TextMessage(text=reply_text)],
+        )
+    )
+
+
+def _list_page(text: str) -> int:
+    """「一覧 2」のようにページ番号が指定されていればその番号、なければ1"""
+    match = re.search(r"\d+", unicodedata.normalize("NFKC", text))
+    return max(1, int(match.group())) if match else 1
+
+
+async def _registed_plants_text(session, user_id: str, page: int = 1) -> Optional[str]:
+    """登録済みの植物一覧の page ページ目の文章。登録がない場合は None"""
+    # 次のページがあるかを知るため1件多く取得する
+    rows = await list_registed_plants_async(
+        session, user_id, LIST_PAGE_SIZE + 1, (page - 1) * LIST_PAGE_SIZE
+    )
+    if not rows:
+        return None if page == 1 else f"{page} ページ目に表示する植物はありません。"
+    header = "登録済みの植物一覧:" if page == 1 else f"登録済みの植物一覧 ({page} ページ目):"
+    text = header + "\n" + "\n".join(
+        f"- {name_jp} (ID: {plant_id})" for plant_id, name_jp, _ in rows[:LIST_PAGE_SIZE]
+    )
+    if len(rows) > LIST_PAGE_SIZE:
+        text += f"\n続きを表示する場合は「一覧 {page + 1}」と送信してください。"
+    return text
+
+
+async def _reply_to_text(session, user_id: str, text: str) -> str:
+    """テキストメッセージに応じて会話の状態を進め、返信する文章を返す"""
+    state = await conversation.store.get(session, user_id)
+    if state.delete_mode:
+        if "キャンセル" == text or "終了" == text:
+            await conversation.store.update(session, state, delete_mode=False)
+            return "削除モードを終了しました。"
+        if text.startswith("一覧"):
+            return await _registed_plants_text(
+                session, user_id, _list_page(text)
+            ) or "登録済みの植物はありません。"
+        plants = await catalog.registry.get_async(session)
+        plant = plants.resolve(text)
+        registed = None
+        if plant is not None:
+            registed = (
+                await session.exec(
                     select(models.Registed).where(
                         models.Registed.plant_id == plant.id,
-                        models.Registed.user_id == user.id,
+                        models.Registed.user_id == user_id,
                     )
-                ).first()
-                reply_text = f"{plant.name_jp} (ID: {plant.id}) を削除しました。"
-                session.delete(registed)
-                session.commit()
-                user.delete_mode = False
-                session.add(user)
-                session.commit()
-        elif "登録" == text:
-            reply_text = "登録を開始します。画像を送信してください。"
-        elif "一覧" in text:
-            # 登録済みの植物一覧を取得
-            registed_plants = session.exec(
-                select(models.Registed).where(models.Registed.user_id == user.id)
-            ).all()
-            if not registed_plants:
-                reply_text = "登録済みの植物はありません。"
-            else:
-                reply_text = "登録済みの植物一覧:\n"
-                plant_list = [registed.plant for registed in registed_plants]
-                reply_text += "\n".join(
-                    f"- {plant.name_jp} (ID: {plant.id})" for plant in plant_list
                 )
-        elif "削除" == text:
-            registed_plants = session.exec(
-                select(models.Registed).where(models.Registed.user_id == user.id)
-            ).all()
-            if not registed_plants:
-                reply_text = "登録済みの植物はありません。"
-            else:
-                reply_text = "登録済みの植物一覧:\n"
-                plant_list = [registed.plant for registed in registed_plants]
-                reply_text += "\n".join(
-                    f"- {plant.name_jp} (ID: {plant.id})" for plant in plant_list
-                )
-                user.delete_mode = True
-                session.add(user)
-                session.commit()
-                reply_text += "\n削除モードに入りました。削除したい植物のIDもしくは植物名を送信してください。\n削除をキャンセルする場合は「キャンセル」もしくは「終了」と送信してください。"
-
-        elif user.current_predict:
-            if "はい" in text or "yes" == text.lower():
-                # 植物登録を一時的に保留し、センサー番号の入力を要求
-                user.awaiting_device_id = user.current_predict
-                user.current_predict = None
-                session.add(user)
-                session.commit()
-                reply_text = "センサー番号を入力してください。（例：1, 2, 3...）"
-            elif "いいえ" in text or "no" == text.lower():
-                user.current_predict = None
-                session.add(user)
-                session.commit()
-                reply_text = "登録をキャンセルしました。"
-            else:
-                reply_text = (
-                    "登録の確認ができませんでした。もう一度写真を送信してください。"
+            ).first()
+        if registed is None:
+            reply = "指定された植物は登録されていません。もう一度IDもしくは植物名を送信してください。"
+            suggestions = plants.suggest(text) if plant is None else []
+            if suggestions:
+                reply += "\nもしかして: " + "、".join(
+                    f"{suggestion.name_jp} (ID: {suggestion.id})" for suggestion in suggestions
                 )
-                user.current_predict = None
-                session.add(user)
-                session.commit()
+            return reply
+        # 植物の削除と削除モードの終了を1回のコミットで行う
+        await session.delete(registed)
+        # 水やりチェックを動かしている別のプロセスに知らせる
+        await rules.bump_catalog_version_async(session, REGISTRATIONS)
+        await conversation.store.update(session, state, delete_mode=False)
+        watering_scheduler.remove(user_id, registed.plant_id, registed.device_id)
+        return f"{plant.name_jp} (ID: {plant.id}) を削除しました。"
 
-        elif user.awaiting_device_id:
-            # センサー番号の入力処理
-            try:
-                device_id = int(text.strip())
-                # 植物とデバイスを登録
-                if not plant_regist(
-                    session, user.awaiting_device_id, user.id, device_id
-                ):
-                    reply_text = f"センサー番号 {device_id} は既に使用されているか、登録に失敗しました。\n別の番号を入力してください。"
-                else:
-                    plant = session.exec(
-                        select(models.Plant).where(
-                            models.Plant.id == user.awaiting_device_id
-                        )
-                    ).first()
-                    # 状態をリセット
-                    user.awaiting_device_id = 0
-                    session.add(user)
-                    session.commit()
-                    reply_text = f"登録が完了しました。\nセンサー番号: {device_id}\n\nこの植物の注意事項\n{plant.description}"
-            except ValueError:
-                reply_text = "有効な数字を入力してください。（例：1, 2, 3...）"
-        else:
-            reply_text = (
-                "画像を送信してください。植物の予測を行います。\n"
-                "または「一覧」と送信すると、登録済みの植物一覧を表示します。"
-            )
+    if "登録" == text:
+        return "登録を開始します。画像を送信してください。"
 
-    # LINEに返信
-    line_bot_api.reply_message_with_http_info(
-        ReplyMessageRequest(
-            reply_token=event.reply_token,
-            messages=[TextMessage(text=reply_text)],
+    if "一覧" in text:
+        # 登録済みの植物一覧を取得
+        return await _registed_plants_text(
+            session, user_id, _list_page(text)
+        ) or "登録済みの植物はありません。"
+
+    if "削除" == text:
+        plants_text = await _registed_plants_text(session, user_id)
+        if plants_text is None:
+            return "登録済みの植物はありません。"
+        await conversation.store.update(session, state, delete_mode=True)
+        return (
+            plants_text
+            + "\n削除モードに入りました。削除したい植物のIDもしくは植物名を送信してください。\n削除をキャンセルする場合は「キャンセル」もしくは「終了」と送信してください。"
         )
+
+    if state.current_predict:
+        if "はい" in text or "yes" == text.lower():
+            # 植物登録を一時的に保留し、センサー番号の入力を要求
+            await conversation.store.update(
+                session,
+                state,
+                awaiting_device_id=int(state.current_predict),
+                current_predict=None,
+            )
+            return "センサー番号を入力してください。（例：1, 2, 3...）"
+        await conversation.store.update(session, state, current_predict=None)
+        if "いいえ" in text or "no" == text.lower():
+            return "登録をキャンセルしました。"
+        return "登録の確認ができませんでした。もう一度写真を送信してください。"
+
+    if state.awaiting_device_id:
+        # センサー番号の入力処理
+        try:
+            device_id = int(text.strip())
+        except ValueError:
+            return "有効な数字を入力してください。（例：1, 2, 3...）"
+        if not valid_device_id(device_id):
+            return f"センサー番号は{DEVICE_IDS[0]}〜{DEVICE_IDS[-1]}を入力してください。"
+        plant_id = state.awaiting_device_id
+        # 植物とデバイスを登録（状態のリセットと一緒にコミットする）
+        if not await plant_regist_async(
+            session, plant_id, user_id, device_id, commit=False
+        ):
+            return f"センサー番号 {device_id} は既に使用されているか、登録に失敗しました。\n別の番号を入力してください。"
+        plant = (await catalog.registry.get_async(session)).get(plant_id)
+        await rules.bump_catalog_version_async(session, REGISTRATIONS)
+        await conversation.store.update(session, state, awaiting_device_id=0)
+        watering_scheduler.add(user_id, plant_id, device_id)
+        return f"登録が完了しました。\nセンサー番号: {device_id}\n\nこの植物の注意事項\n{plant.description}"
+
+    return (
+        "画像を送信してください。植物の予測を行います。\n"
+        "または「一覧」と送信すると、登録済みの植物一覧を表示します。"
     )
 
 
-@handler.add(MessageEvent, message=ImageMessageContent)
-def handle_image(event):
+async def _reply_text(event, text: str):
+    await async_line_bot_api.reply_message_with_http_info(
+        ReplyMessageRequest(reply_token=event.reply_token, messages=[TextMessage(text=text)])
+    )
+
+
+@dispatcher.add(MessageEvent, message=ImageMessageContent)
+async def handle_image(event):
     # 画像を保存
-    with Session(db.engine) as session:
-        user = get_create_user(session, event.source.user_id)
+    conversation.store.stats.count("messages")
+    async with db.async_session() as session:
+        state = await conversation.store.get(session, event.source.user_id)
         message_id = event.message.id
-        content = line_bot_api_blob.get_message_content(message_id)
+        content = await async_line_bot_api_blob.get_message_content(message_id)
 
-        result, prediction_confidence = predict_minimal(content)
-        db_plant = session.exec(
-            select(models.Plant).where(models.Plant.id == int(result))
-        ).first()
+        try:
+            prediction = await inference_engine.predict_async(content)
+        except (queue.Full, InferenceServiceError) as e:
+            logger.warning(f"画像の予測を行えませんでした: {e!r}")
+            await _reply_text(
+                event, "現在混み合っています。しばらくしてから再度画像を送信してください。"
+            )
+            return
+        if prediction is None:
+            await _reply_text(
+                event, "画像を読み込めませんでした。別の画像を送信してください。"
+            )
+            return
+        result, prediction_confidence = prediction.class_id, prediction.confidence
+        plants = await catalog.registry.get_async(session)
+        db_plant = plants.get(int(result))
         if prediction_confidence < 0.85:
             reply_msg = (
                 f"予測結果の植物の確信度が低いため、再度画像を送信してください。\n"
@@ -223,18 +374,24 @@ def handle_image(event):
                 TextMessage(text=reply_msg),
             ]
         elif db_plant is None:
-            all_plant = session.exec(select(models.Plant)).all()
             logger.warning(
-                f"予測結果の植物ID {result} がデータベースに存在しません。登録されている植物: {[plant.id for plant in all_plant]}"
+                f"予測結果の植物ID {result} がデータベースに存在しません。登録されている植物: {plants.ids()}"
             )
             reply_msg = "予測結果の植物がデータベースに存在しません。"
             messages = [
                 TextMessage(text=reply_msg),
             ]
         else:
-            user.current_predict = db_plant.id
-            session.add(user)
-            session.commit()
+            try:
+                await conversation.store.update(
+                    session, state, current_predict=db_plant.id
+                )
+            except StaleStateError as e:
+                logger.warning(e)
+                state = await conversation.store.get(session, event.source.user_id)
+                await conversation.store.update(
+                    session, state, current_predict=db_plant.id
+                )
             reply_msg = f"予測結果: {db_plant.name_jp}\n登録する場合は「はい」と送信してください。登録しない場合は「いいえ」と送信してください。"
             messages = [
                 TextMessage(text=reply_msg),
@@ -244,7 +401,7 @@ def handle_image(event):
                 ),
             ]
 
-        line_bot_api.reply_message_with_http_info(
+        await async_line_bot_api.reply_message_with_http_info(
             ReplyMessageRequest(
                 reply_token=event.reply_token,
                 messages=messages,
@@ -1,13 +1,20 @@
+from .catalog_version import CatalogVersion, CatalogVersionBase
 from .device import Device, DeviceBase
+from .lease import Lease, LeaseBase
 from .plant import Plant, PlantBase
 from .registed import Registed, RegistedBase
 from .user import User, UserBase
 from .watering import Watering, WateringBase
 from .notification_history import NotificationHistory, NotificationHistoryBase
+from .outbox_message import OutboxMessage, OutboxMessageBase
 
 __all__ = [
+    "CatalogVersion",
+    "CatalogVersionBase",
     "Device",
     "DeviceBase",
+    "Lease",
+    "LeaseBase",
     "Plant",
     "PlantBase",
     "Registed",
@@ -18,4 +25,6 @@ __all__ = [
     "UserBase",
     "NotificationHistory",
     "NotificationHistoryBase",
+    "OutboxMessage",
+    "OutboxMessageBase",
 ]
@@ -0,0 +1,18 @@
+from sqlmodel import Field
+
+from app import db
+
+
+class CatalogVersionBase(db.BaseModel):
+    name: str = Field(
+        primary_key=True,
+        description="マスタデータの名前（waterings など）",
+    )
+    version: int = Field(
+        default=0,
+        description="マスタデータを更新するたびに変わる値。キャッシュの無効化に使用される。",
+    )
+
+
+class CatalogVersion(CatalogVersionBase, table=True):
+    __tablename__ = "catalog_versions"
@@ -0,0 +1,31 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Field
+
+from app import db
+
+
+class LeaseBase(db.BaseModel):
+    name: str = Field(
+        primary_key=True,
+        description="リースの名前（watering など）",
+    )
+    holder: Optional[str] = Field(
+        default=None,
+        description="リースを持っているプロセス（ホスト名:PID:乱数）。解放済みの場合は None",
+        nullable=True,
+    )
+    expires_at: datetime = Field(
+        default_factory=datetime.now,
+        description="この日時までにハートビートがなければ、他のプロセスがリースを引き継げる",
+    )
+    heartbeat_at: Optional[datetime] = Field(
+        default=None,
+        description="最後にリースを取得・更新した日時",
+        nullable=True,
+    )
+
+
+class Lease(LeaseBase, table=True):
+    __tablename__ = "leases"
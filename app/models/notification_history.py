@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship
 
 from app import db
@@ -38,6 +39,15 @@ class NotificationHistoryBase(db.BaseModel):
 
 class NotificationHistory(NotificationHistoryBase, table=True):
     __tablename__ = "notification_histories"
+    __table_args__ = (
+        # ユーザーと植物ごとの最新の通知の取得用
+        Index(
+            "ix_notification_histories_user_plant_sent_at",
+            "user_id",
+            "plant_id",
+            "sent_at",
+        ),
+    )
 
     plant: "Plant" = Relationship(
         back_populates="notification_histories",
@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Index
+from sqlmodel import Field
+
+from app import db
+
+
+class OutboxMessageBase(db.BaseModel):
+    id: Optional[int] = Field(
+        primary_key=True,
+        description="送信待ちメッセージID, 送信順を表す。",
+        default=None,
+    )
+    user_id: str = Field(description="送信先のユーザーID")
+    text: str = Field(description="送信するテキストメッセージ")
+    status: str = Field(
+        default="pending",
+        description="送信状態（pending, sending, sent, failed）",
+    )
+    attempts: int = Field(default=0, description="送信を試みた回数")
+    next_attempt_at: datetime = Field(
+        default_factory=datetime.now,
+        description="次に送信を試みる日時",
+    )
+    retry_key: Optional[str] = Field(
+        default=None,
+        description="LINEの X-Line-Retry-Key。同じリクエストで送信したメッセージは同じ値を持つ。",
+        nullable=True,
+    )
+    last_error: Optional[str] = Field(
+        default=None,
+        description="最後に送信に失敗したときのエラー",
+        nullable=True,
+    )
+    sent_at: Optional[datetime] = Field(
+        default=None, description="送信日時", nullable=True
+    )
+
+
+class OutboxMessage(OutboxMessageBase, table=True):
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        # 送信待ちのメッセージを送信予定順に取り出す用
+        Index("ix_outbox_messages_status_next_attempt_at", "status", "next_attempt_at"),
+    )
@@ -1,5 +1,6 @@
 from typing import TYPE_CHECKING
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship
 
 from app import db
@@ -32,6 +33,11 @@ class RegistedBase(db.BaseModel):
 
 class Registed(RegistedBase, table=True):
     __tablename__ = "registed_plants"
+    __table_args__ = (
+        Index(
+            "ix_registed_plants_user_plant_device", "user_id", "plant_id", "device_id"
+        ),
+    )
 
     device: "Device" = Relationship(
         back_populates="plant",
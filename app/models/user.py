@@ -27,6 +27,11 @@ class UserBase(db.BaseModel):
         description="デバイスID入力待ちフラグ", 
         default=0
     )
+    version: int = Field(
+        default=0,
+        description="会話の状態を更新するたびに増える値。楽観的排他制御に使用される。",
+        sa_column_kwargs={"server_default": "0"},
+    )
 
 
 class User(UserBase, table=True):
@@ -1,5 +1,6 @@
 from typing import TYPE_CHECKING
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship
 
 from app import db
@@ -25,6 +26,7 @@ class WateringBase(db.BaseModel):
 
 class Watering(WateringBase, table=True):
     __tablename__ = "waterings"
+    __table_args__ = (Index("ix_waterings_plant_id_month", "plant_id", "month"),)
 
     plant: "Plant" = Relationship(
         back_populates="waterings",
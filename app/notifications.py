@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from logging import getLogger
+from typing import Optional
+
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app import db, models
+from app.delivery import Sender
+
+logger = getLogger(__name__)
+
+# この件数を超えるか、最も古い通知からこの秒数が経つと書き込む
+NOTIFICATION_BUFFER_SIZE = int(os.getenv("NOTIFICATION_BUFFER_SIZE", "500"))
+NOTIFICATION_FLUSH_SECONDS = float(os.getenv("NOTIFICATION_FLUSH_SECONDS", "5"))
+# 1件ずつ書き込んでもこの回数失敗した通知は破棄する
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+
+NotificationKey = tuple[str, int]
+# (通知, 送信先, 書き込みに失敗した回数)
+Pending = tuple[models.NotificationHistory, Optional[Sender], int]
+
+
+class NotificationBuffer:
+    """
+    通知履歴の write-behind バッファ。
+
+    add() した通知はメモリに貯め、flush() で1つのトランザクションにまとめて INSERT する。
+    送信するメッセージも同じトランザクションで sender に渡すため、通知履歴と outbox は
+    一緒に書き込まれる。書き込み前の通知は latest() / overlay() で参照できる。
+    まとめての書き込みに失敗した場合は1件ずつ書き込み直し、失敗した通知だけを次の flush() に残す。
+    max_attempts 回失敗した通知はログに残して破棄する（1件の不正な通知で書き込みが止まらないように）。
+    """
+
+    def __init__(
+        self,
+        engine=None,
+        max_size: int = NOTIFICATION_BUFFER_SIZE,
+        max_seconds: float = NOTIFICATION_FLUSH_SECONDS,
+        max_attempts: int = NOTIFICATION_MAX_ATTEMPTS,
+    ):
+        self.engine = engine
+        self.max_size = max_size
+        self.max_seconds = max_seconds
+        self.max_attempts = max_attempts
+        self.flushes = 0
+        self.rows = 0
+        self.dropped = 0
+        self._pending: list[Pending] = []
+        self._latest: dict[NotificationKey, models.NotificationHistory] = {}
+        self._first_added: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(
+        self,
+        notification: models.NotificationHistory,
+        sender: Optional[Sender] = None,
+        session: Optional[Session] = None,
+    ):
+        """
+        通知を書き込み待ちに追加する。sender を渡すと flush() 時に通知のメッセージを送る。
+        件数か経過時間がしきい値を超えたら書き込む（session は書き込み先のデータベースの指定に使う）。
+        """
+        with self._lock:
+            self._pending.append((notification, sender, 0))
+            key = (notification.user_id, notification.plant_id)
+            latest = self._latest.get(key)
+            if latest is None or notification.sent_at >= latest.sent_at:
+                self._latest[key] = notification
+            now = time.monotonic()
+            if self._first_added is None:
+                self._first_added = now
+            full = (
+                len(self._pending) >= self.max_size
+                or now - self._first_added >= self.max_seconds
+            )
+        if full:
+            self.flush(session)
+
+    def latest(self, user_id: str, plant_id: int) -> Optional[models.NotificationHistory]:
+        """書き込み前の通知のうち、指定したユーザーと植物の最新のもの"""
+        with self._lock:
+            return self._latest.get((user_id, plant_id))
+
+    def overlay(self) -> dict[NotificationKey, models.NotificationHistory]:
+        """書き込み前の通知の (ユーザー, 植物) ごとの最新のもの"""
+        with self._lock:
+            return dict(self._latest)
+
+    def flush(self, session: Optional[Session] = None) -> int:
+        """
+        書き込み待ちの通知をまとめて INSERT してコミットする。書き込んだ件数を返す。
+        書き込みは常に専用のセッションで行う。session を渡した場合はそのセッションと同じ
+        データベースに書き込むだけで、失敗時のロールバックで呼び出し側のセッションの
+        オブジェクト（スケジューラが保持しているものなど）を expire しない。
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._first_added = None
+            if not pending:
+                return 0
+            engine = session.get_bind() if session is not None else self.engine or db.engine
+            with Session(engine) as own_session:
+                written, failed = self._write_all(own_session, pending)
+            with self._lock:
+                for notification, _, _ in written:
+                    self._forget(notification)
+                retry = []
+                for notification, sender, attempts in failed:
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        logger.error(
+                            f"通知履歴を {attempts} 回書き込めなかったため破棄します: "
+                            f"{notification.model_dump(exclude={'id'})}"
+                        )
+                        self._forget(notification)
+                        self.dropped += 1
+                    else:
+                        retry.append((notification, sender, attempts))
+                if retry:
+                    # 書き込めなかった通知は次の flush() で書き込む
+                    self._pending[:0] = retry
+                    if self._first_added is None:
+                        self._first_added = time.monotonic()
+                self.flushes += 1
+                self.rows += len(written)
+        if written:
+            logger.info(f"通知履歴を書き込みました: {len(written)} 件")
+        return len(written)
+
+    def _forget(self, notification: models.NotificationHistory):
+        key = (notification.user_id, notification.plant_id)
+        if self._latest.get(key) is notification:
+            del self._latest[key]
+
+    def _write_all(
+        self, session: Session, pending: list[Pending]
+    ) -> tuple[list[Pending], list[Pending]]:
+        """
+        pending をまとめて書き込み、失敗した場合は1件ずつ書き込み直す。
+        戻り値は (書き込めたもの, 書き込めなかったもの)。
+        """
+        try:
+            self._write(session, pending)
+            return pending, []
+        except Exception as e:
+            session.rollback()
+            if len(pending) == 1:
+                logger.error(f"通知履歴の書き込みに失敗しました: {e}")
+                return [], pending
+            logger.warning(f"通知履歴をまとめて書き込めないため1件ずつ書き込みます: {e}")
+        written, failed = [], []
+        for entry in pending:
+            try:
+                self._write(session, [entry])
+                written.append(entry)
+            except Exception as e:
+                session.rollback()
+                logger.error(f"通知履歴の書き込みに失敗しました: {e}")
+                failed.append(entry)
+        return written, failed
+
+    @staticmethod
+    def _write(session: Session, pending: list[Pending]):
+        session.execute(
+            insert(models.NotificationHistory),
+            [notification.model_dump(exclude={"id"}) for notification, _, _ in pending],
+        )
+        for notification, sender, _ in pending:
+            if sender is not None:
+                sender.send(session, notification.user_id, notification.message)
+        session.commit()
+
+
+buffer = NotificationBuffer()
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from logging import getLogger
+from typing import Optional, Sequence
+
+from app.handler import (
+    NotificationSnapshot,
+    PlannedNotification,
+    RegistrationRow,
+    plan_registration,
+)
+from app.rules import WateringRule
+
+logger = getLogger(__name__)
+
+# 水やりの判定を行うプロセス数。1 はプロセスを使わずに判定する
+WATERING_EVAL_WORKERS = int(os.getenv("WATERING_EVAL_WORKERS", "1"))
+# 判定する登録がこの件数未満の場合は、プロセスに渡す手間の方が大きいのでこのプロセスで判定する
+WATERING_EVAL_MIN_TASKS = int(os.getenv("WATERING_EVAL_MIN_TASKS", "2000"))
+
+
+@dataclass(frozen=True, slots=True)
+class EvaluationTask:
+    """1件の登録の判定に必要な値（tick の開始時に読み込んだスナップショット）"""
+
+    registed: RegistrationRow
+    rule: WateringRule
+    latest: Optional[NotificationSnapshot]
+    humidity: float
+
+
+def shard_of(user_id: str, shards: int) -> int:
+    """user_id の担当の番号。プロセスをまたいで同じ値になるよう hash() は使わない"""
+    return zlib.crc32(user_id.encode()) % shards
+
+
+def evaluate_shard(
+    tasks: Sequence[EvaluationTask], current_time: datetime
+) -> list[tuple[PlannedNotification, ...]]:
+    """tasks を順に判定する（ワーカープロセスで実行する）"""
+    return [
+        plan_registration(task.registed, task.rule, task.latest, task.humidity, current_time)
+        for task in tasks
+    ]
+
+
+class ShardedEvaluator:
+    """
+    水やりの判定（評価フェーズ）を user_id のハッシュで workers 個に分け、プロセスプールで並列に行う。
+
+    - 判定は plan_registration だけで行い、データベース・センサー・送信にはアクセスしない。
+      読み込みは呼び出し側が tick の最初に1回行い、EvaluationTask として各プロセスに渡す
+    - 結果は tasks と同じ順に並べて返す。通知の記録と送信、コミットは呼び出し側で1回にまとめて行う
+    - 同じユーザーの登録は常に同じプロセスで判定される
+    - ワーカーはスレッドを持つプロセスから fork しないよう spawn で起動し、最初に使うときに作る
+    """
+
+    def __init__(
+        self,
+        workers: int = WATERING_EVAL_WORKERS,
+        min_tasks: int = WATERING_EVAL_MIN_TASKS,
+        mp_context=None,
+    ):
+        if workers < 1:
+            raise ValueError("workers は1以上を指定してください")
+        self.workers = workers
+        self.min_tasks = min_tasks
+        self.mp_context = mp_context or multiprocessing.get_context("spawn")
+        self.parallel_ticks = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=self.mp_context
+                )
+                logger.info(f"水やりの判定用のプロセスを起動します (workers={self.workers})")
+            return self._executor
+
+    def evaluate(
+        self, tasks: Sequence[EvaluationTask], current_time: datetime
+    ) -> list[tuple[PlannedNotification, ...]]:
+        if self.workers == 1 or len(tasks) < self.min_tasks:
+            return evaluate_shard(tasks, current_time)
+
+        shards: list[list[EvaluationTask]] = [[] for _ in range(self.workers)]
+        positions: list[list[int]] = [[] for _ in range(self.workers)]
+        for i, task in enumerate(tasks):
+            shard = shard_of(task.registed.user_id, self.workers)
+            shards[shard].append(task)
+            positions[shard].append(i)
+
+        pool = self._pool()
+        futures = [
+            (pool.submit(evaluate_shard, shard, current_time), shard_positions)
+            for shard, shard_positions in zip(shards, positions)
+            if shard
+        ]
+        results: list[tuple[PlannedNotification, ...]] = [()] * len(tasks)
+        for future, shard_positions in futures:
+            for i, planned in zip(shard_positions, future.result()):
+                results[i] = planned
+        self.parallel_ticks += 1
+        return results
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+evaluator = ShardedEvaluator()
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Optional
+
+from PIL import Image
+
+from app.ai import Prediction
+
+logger = getLogger(__name__)
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", str(24 * 60 * 60)))
+PREDICTION_CACHE_PERCEPTUAL = os.getenv("PREDICTION_CACHE_PERCEPTUAL", "0") == "1"
+# 空の場合はメモリのみ。パスを指定すると再起動後もキャッシュが残る。
+PREDICTION_CACHE_DB = os.getenv("PREDICTION_CACHE_DB", "")
+
+
+def content_hash(image_binary: bytes) -> str:
+    """画像バイナリそのもののハッシュ"""
+    return "sha256:" + hashlib.sha256(image_binary).hexdigest()
+
+
+def perceptual_hash(image_binary: bytes) -> Optional[str]:
+    """
+    再エンコードやリサイズされた同じ写真を見つけるための差分ハッシュ (dHash)。
+    9x8 のグレースケールに縮小し、横に隣り合う画素の大小を64ビットにする。
+    """
+    try:
+        img = Image.open(BytesIO(image_binary))
+        img.draft("L", (64, 64))
+        pixels = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return f"dhash:{value:016x}"
+
+
+class PredictionCache:
+    """
+    画像のハッシュをキーにした予測結果のキャッシュ（LRU + TTL）。
+    db_path を指定すると SQLite にも書き込み、メモリにない場合はそこから読む。
+    model_identity を渡すと、その戻り値（モデルと重みの識別子）をキーの先頭に付け、
+    モデル・重み・推論バックエンドを変えたあとに古いモデルの予測結果を返さない。
+    識別子が None（モデルのロード前など）の間はキャッシュを使わない。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PREDICTION_CACHE_SIZE,
+        ttl: float = PREDICTION_CACHE_TTL,
+        perceptual: bool = PREDICTION_CACHE_PERCEPTUAL,
+        db_path: Optional[Path] = PREDICTION_CACHE_DB or None,
+        model_identity: Optional[Callable[[], Optional[str]]] = None,
+    ):
+        self.max_entries = max_entries
+        self.model_identity = model_identity
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, Prediction]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS prediction_cache (
+                    key TEXT PRIMARY KEY,
+                    class_id TEXT NOT NULL,
+                    confidence REAL NOT NULL,
+                    top_k TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "DELETE FROM prediction_cache WHERE expires_at < ?", (time.time(),)
+            )
+            self._conn.commit()
+
+    def keys(self, image_binary: bytes) -> list[str]:
+        """画像のキャッシュキー（完全一致を優先し、次に知覚ハッシュ）"""
+        prefix = ""
+        if self.model_identity is not None:
+            identity = self.model_identity()
+            if identity is None:
+                return []
+            prefix = identity + "|"
+        keys = [prefix + content_hash(image_binary)]
+        if self.perceptual:
+            phash = perceptual_hash(image_binary)
+            if phash is not None:
+                keys.append(prefix + phash)
+        return keys
+
+    def get(self, keys: list[str]) -> Optional[Prediction]:
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                prediction = self._get_memory(key, now) or self._get_disk(key, now)
+                if prediction is not None:
+                    self.hits += 1
+                    return prediction
+            self.misses += 1
+            return None
+
+    def put(self, keys: list[str], prediction: Prediction):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            for key in keys:
+                self._put_memory(key, expires_at, prediction)
+            if self._conn is not None:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO prediction_cache VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            key,
+                            prediction.class_id,
+                            prediction.confidence,
+                            json.dumps(prediction.top_k),
+                            expires_at,
+                        )
+                        for key in keys
+                    ],
+                )
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _get_memory(self, key: str, now: float) -> Optional[Prediction]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, prediction = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return prediction
+
+    def _get_disk(self, key: str, now: float) -> Optional[Prediction]:
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT class_id, confidence, top_k, expires_at FROM prediction_cache WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None or row[3] < now:
+            return None
+        class_id, confidence, top_k, expires_at = row
+        prediction = Prediction(
+            class_id, confidence, tuple(tuple(item) for item in json.loads(top_k))
+        )
+        self._put_memory(key, expires_at, prediction)
+        return prediction
+
+    def _put_memory(self, key: str, expires_at: float, prediction: Prediction):
+        self._entries[key] = (expires_at, prediction)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
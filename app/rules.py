@@ -0,0 +1,168 @@
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from logging import getLogger
+from typing import Iterable, Optional, Union
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import models
+
+logger = getLogger(__name__)
+
+# catalog_versions の名前
+WATERINGS = "waterings"
+# マスタデータが更新されたかを確認する間隔（秒）
+RULES_CHECK_INTERVAL = float(os.getenv("RULES_CHECK_INTERVAL", "60"))
+
+_INTERVAL_PATTERN = re.compile(r"(\d+)")
+
+
+@dataclass(frozen=True, slots=True)
+class WateringRule:
+    """waterings の1行を判定に使いやすい形にしたもの"""
+
+    plant_id: int
+    month: int
+    frequency: str
+    amount: str
+    humidity_when_dry: int
+    humidity_when_watered: int
+    # 「N日に1回」の N。数字がない場合は None（湿度で判定する）
+    interval_days: Optional[int]
+
+    @classmethod
+    def compile(cls, watering: models.Watering) -> "WateringRule":
+        match = _INTERVAL_PATTERN.search(watering.frequency.lower())
+        return cls(
+            plant_id=watering.plant_id,
+            month=int(watering.month),
+            frequency=watering.frequency,
+            amount=watering.amount,
+            humidity_when_dry=watering.humidity_when_dry,
+            humidity_when_watered=watering.humidity_when_watered,
+            interval_days=int(match.group(1)) if match else None,
+        )
+
+
+def as_rule(watering_data: Union[WateringRule, models.Watering]) -> WateringRule:
+    if isinstance(watering_data, WateringRule):
+        return watering_data
+    return WateringRule.compile(watering_data)
+
+
+class RuleTable:
+    """月と植物IDで規則を引ける表"""
+
+    def __init__(self, rules: Iterable[WateringRule], version: int = 0):
+        self.version = version
+        self._by_month: tuple[dict[int, WateringRule], ...] = tuple(
+            {} for _ in range(13)
+        )
+        for rule in rules:
+            if 1 <= rule.month <= 12:
+                # 同じ植物・月の行が複数ある場合は最初の行を使う（get_watering_data と同じ）
+                self._by_month[rule.month].setdefault(rule.plant_id, rule)
+
+    def __len__(self) -> int:
+        return sum(len(rules) for rules in self._by_month)
+
+    def get(self, plant_id: int, month: int) -> Optional[WateringRule]:
+        return self._by_month[month].get(plant_id)
+
+    def for_month(self, month: int) -> dict[int, WateringRule]:
+        """指定した月の規則（植物IDごと）。変更しないこと"""
+        return self._by_month[month]
+
+
+def get_catalog_version(session: Session, name: str = WATERINGS) -> int:
+    version = session.exec(
+        select(models.CatalogVersion.version).where(models.CatalogVersion.name == name)
+    ).first()
+    return version or 0
+
+
+async def get_catalog_version_async(session: AsyncSession, name: str = WATERINGS) -> int:
+    version = (
+        await session.exec(
+            select(models.CatalogVersion.version).where(models.CatalogVersion.name == name)
+        )
+    ).first()
+    return version or 0
+
+
+def bump_catalog_version(session: Session, name: str = WATERINGS) -> int:
+    """
+    マスタデータを更新したことを記録する。コミットは呼び出し側で行う。
+    データベースを作り直しても以前の値と重ならないよう、現在時刻を使う。
+    """
+    version = time.time_ns()
+    row = session.get(models.CatalogVersion, name) or models.CatalogVersion(name=name)
+    row.version = version
+    session.add(row)
+    return version
+
+
+async def bump_catalog_version_async(session: AsyncSession, name: str = WATERINGS) -> int:
+    """
+    bump_catalog_version の非同期版。コミットは呼び出し側で行う。
+    複数の Webhook のワーカーから同時に呼ばれるため、行の作成は UPSERT で行う。
+    """
+    version = time.time_ns()
+    now = datetime.now()
+    await session.exec(
+        insert(models.CatalogVersion)
+        .values(name=name, version=version, created_at=now, updated_at=now)
+        .on_conflict_do_update(
+            index_elements=["name"], set_={"version": version, "updated_at": now}
+        )
+    )
+    return version
+
+
+def compile_rules(session: Session) -> RuleTable:
+    """waterings テーブル全体を規則の表にする"""
+    version = get_catalog_version(session)
+    rules = []
+    for watering in session.exec(select(models.Watering).order_by(models.Watering.id)):
+        try:
+            rules.append(WateringRule.compile(watering))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"水やりデータ {watering.id} を読み込めませんでした: {e}")
+    return RuleTable(rules, version)
+
+
+class RuleRegistry:
+    """
+    規則の表をメモリに保持する。
+    check_interval 秒ごとに catalog_versions を確認し、変わっていれば作り直す。
+    """
+
+    def __init__(self, check_interval: float = RULES_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._table: Optional[RuleTable] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, session: Session) -> RuleTable:
+        with self._lock:
+            now = time.monotonic()
+            if self._table is not None and now - self._checked_at < self.check_interval:
+                return self._table
+            self._checked_at = now
+            if self._table is None or get_catalog_version(session) != self._table.version:
+                self._table = compile_rules(session)
+                logger.info(f"水やりの規則を読み込みました: {len(self._table)} 件")
+            return self._table
+
+    def invalidate(self):
+        with self._lock:
+            self._table = None
+
+
+registry = RuleRegistry()
@@ -0,0 +1,425 @@
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import Callable, Optional
+
+from sqlmodel import Session, select
+
+from app import handler as watering
+from app import models, notifications, rules
+from app.delivery import Sender
+from app.partition import EvaluationTask, ShardedEvaluator
+from app.partition import evaluator as default_evaluator
+from app.rules import WateringRule
+
+logger = getLogger(__name__)
+
+# 判定待ちがない場合も、この秒数ごとに起きて保守処理を行う
+SCHEDULER_IDLE_SECONDS = float(os.getenv("SCHEDULER_IDLE_SECONDS", "60"))
+# 判定しても状態が変わらなかった場合に再判定するまでの秒数
+SCHEDULER_RETRY_SECONDS = float(os.getenv("SCHEDULER_RETRY_SECONDS", "60"))
+# 他のプロセスで登録が変更されていないかを確認する間隔（秒）
+SCHEDULER_SYNC_SECONDS = float(os.getenv("SCHEDULER_SYNC_SECONDS", "60"))
+
+# catalog_versions の名前。登録を追加・削除したプロセスが更新する
+REGISTRATIONS = "registed_plants"
+
+# (user_id, plant_id, device_id)
+RegistrationKey = tuple[str, int, int]
+
+
+@dataclass(frozen=True)
+class HumidityWatch:
+    """湿度が low 未満もしくは high より大きくなったら再判定する"""
+
+    low: float
+    high: float
+
+    def triggered(self, humidity: float) -> bool:
+        return humidity < self.low or humidity > self.high
+
+
+@dataclass
+class _Registration:
+    row: watering.RegistrationRow
+    watches: list[HumidityWatch] = field(default_factory=list)
+
+
+class WateringScheduler:
+    """
+    次に判定が必要な時刻をキーにしたヒープで、登録ごとの水やり判定を行う。
+
+    - 日数で判定する植物は、次に水やりが必要になる日の0時に判定する
+    - 湿度で判定する植物や水やり効果の判定待ちの登録は、センサー値がしきい値を
+      越えたとき (on_sample) に判定する
+    - 当日通知済みの登録は翌日の0時まで判定しない
+    - 登録の追加・削除は add() / remove() で反映する。他のプロセス（別の Webhook の
+      ワーカー）での変更は catalog_versions の REGISTRATIONS で検知し、sync_interval 秒ごとに反映する
+    - 登録を読み込む前（リースを持たず run_due を呼ばないプロセスなど）の add() / remove() は
+      何もしない。読み込むときにデータベースの登録をすべて読むため
+
+    判定に使う登録・水やりの規則・最新の通知はメモリに保持するため、判定待ちがない間は
+    規則と登録の更新の確認以外でデータベースにアクセスしない。
+    """
+
+    def __init__(
+        self,
+        read_humidity: Optional[Callable[[int], float]] = None,
+        sync_interval: float = SCHEDULER_SYNC_SECONDS,
+        evaluator: Optional[ShardedEvaluator] = None,
+    ):
+        self.read_humidity = read_humidity or watering.get_humidity
+        self.evaluator = evaluator or default_evaluator
+        self.sync_interval = sync_interval
+        self.month: Optional[int] = None
+        self.rules_version: Optional[int] = None
+        self.registrations_version: Optional[int] = None
+        self._synced_at = 0.0
+        self.evaluations = 0
+        self.triggers = 0
+        self.wake = threading.Event()
+        self._heap: list[tuple[float, int, RegistrationKey]] = []
+        self._due: dict[RegistrationKey, float] = {}
+        self._seq = itertools.count()
+        self._registrations: dict[RegistrationKey, _Registration] = {}
+        self._watches: dict[int, set[RegistrationKey]] = {}
+        self._rules: dict[int, WateringRule] = {}
+        self._latest: dict[tuple[str, int], models.NotificationHistory] = {}
+        self._pending: set[RegistrationKey] = set()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._registrations)
+
+    # ヒープの操作（呼び出し側でロックを取る）
+
+    def _schedule(self, key: RegistrationKey, due: float):
+        # 古いエントリはヒープに残し、取り出したときに _due と比べて捨てる
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, next(self._seq), key))
+
+    def _unwatch(self, key: RegistrationKey):
+        registration = self._registrations.get(key)
+        if registration is None or not registration.watches:
+            return
+        registration.watches = []
+        keys = self._watches.get(registration.row.device_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._watches[registration.row.device_id]
+
+    def _discard(self, key: RegistrationKey):
+        self._unwatch(key)
+        self._registrations.pop(key, None)
+        self._due.pop(key, None)
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            while self._heap:
+                due, _, key = self._heap[0]
+                if self._due.get(key) == due:
+                    return due
+                heapq.heappop(self._heap)
+            return None
+
+    def pop_due(self, now: float) -> list[RegistrationKey]:
+        keys = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, _, key = heapq.heappop(self._heap)
+                if self._due.get(key) == due:
+                    del self._due[key]
+                    keys.append(key)
+        return keys
+
+    # 登録の変更
+
+    def add(self, user_id: str, plant_id: int, device_id: int):
+        """登録を追加する。植物名などは次の run_due で読み込む"""
+        with self._lock:
+            if self.month is None:
+                return
+            key = (user_id, plant_id, device_id)
+            self._pending.add(key)
+            self._schedule(key, 0)
+        self.wake.set()
+
+    def remove(self, user_id: str, plant_id: int, device_id: int):
+        with self._lock:
+            if self.month is None:
+                return
+            key = (user_id, plant_id, device_id)
+            self._pending.discard(key)
+            self._discard(key)
+
+    def invalidate(self):
+        """
+        保持している登録を捨て、次の run_due で全登録を読み込み直す
+        （リースを引き継いだとき・手放したときなど）
+        """
+        with self._lock:
+            self.month = None
+            for key in list(self._registrations):
+                self._discard(key)
+            self._heap.clear()
+            self._due.clear()
+            self._pending.clear()
+
+    def load(self, session: Session, current_time: datetime):
+        """全登録を読み込み、すべてすぐに判定するようにする"""
+        # 読み込み中の変更は次の確認で反映する
+        registrations_version = rules.get_catalog_version(session, REGISTRATIONS)
+        registrations = watering.get_registrations(session)
+        table = rules.registry.get(session)
+        latest = watering.get_latest_notifications(session)
+        with self._lock:
+            for key in list(self._registrations):
+                self._discard(key)
+            self._heap.clear()
+            self._pending.clear()
+            self._rules = table.for_month(current_time.month)
+            self.rules_version = table.version
+            self._latest = latest
+            for row in registrations:
+                key = (row.user_id, row.plant_id, row.device_id)
+                self._registrations[key] = _Registration(row)
+                self._schedule(key, 0)
+            self.month = current_time.month
+            self.registrations_version = registrations_version
+            self._synced_at = current_time.timestamp()
+        logger.info(f"水やりチェックの対象を読み込みました: {len(registrations)} 件")
+
+    def _load_pending(self, session: Session, current_time: datetime):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        for user_id, plant_id, device_id in pending:
+            row = session.exec(
+                select(
+                    models.Registed.user_id,
+                    models.Registed.plant_id,
+                    models.Registed.device_id,
+                    models.Plant.name_jp,
+                )
+                .join(models.Plant, models.Plant.id == models.Registed.plant_id)
+                .where(
+                    models.Registed.user_id == user_id,
+                    models.Registed.plant_id == plant_id,
+                    models.Registed.device_id == device_id,
+                )
+            ).first()
+            if row is None:
+                continue
+            latest = watering.get_latest_notification(session, user_id, plant_id)
+            with self._lock:
+                key = (user_id, plant_id, device_id)
+                if key not in self._due:
+                    # 読み込み中に削除された
+                    continue
+                self._unwatch(key)
+                self._registrations[key] = _Registration(watering.RegistrationRow(*row))
+                if latest is not None:
+                    self._latest[(user_id, plant_id)] = latest
+
+    def _sync_registrations(self, session: Session, current_time: datetime):
+        """他のプロセスで追加・削除された登録を反映する"""
+        self._synced_at = current_time.timestamp()
+        version = rules.get_catalog_version(session, REGISTRATIONS)
+        if version == self.registrations_version:
+            return
+        stored = set(
+            session.exec(
+                select(
+                    models.Registed.user_id,
+                    models.Registed.plant_id,
+                    models.Registed.device_id,
+                )
+            ).all()
+        )
+        with self._lock:
+            known = set(self._registrations) | self._pending
+        added, removed = stored - known, known - stored
+        for key in added:
+            self.add(*key)
+        for key in removed:
+            self.remove(*key)
+        self.registrations_version = version
+        if added or removed:
+            logger.info(
+                f"他のプロセスでの登録の変更を反映しました: 追加 {len(added)} 件, 削除 {len(removed)} 件"
+            )
+
+    def _apply_rules(self, table: rules.RuleTable, current_time: datetime):
+        """水やりの規則が更新されたので、すべての登録をすぐに判定し直す"""
+        with self._lock:
+            self._rules = table.for_month(current_time.month)
+            self.rules_version = table.version
+            for key in list(self._registrations):
+                self._unwatch(key)
+                self._schedule(key, 0)
+        logger.info("水やりの規則が更新されたため、すべての登録を判定し直します")
+
+    # センサー
+
+    def on_sample(self, ts: float, values: list[Optional[int]]):
+        """SensorSampler のリスナー。しきい値を越えた登録をすぐに判定するようにする"""
+        triggered = False
+        with self._lock:
+            for channel in list(self._watches):
+                if channel >= len(values) or values[channel] is None:
+                    continue
+                humidity = self.read_humidity(channel)
+                for key in list(self._watches.get(channel, ())):
+                    registration = self._registrations[key]
+                    if any(w.triggered(humidity) for w in registration.watches):
+                        self._unwatch(key)
+                        self._schedule(key, 0)
+                        self.triggers += 1
+                        triggered = True
+        if triggered:
+            self.wake.set()
+
+    # 判定
+
+    def run_due(
+        self, session: Session, sender: Sender, current_time: datetime
+    ) -> int:
+        """判定時刻を過ぎた登録を判定する。判定した件数を返す"""
+        if self.month != current_time.month:
+            # 月が変わると水やりの規則が変わるため読み込み直す
+            self.load(session, current_time)
+        else:
+            table = rules.registry.get(session)
+            if table.version != self.rules_version:
+                self._apply_rules(table, current_time)
+            if current_time.timestamp() - self._synced_at >= self.sync_interval:
+                self._sync_registrations(session, current_time)
+        if self._pending:
+            self._load_pending(session, current_time)
+
+        now = current_time.timestamp()
+        keys = self.pop_due(now)
+        done: set[RegistrationKey] = set()
+        try:
+            entries, tasks = [], []
+            for key in keys:
+                with self._lock:
+                    registration = self._registrations.get(key)
+                if registration is None:
+                    done.add(key)
+                    continue
+                row = registration.row
+                rule = self._rules.get(row.plant_id)
+                if rule is None:
+                    # 月が変わって読み込み直すまで判定しない
+                    logger.warning(
+                        f"植物 {row.plant_id} の {current_time.month} 月の水やりデータがありません"
+                    )
+                    done.add(key)
+                    continue
+                try:
+                    humidity = self.read_humidity(row.device_id)
+                except Exception as e:
+                    # センサーを読めない登録は後で判定し直し、他の登録の判定は続ける
+                    logger.error(f"センサー {row.device_id} の値を読み取れません: {e}")
+                    continue
+                latest = self._latest.get((row.user_id, row.plant_id))
+                entries.append((key, row, rule, latest, humidity))
+                tasks.append(
+                    EvaluationTask(row, rule, watering.NotificationSnapshot.of(latest), humidity)
+                )
+
+            # 判定が多い場合（月初めや規則の更新後）はプロセスに分けて判定する
+            plans = self.evaluator.evaluate(tasks, current_time)
+            for (key, row, rule, latest, humidity), planned in zip(entries, plans):
+                latest = watering.apply_plan(session, sender, planned, latest)
+                self.evaluations += 1
+                done.add(key)
+                with self._lock:
+                    if key not in self._registrations:
+                        continue
+                    if latest is not None:
+                        self._latest[(row.user_id, row.plant_id)] = latest
+                    self._plan(key, rule, latest, humidity, current_time)
+        finally:
+            # 判定できなかった登録はヒープから取り出したままにせず、後で判定し直す
+            with self._lock:
+                for key in keys:
+                    if key not in done and key in self._registrations:
+                        self._schedule(key, now + SCHEDULER_RETRY_SECONDS)
+        # この tick の通知履歴をまとめて書き込む
+        notifications.buffer.flush(session)
+        return len(keys)
+
+    def _plan(
+        self,
+        key: RegistrationKey,
+        rule: WateringRule,
+        latest: Optional[models.NotificationHistory],
+        humidity: float,
+        current_time: datetime,
+    ):
+        """次に判定する時刻と、判定のきっかけにする湿度の範囲を決める"""
+        self._unwatch(key)
+        now = current_time.timestamp()
+        today = current_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        tomorrow = (today + timedelta(days=1)).timestamp()
+        watches = []
+        if (
+            latest is not None
+            and latest.notification_type == "watering"
+            and latest.humidity is not None
+        ):
+            # 水やり効果の判定（前回通知時から湿度が100より大きく変わったとき）
+            watches.append(HumidityWatch(latest.humidity - 100, latest.humidity + 100))
+
+        if latest is not None and latest.sent_at >= today:
+            # 当日通知済み
+            due = tomorrow
+        else:
+            days = rule.interval_days
+            if days is None:
+                due = tomorrow
+                # 土が乾いたとき（湿度が humidity_when_dry 以上）
+                dry = math.nextafter(rule.humidity_when_dry, -math.inf)
+                watches.append(HumidityWatch(-math.inf, dry))
+            elif latest is None:
+                # 通知の記録に失敗した
+                due = now + SCHEDULER_RETRY_SECONDS
+            else:
+                due_date = latest.sent_at.date() + timedelta(days=days)
+                due = max(
+                    datetime.combine(due_date, datetime.min.time()).timestamp(),
+                    now + SCHEDULER_RETRY_SECONDS,
+                )
+
+        if any(w.triggered(humidity) for w in watches):
+            # 判定しても状態が変わらなかったので、すぐには再判定しない
+            due = min(due, now + SCHEDULER_RETRY_SECONDS)
+            watches = []
+        registration = self._registrations[key]
+        registration.watches = watches
+        if watches:
+            self._watches.setdefault(registration.row.device_id, set()).add(key)
+        self._schedule(key, due)
+
+    def wait(self, stop_event: threading.Event, max_seconds: float = SCHEDULER_IDLE_SECONDS):
+        """次の判定時刻・センサーのしきい値越え・登録の変更・停止のいずれかまで待つ"""
+        next_due = self.next_due()
+        deadline = time.time() + max_seconds
+        if next_due is not None:
+            deadline = min(deadline, next_due)
+        while not stop_event.is_set():
+            remaining = deadline - time.time()
+            if remaining <= 0 or self.wake.wait(min(1.0, remaining)):
+                break
+        self.wake.clear()
+
+
+watering_scheduler = WateringScheduler()
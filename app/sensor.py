@@ -0,0 +1,257 @@
+import math
+import os
+import random
+import threading
+import time
+from array import array
+from logging import getLogger
+from typing import Callable, Optional
+
+logger = getLogger(__name__)
+
+# spidev: 実機の MCP3008 / fake: ハードウェアなしで動かすための疑似センサー
+SENSOR_BACKEND = os.getenv("SENSOR_BACKEND", "spidev")
+SENSOR_SPI_BUS = int(os.getenv("SENSOR_SPI_BUS", "0"))
+SENSOR_SPI_DEVICE = int(os.getenv("SENSOR_SPI_DEVICE", "0"))
+SENSOR_SPI_SPEED_HZ = int(os.getenv("SENSOR_SPI_SPEED_HZ", "1350000"))  # 1.35MHz
+# 全チャンネルを読む頻度と、チャンネルごとに保持するサンプル数
+SENSOR_SAMPLE_HZ = float(os.getenv("SENSOR_SAMPLE_HZ", "1"))
+SENSOR_BUFFER_SIZE = int(os.getenv("SENSOR_BUFFER_SIZE", "600"))
+# 水やりの判定に使う平均のサンプル数
+SENSOR_AVERAGE_SAMPLES = int(os.getenv("SENSOR_AVERAGE_SAMPLES", "10"))
+
+NUM_CHANNELS = 8
+
+
+def mcp3008_command(channel: int) -> list[int]:
+    """MCP3008 の指定チャンネルを読むために送る3バイト"""
+    if not 0 <= channel <= 7:
+        raise ValueError("チャンネルは0〜7を指定してください")
+    return [1, (8 + channel) << 4, 0]
+
+
+def mcp3008_value(response: list[int]) -> int:
+    """応答（10bit）を結合してアナログ値に変換"""
+    return ((response[1] & 3) << 8) + response[2]
+
+
+class SpidevBackend:
+    """spidev で MCP3008 を読む。SPI デバイスは1度だけ開いて使い回す。"""
+
+    def __init__(
+        self,
+        bus: int = SENSOR_SPI_BUS,
+        device: int = SENSOR_SPI_DEVICE,
+        max_speed_hz: int = SENSOR_SPI_SPEED_HZ,
+    ):
+        import spidev
+
+        self._spi = spidev.SpiDev()
+        self._spi.open(bus, device)
+        self._spi.max_speed_hz = max_speed_hz
+
+    def read(self, channel: int) -> int:
+        return mcp3008_value(self._spi.xfer2(mcp3008_command(channel)))
+
+    def close(self):
+        self._spi.close()
+
+
+class FakeSpiBackend:
+    """
+    ハードウェアなしで動かすための疑似 MCP3008。
+    チャンネルごとの基準値にゆっくりした変動とノイズを加えた値を返す。
+    """
+
+    def __init__(self, base: Optional[dict[int, int]] = None, seed: int = 0):
+        self.base = {ch: 300 + ch * 50 for ch in range(NUM_CHANNELS)}
+        self.base.update(base or {})
+        self._rng = random.Random(seed)
+        self._started = time.monotonic()
+        self.reads = 0
+
+    def set_value(self, channel: int, value: int):
+        self.base[channel] = value
+
+    def read(self, channel: int) -> int:
+        mcp3008_command(channel)
+        self.reads += 1
+        drift = 20 * math.sin((time.monotonic() - self._started) / 60 + channel)
+        value = self.base[channel] + drift + self._rng.uniform(-5, 5)
+        return max(0, min(1023, int(value)))
+
+    def close(self):
+        pass
+
+
+def create_backend(name: str = SENSOR_BACKEND):
+    if name == "spidev":
+        return SpidevBackend()
+    if name == "fake":
+        return FakeSpiBackend()
+    raise ValueError(f"不明なセンサーバックエンドです: {name}")
+
+
+class RingBuffer:
+    """固定長のリングバッファ（値は 0〜1023 なので符号なし16bitの array に保持する）"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._values = array("H", bytes(2 * size))
+        self._next = 0
+        self.count = 0
+
+    def append(self, value: int):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def latest(self) -> Optional[int]:
+        if not self.count:
+            return None
+        return self._values[self._next - 1]
+
+    def last(self, n: int) -> list[int]:
+        """新しいものから最大 n 件（古い順）"""
+        n = min(n, self.count)
+        start = self._next - n
+        if start >= 0:
+            return self._values[start : self._next].tolist()
+        return self._values[start:].tolist() + self._values[: self._next].tolist()
+
+    def mean(self, n: int) -> Optional[float]:
+        values = self.last(n)
+        if not values:
+            return None
+        return sum(values) / len(values)
+
+
+class SensorSampler:
+    """
+    1つの SPI バックエンドを保持し、全チャンネルを一定の頻度で読んでリングバッファに貯める。
+    水やりの判定はセンサーを直接読まず、メモリ上の最新値や平均値を使う。
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        sample_hz: float = SENSOR_SAMPLE_HZ,
+        buffer_size: int = SENSOR_BUFFER_SIZE,
+        channels: int = NUM_CHANNELS,
+    ):
+        self.backend = backend
+        self.sample_hz = sample_hz
+        self.channels = channels
+        self.buffers = [RingBuffer(buffer_size) for _ in range(channels)]
+        self.last_sampled_at: Optional[float] = None
+        self.samples = 0
+        self.errors = 0
+        self._listeners: list[Callable[[float, list[Optional[int]]], None]] = []
+        self._lock = threading.Lock()
+        # SPI の読み取りは1つずつ行う
+        self._spi_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _backend(self):
+        if self.backend is None:
+            self.backend = create_backend()
+        return self.backend
+
+    def add_listener(self, listener: Callable[[float, list[Optional[int]]], None]):
+        """サンプルごとに (時刻, チャンネルごとの値) を受け取る関数を登録する。値は失敗時 None"""
+        self._listeners.append(listener)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        try:
+            self._backend()
+        except Exception as e:
+            logger.error(f"センサーを開けませんでした: {e}")
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sensor-sampler", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"センサーの読み取りを開始します ({self.sample_hz} Hz)")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._spi_lock:
+            if self.backend is not None:
+                self.backend.close()
+                self.backend = None
+
+    def sample_once(self):
+        """全チャンネルを1回ずつ読む"""
+        values = []
+        with self._spi_lock:
+            backend = self._backend()
+            for channel in range(self.channels):
+                try:
+                    values.append(backend.read(channel))
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"センサー CH{channel} の読み取りに失敗しました: {e}")
+                    values.append(None)
+        sampled_at = time.time()
+        with self._lock:
+            for buffer, value in zip(self.buffers, values):
+                if value is not None:
+                    buffer.append(value)
+            self.samples += 1
+            self.last_sampled_at = sampled_at
+        for listener in self._listeners:
+            try:
+                listener(sampled_at, values)
+            except Exception as e:
+                logger.exception(f"センサー値の処理中にエラーが発生しました: {e}")
+
+    def _run(self):
+        interval = 1 / self.sample_hz if self.sample_hz > 0 else 0
+        next_at = time.monotonic()
+        while not self._stop_event.is_set():
+            self.sample_once()
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay < 0:
+                # 読み取りが間に合わない場合は遅れを取り戻そうとせず次から数え直す
+                next_at = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def latest(self, channel: int) -> Optional[int]:
+        with self._lock:
+            return self.buffers[channel].latest()
+
+    def average(
+        self, channel: int, samples: int = SENSOR_AVERAGE_SAMPLES
+    ) -> Optional[float]:
+        with self._lock:
+            return self.buffers[channel].mean(samples)
+
+    def history(self, channel: int, samples: Optional[int] = None) -> list[int]:
+        with self._lock:
+            buffer = self.buffers[channel]
+            return buffer.last(samples or buffer.size)
+
+    def read(self, channel: int, samples: int = SENSOR_AVERAGE_SAMPLES) -> int:
+        """
+        直近 samples 件の平均値を返す。
+        まだサンプルがない場合（サンプラー停止中など）はその場でセンサーを読む。
+        """
+        if not 0 <= channel < self.channels:
+            raise ValueError(f"チャンネルは0〜{self.channels - 1}を指定してください")
+        value = self.average(channel, samples)
+        if value is None:
+            with self._spi_lock:
+                return self._backend().read(channel)
+        return round(value)
+
+
+sampler = SensorSampler()
@@ -0,0 +1,275 @@
+import os
+import sqlite3
+import threading
+import time
+from logging import getLogger
+from typing import Iterable, Optional
+
+logger = getLogger(__name__)
+
+# センサー値はアプリのデータベースとは別のファイルに保存する
+TIMESERIES_DB_PATH = os.getenv("TIMESERIES_DB_PATH", "./timeseries.db")
+# この件数もしくは秒数ごとにまとめて書き込む
+TIMESERIES_BATCH_SIZE = int(os.getenv("TIMESERIES_BATCH_SIZE", "512"))
+TIMESERIES_FLUSH_INTERVAL = float(os.getenv("TIMESERIES_FLUSH_INTERVAL", "10"))
+# 書き込みに失敗し続けた場合にメモリに残す最大件数。超えた分は古いものから破棄する
+TIMESERIES_MAX_PENDING = int(os.getenv("TIMESERIES_MAX_PENDING", "100000"))
+# 保持期間（日）。0 は無期限
+TIMESERIES_RETENTION_RAW_DAYS = float(os.getenv("TIMESERIES_RETENTION_RAW_DAYS", "2"))
+TIMESERIES_RETENTION_1M_DAYS = float(os.getenv("TIMESERIES_RETENTION_1M_DAYS", "30"))
+TIMESERIES_RETENTION_1H_DAYS = float(os.getenv("TIMESERIES_RETENTION_1H_DAYS", "365"))
+TIMESERIES_RETENTION_1D_DAYS = float(os.getenv("TIMESERIES_RETENTION_1D_DAYS", "0"))
+# 保持期間の削除を行う間隔（秒）
+TIMESERIES_MAINTENANCE_INTERVAL = float(
+    os.getenv("TIMESERIES_MAINTENANCE_INTERVAL", "3600")
+)
+
+# 集計の単位（秒）
+ROLLUPS = {"1m": 60, "1h": 3600, "1d": 86400}
+
+_SCHEMA = [
+    # 時刻は UNIX 時間（秒）の整数。(device_id, ts) の順に並ぶので範囲検索が速い
+    """
+    CREATE TABLE IF NOT EXISTS readings (
+        device_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        value INTEGER NOT NULL,
+        PRIMARY KEY (device_id, ts)
+    ) WITHOUT ROWID
+    """,
+    *(
+        f"""
+        CREATE TABLE IF NOT EXISTS readings_{name} (
+            device_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            sum INTEGER NOT NULL,
+            min INTEGER NOT NULL,
+            max INTEGER NOT NULL,
+            PRIMARY KEY (device_id, bucket)
+        ) WITHOUT ROWID
+        """
+        for name in ROLLUPS
+    ),
+    # 書き込み中のバッチ。readings にまだない値だけを残し、readings と集計の両方に使う
+    """
+    CREATE TEMP TABLE IF NOT EXISTS incoming (
+        device_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        value INTEGER NOT NULL,
+        PRIMARY KEY (device_id, ts)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+class TimeSeriesStore:
+    """
+    センサー値の時系列ストア。
+
+    - append() した値はメモリに貯め、batch_size 件もしくは flush_interval 秒ごとにまとめて書き込む
+    - 書き込み時に 1分・1時間・1日の集計 (件数・合計・最小・最大) も更新する。
+      同じデバイス・同じ秒の値は最初のものだけを保存し、集計にも1回だけ加える
+    - maintain() で保持期間を過ぎたデータを削除する
+    """
+
+    def __init__(
+        self,
+        path: str = TIMESERIES_DB_PATH,
+        batch_size: int = TIMESERIES_BATCH_SIZE,
+        flush_interval: float = TIMESERIES_FLUSH_INTERVAL,
+        retention_days: Optional[dict[str, float]] = None,
+        max_pending: int = TIMESERIES_MAX_PENDING,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.retention_days = {
+            "raw": TIMESERIES_RETENTION_RAW_DAYS,
+            "1m": TIMESERIES_RETENTION_1M_DAYS,
+            "1h": TIMESERIES_RETENTION_1H_DAYS,
+            "1d": TIMESERIES_RETENTION_1D_DAYS,
+        }
+        self.retention_days.update(retention_days or {})
+        self._pending: list[tuple[int, int, int]] = []
+        self._last_flush = time.monotonic()
+        self._last_maintenance = 0.0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def append(self, device_id: int, ts: float, value: int):
+        with self._lock:
+            self._pending.append((device_id, int(ts), int(value)))
+            if (
+                len(self._pending) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush_locked()
+
+    def record_sample(self, ts: float, values: list[Optional[int]]):
+        """SensorSampler のリスナー。チャンネル番号を device_id として保存する。"""
+        for device_id, value in enumerate(values):
+            if value is not None:
+                self.append(device_id, ts, value)
+
+    def write(self, points: Iterable[tuple[int, int, int]]):
+        """(device_id, ts, value) をまとめて書き込む"""
+        with self._lock:
+            self._pending.extend(points)
+            self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        points, self._pending = self._pending, []
+        conn = self._connection()
+        try:
+            with conn:
+                # 同じ秒の値は最初のものだけを残す。集計には readings に実際に書き込んだ値だけを
+                # 加えるため、同じ値を再送しても readings と集計が食い違わない
+                conn.executemany(
+                    "INSERT OR IGNORE INTO incoming (device_id, ts, value) VALUES (?, ?, ?)",
+                    points,
+                )
+                conn.execute(
+                    "DELETE FROM incoming WHERE EXISTS (SELECT 1 FROM readings AS r "
+                    "WHERE r.device_id = incoming.device_id AND r.ts = incoming.ts)"
+                )
+                conn.execute("INSERT INTO readings SELECT device_id, ts, value FROM incoming")
+                for name, seconds in ROLLUPS.items():
+                    # WHERE true は SELECT と ON CONFLICT を区別するために必要
+                    conn.execute(
+                        f"""
+                        INSERT INTO readings_{name} (device_id, bucket, count, sum, min, max)
+                        SELECT device_id, ts - ts % {seconds}, count(*), sum(value),
+                            min(value), max(value)
+                        FROM incoming WHERE true
+                        GROUP BY device_id, ts - ts % {seconds}
+                        ON CONFLICT (device_id, bucket) DO UPDATE SET
+                            count = count + excluded.count,
+                            sum = sum + excluded.sum,
+                            min = min(min, excluded.min),
+                            max = max(max, excluded.max)
+                        """
+                    )
+                conn.execute("DELETE FROM incoming")
+        except sqlite3.Error as e:
+            # ロールバックされたので、次の書き込みで書き直せるよう戻す
+            self._pending = points + self._pending
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+                logger.error(
+                    f"センサー値を書き込めない状態が続いているため、古い値を {overflow} 件破棄しました"
+                    f" (合計 {self.dropped} 件): {e}"
+                )
+            raise
+
+    def maintain(self, now: Optional[float] = None, force: bool = False):
+        """書き込み待ちの値を書き込み、一定の間隔で保持期間を過ぎたデータを削除する"""
+        self.flush()
+        now = time.time() if now is None else now
+        if not force and now - self._last_maintenance < TIMESERIES_MAINTENANCE_INTERVAL:
+            return
+        self._last_maintenance = now
+        deleted = self.apply_retention(now)
+        if any(deleted.values()):
+            logger.info(f"保持期間を過ぎたセンサー値を削除しました: {deleted}")
+
+    def apply_retention(self, now: Optional[float] = None) -> dict[str, int]:
+        now = time.time() if now is None else now
+        deleted = {}
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for level, days in self.retention_days.items():
+                    if not days:
+                        continue
+                    table, column = (
+                        ("readings", "ts") if level == "raw" else (f"readings_{level}", "bucket")
+                    )
+                    cutoff = int(now - days * 86400)
+                    # 主キー (device_id, ts) を使えるようデバイスごとに削除する
+                    deleted[level] = sum(
+                        conn.execute(
+                            f"DELETE FROM {table} WHERE device_id = ? AND {column} < ?",
+                            (device_id, cutoff),
+                        ).rowcount
+                        for device_id in _device_ids(conn, table)
+                    )
+        return deleted
+
+    def query(
+        self, device_id: int, start: float, end: float, resolution: str = "raw"
+    ) -> list[tuple]:
+        """
+        start 以上 end 未満の値を時刻順に返す。
+        raw は (ts, value)、集計は (bucket, count, avg, min, max) のタプル。
+        """
+        with self._lock:
+            self._flush_locked()
+            conn = self._connection()
+            if resolution == "raw":
+                return conn.execute(
+                    "SELECT ts, value FROM readings "
+                    "WHERE device_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                    (device_id, int(start), int(end)),
+                ).fetchall()
+            if resolution not in ROLLUPS:
+                raise ValueError(f"不明な集計の単位です: {resolution}")
+            return conn.execute(
+                f"SELECT bucket, count, CAST(sum AS REAL) / count, min, max "
+                f"FROM readings_{resolution} "
+                f"WHERE device_id = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (device_id, int(start) // ROLLUPS[resolution] * ROLLUPS[resolution], int(end)),
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._flush_locked()
+                self._conn.close()
+                self._conn = None
+
+
+def _device_ids(conn: sqlite3.Connection, table: str) -> list[int]:
+    """
+    テーブルにある device_id の一覧。
+    DISTINCT は全件を走査するため、主キーの先頭列を MIN で飛び飛びにたどる。
+    """
+    return [
+        row[0]
+        for row in conn.execute(
+            f"""
+            WITH RECURSIVE d(device_id) AS (
+                SELECT MIN(device_id) FROM {table}
+                UNION ALL
+                SELECT (SELECT MIN(device_id) FROM {table} WHERE device_id > d.device_id)
+                FROM d WHERE d.device_id IS NOT NULL
+            )
+            SELECT device_id FROM d WHERE device_id IS NOT NULL
+            """
+        )
+    ]
+
+
+store = TimeSeriesStore()
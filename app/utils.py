@@ -3,7 +3,6 @@ import random
 from collections import Counter
 
 import numpy as np
-import timm
 import torch
 import torch.nn as nn
 import torchvision.transforms as transforms
@@ -211,6 +210,8 @@ def get_model(args, n_classes):
             model.classifier[-1] = nn.Linear(num_ftrs, n_classes)
 
     elif args.model in timm_models:
+        import timm
+
         model = timm.create_model(
             args.model, pretrained=args.pretrained, num_classes=n_classes
         )
@@ -0,0 +1,121 @@
+"""
+水やりの仕組み（センサーの読み取り・時系列の保存・水やりチェック・LINEへの送信）を動かす。
+
+uvicorn --workers N で Webhook のワーカーを増やしても、水やりの仕組みは leases テーブルの
+リースを持っている1つのプロセスだけで動かす（WATERING_MODE=lease）。
+Webhook のワーカーとは別のプロセスで動かす場合は、WATERING_MODE=off で uvicorn を起動し、
+次のコマンドで起動する。複数起動しても動くのはリースを持っている1つだけになる。
+
+    uv run python -m app.worker
+"""
+
+import os
+import signal
+import sys
+import threading
+from logging import getLogger
+from typing import Optional
+
+from dotenv import load_dotenv
+from linebot.v3.messaging import ApiClient, Configuration, MessagingApi
+
+from app import db, sensor, timeseries
+from app.config import set_logger
+from app.delivery import DELIVERY_WORKERS, DeliveryService
+from app.handler import handler as watch_handler
+from app.lease import DatabaseLease, LeaseRunner
+from app.scheduler import WateringScheduler, watering_scheduler
+
+logger = getLogger(__name__)
+
+# lease: 各プロセスがリースの取得を試み、取得できたプロセスで動かす
+# off: このプロセスでは動かさない（python -m app.worker で別に起動する）
+WATERING_MODE = os.getenv("WATERING_MODE", "lease")
+WATERING_LEASE_NAME = "watering"
+
+
+class WateringWorker:
+    """水やりの仕組みをまとめて開始・停止する。LeaseRunner の on_start / on_stop に渡す"""
+
+    def __init__(
+        self,
+        delivery_service: DeliveryService,
+        scheduler: WateringScheduler = watering_scheduler,
+    ):
+        self.delivery_service = delivery_service
+        self.scheduler = scheduler
+        self._listening = False
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if not self._listening:
+            # センサー値は時系列ストアにも保存する
+            sensor.sampler.add_listener(timeseries.store.record_sample)
+            # 湿度で判定する植物はセンサー値がしきい値を越えたときに判定する
+            sensor.sampler.add_listener(self.scheduler.on_sample)
+            self._listening = True
+        # 別のプロセスが動かしていた間の登録・通知を読み込み直す
+        self.scheduler.invalidate()
+        sensor.sampler.start()
+        self.delivery_service.start()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=watch_handler,
+            args=(self.delivery_service, self._stop_event, self.scheduler),
+            name="watering-check",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.scheduler.wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.delivery_service.stop()
+        sensor.sampler.stop()
+        timeseries.store.close()
+        self.scheduler.evaluator.close()
+        # リースを手放した後は add() / remove() で登録を溜めない
+        self.scheduler.invalidate()
+
+
+def create_runner(
+    worker: WateringWorker, lease: Optional[DatabaseLease] = None
+) -> LeaseRunner:
+    return LeaseRunner(
+        lease or DatabaseLease(WATERING_LEASE_NAME), worker.start, worker.stop
+    )
+
+
+def main() -> int:
+    load_dotenv()
+    set_logger()
+    channel_access_token = os.getenv("LINE_CHANNEL_ACCESS_TOKEN", None)
+    if channel_access_token is None:
+        print("Specify LINE_CHANNEL_ACCESS_TOKEN as environment variable.")
+        return 1
+    db.create_db_and_tables()
+    configuration = Configuration(access_token=channel_access_token)
+    configuration.connection_pool_maxsize = max(
+        configuration.connection_pool_maxsize, DELIVERY_WORKERS
+    )
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop_event.set())
+
+    with ApiClient(configuration) as api_client:
+        worker = WateringWorker(DeliveryService(MessagingApi(api_client)))
+        runner = create_runner(worker)
+        runner.start()
+        logger.info(f"水やりのリースの取得を開始します ({runner.lease.holder})")
+        while not stop_event.wait(1):
+            pass
+        runner.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Webhook（テキストメッセージ）の同時処理のスループットを計測する。
+
+一時的なSQLiteデータベースに --users 人分の登録を作り、「一覧」とそれ以外のテキストを
+交互に送る。同期セッションのハンドラをスレッドプールで処理する従来方式 (sync) と、
+非同期セッションの app.main.handle_message をイベントループ上で処理する方式 (async) で、
+処理件数/秒とイベントループの最大停止時間を比較する。LINEへの返信は --reply-ms 待つダミーを使う。
+
+    uv run python scripts/bench_async_webhook.py --events 2000 --reply-ms 50
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+TMP = tempfile.TemporaryDirectory()
+os.environ["DB_URL"] = f"sqlite:///{Path(TMP.name) / 'bench.db'}"
+os.environ.pop("ASYNC_DB_URL", None)
+os.environ.setdefault("LINE_CHANNEL_SECRET", "bench")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "bench")
+os.environ["MODEL_WARMUP"] = "0"
+
+from sqlmodel import Session, SQLModel, select
+
+from app import db, main, models
+from app.crud.utils import get_create_user
+from app.dispatcher import EventDispatcher
+
+
+def build_database(users: int, plants: int):
+    SQLModel.metadata.create_all(db.engine)
+    with Session(db.engine) as session:
+        for plant_id in range(1, plants + 1):
+            session.add(
+                models.Plant(id=plant_id, name_jp=f"植物{plant_id}", name_en=f"plant{plant_id}")
+            )
+        for u in range(users):
+            user_id = f"U{u:032x}"
+            session.add(models.User(id=user_id))
+            for i in range(3):
+                session.add(
+                    models.Registed(
+                        user_id=user_id, plant_id=(u + i) % plants + 1, device_id=i
+                    )
+                )
+        session.commit()
+
+
+def make_event(user_id: str, text: str):
+    return SimpleNamespace(
+        source=SimpleNamespace(user_id=user_id),
+        message=SimpleNamespace(text=text),
+        reply_token="bench",
+    )
+
+
+def sync_handle_message(event, reply_ms: float):
+    """変更前の handle_message の「一覧」とそれ以外のテキストの処理"""
+    with Session(db.engine) as session:
+        user = get_create_user(session, event.source.user_id)
+        if "一覧" in event.message.text:
+            registed_plants = session.exec(
+                select(models.Registed).where(models.Registed.user_id == user.id)
+            ).all()
+            "\n".join(
+                f"- {registed.plant.name_jp} (ID: {registed.plant.id})"
+                for registed in registed_plants
+            )
+    time.sleep(reply_ms / 1000)
+
+
+class FakeAsyncMessagingApi:
+    def __init__(self, reply_ms: float):
+        self.reply_ms = reply_ms
+
+    async def reply_message_with_http_info(self, reply_message_request):
+        await asyncio.sleep(self.reply_ms / 1000)
+
+
+async def monitor_loop(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """イベントループが止まっていた最大時間を返す"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run(mode: str, args) -> tuple[float, float]:
+    main.async_line_bot_api = FakeAsyncMessagingApi(args.reply_ms)
+    dispatcher = EventDispatcher(max_pending=args.events)
+    dispatcher.start()
+    executor = ThreadPoolExecutor(args.workers, thread_name_prefix="webhook")
+    if mode == "sync":
+
+        async def func(event):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(executor, sync_handle_message, event, args.reply_ms)
+
+    else:
+        func = main.handle_message
+
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop(stop))
+    started = time.perf_counter()
+    for i in range(args.events):
+        user_id = f"U{i % args.users:032x}"
+        text = "一覧" if i % 2 == 0 else "こんにちは"
+        await dispatcher.submit(user_id, func, make_event(user_id, text))
+    await dispatcher.shutdown()
+    executor.shutdown()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return args.events / elapsed, await monitor
+
+
+async def main_async():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--plants", type=int, default=20)
+    parser.add_argument("--reply-ms", type=float, default=50, help="返信APIの応答時間")
+    parser.add_argument("--workers", type=int, default=8, help="sync のワーカースレッド数")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    build_database(args.users, args.plants)
+    print(f"{'mode':>6} {'events/s':>10} {'loop_stall_ms':>14}")
+    for mode in ("sync", "async"):
+        throughput, stall = await run(mode, args)
+        print(f"{mode:>6} {throughput:>10.1f} {stall * 1000:>14.1f}")
+    await db.async_engine.dispose()
+    db.engine.dispose()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main_async())
+    finally:
+        TMP.cleanup()
@@ -0,0 +1,102 @@
+"""
+推論バックエンドごとの精度チェックとベンチマーク。
+
+fp32 (eager) のモデルを基準として、各バックエンドについて以下を表示する。
+- 予測クラスの一致率と softmax 確率の最大誤差（サンプル画像に対して）
+- バッチサイズ1のレイテンシと、バッチサイズ --batch-size のスループット
+
+サンプル画像は --images で指定したディレクトリのJPEG/PNGを使う。指定がなければ乱数画像を使う。
+
+    uv run python scripts/bench_backends.py --images ./samples --backends eager torchscript dynamic_int8
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from app import ai, backends
+
+
+def load_samples(loaded: ai.LoadedModel, images_dir: Path, count: int) -> torch.Tensor:
+    if images_dir:
+        paths = sorted(
+            p
+            for p in images_dir.iterdir()
+            if p.suffix.lower() in {".jpg", ".jpeg", ".png"}
+        )[:count]
+        tensors = [loaded.preprocess(Image.open(p).convert("RGB")) for p in paths]
+        return torch.stack(tensors)
+    generator = torch.Generator().manual_seed(0)
+    return torch.randn(
+        count, 3, loaded.crop_size, loaded.crop_size, generator=generator
+    )
+
+
+def timeit(fn, repeat: int) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=list(backends.BACKENDS))
+    parser.add_argument("--images", type=Path, default=None)
+    parser.add_argument("--samples", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--rebuild", action="store_true", help="キャッシュ済みの変換結果を削除して作り直す"
+    )
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    reference = ai.load_model(backend="eager")
+    samples = load_samples(reference, args.images, args.samples)
+    reference_probs = F.softmax(reference.model(samples), dim=1)
+
+    print(
+        f"{'backend':>13} {'load_s':>7} {'agree':>7} {'max_diff':>9} "
+        f"{'p50_ms(bs=1)':>13} {'img/s(bs=' + str(args.batch_size) + ')':>12}"
+    )
+    for backend in args.backends:
+        if args.rebuild:
+            # 変換済みモデルは load_model が実際に読み込んだ重みファイルの隣に保存される
+            backends.artifact_path(reference.weights_file, backend).unlink(missing_ok=True)
+        started = time.perf_counter()
+        loaded = ai.load_model(backend=backend)
+        load_time = time.perf_counter() - started
+        if loaded.backend != backend:
+            print(f"{backend:>13} 変換に失敗しました")
+            continue
+
+        probs = F.softmax(loaded.model(samples), dim=1)
+        agreement = (probs.argmax(1) == reference_probs.argmax(1)).float().mean().item()
+        max_diff = (probs - reference_probs).abs().max().item()
+
+        single = samples[:1]
+        batch = samples[: args.batch_size]
+        loaded.model(batch)  # ウォームアップ
+        latency = statistics.median(timeit(lambda: loaded.model(single), args.repeat))
+        batch_time = statistics.median(timeit(lambda: loaded.model(batch), args.repeat))
+
+        print(
+            f"{backend:>13} {load_time:>7.2f} {agreement:>7.1%} {max_diff:>9.5f} "
+            f"{latency * 1000:>13.1f} {len(batch) / batch_time:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+テキストメッセージの会話の状態の管理 (app/conversation.py) のベンチマーク。
+
+--users 人がそれぞれ同じ流れの会話（挨拶・一覧・登録・画像の予測結果の確認・センサー番号の入力・
+削除モードの開始と終了・植物の削除）を --rounds 回行う。メッセージごとに users を読み、
+状態を変えるたびにコミットする従来の処理 (legacy) と、conversation.store を使う
+app.main の処理 (store) で、メッセージあたりのSQL文・コミット数と処理件数/秒を比較する。
+画像の予測は、予測結果を会話の状態に書き込む部分だけを再現する。
+
+    uv run python scripts/bench_conversation.py --users 200 --rounds 5
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+TMP = tempfile.TemporaryDirectory()
+os.environ["DB_URL"] = f"sqlite:///{Path(TMP.name) / 'bench.db'}"
+os.environ.pop("ASYNC_DB_URL", None)
+os.environ.setdefault("LINE_CHANNEL_SECRET", "bench")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "bench")
+os.environ["MODEL_WARMUP"] = "0"
+
+from sqlalchemy import delete, event
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, SQLModel, or_, select
+
+from app import conversation, db, main, models
+from app.crud.utils import get_create_user_async, plant_regist_async
+
+
+class FakeAsyncMessagingApi:
+    async def reply_message_with_http_info(self, reply_message_request):
+        pass
+
+
+class FakeScheduler:
+    def add(self, *args):
+        pass
+
+    def remove(self, *args):
+        pass
+
+
+def build_database(plants: int):
+    SQLModel.metadata.create_all(db.engine)
+    with Session(db.engine) as session:
+        for plant_id in range(1, plants + 1):
+            session.add(
+                models.Plant(
+                    id=plant_id,
+                    name_jp=f"植物{plant_id}",
+                    name_en=f"plant{plant_id}",
+                    description="日当たりの良い場所に置いてください",
+                )
+            )
+        session.commit()
+
+
+def script(user_index: int, plants: int) -> list[tuple[str, object]]:
+    """1回分の会話。("text", 本文) か ("predict", 植物ID)"""
+    plant_id = user_index % plants + 1
+    return [
+        ("text", "こんにちは"),
+        ("text", "一覧"),
+        ("text", "登録"),
+        ("predict", plant_id),
+        ("text", "はい"),
+        ("text", "1"),
+        ("text", "一覧"),
+        ("text", "削除"),
+        ("text", "キャンセル"),
+        ("text", "削除"),
+        ("text", f"植物{plant_id}"),
+        ("text", "ありがとう"),
+    ]
+
+
+async def legacy_text(session, user_id: str, text: str):
+    """変更前の handle_message と同じ順序でクエリとコミットを行う"""
+    user = await get_create_user_async(session, user_id)
+
+    async def registed_plants():
+        return (
+            await session.exec(
+                select(models.Registed)
+                .where(models.Registed.user_id == user.id)
+                .options(selectinload(models.Registed.plant))
+            )
+        ).all()
+
+    if user.delete_mode:
+        plant = (
+            await session.exec(
+                select(models.Plant).where(
+                    or_(
+                        models.Plant.id == text,
+                        models.Plant.name_jp == text,
+                        models.Plant.name_en == text,
+                    )
+                )
+            )
+        ).first()
+        if "キャンセル" == text or "終了" == text:
+            user.delete_mode = False
+            session.add(user)
+            await session.commit()
+        elif plant is not None:
+            registed = (
+                await session.exec(
+                    select(models.Registed).where(
+                        models.Registed.plant_id == plant.id,
+                        models.Registed.user_id == user.id,
+                    )
+                )
+            ).first()
+            await session.delete(registed)
+            await session.commit()
+            user.delete_mode = False
+            session.add(user)
+            await session.commit()
+    elif "登録" == text:
+        pass
+    elif "一覧" in text:
+        await registed_plants()
+    elif "削除" == text:
+        if await registed_plants():
+            user.delete_mode = True
+            session.add(user)
+            await session.commit()
+    elif user.current_predict:
+        if "はい" in text:
+            user.awaiting_device_id = user.current_predict
+        user.current_predict = None
+        session.add(user)
+        await session.commit()
+    elif user.awaiting_device_id:
+        device_id = int(text.strip())
+        if await plant_regist_async(session, user.awaiting_device_id, user.id, device_id):
+            await session.exec(
+                select(models.Plant).where(models.Plant.id == user.awaiting_device_id)
+            )
+            user.awaiting_device_id = 0
+            session.add(user)
+            await session.commit()
+
+
+async def legacy_predict(session, user_id: str, plant_id: int):
+    user = await get_create_user_async(session, user_id)
+    user.current_predict = plant_id
+    session.add(user)
+    await session.commit()
+
+
+async def store_text(session, user_id: str, text: str):
+    await main.handle_message(
+        SimpleNamespace(
+            source=SimpleNamespace(user_id=user_id),
+            message=SimpleNamespace(text=text),
+            reply_token="bench",
+        )
+    )
+
+
+async def store_predict(session, user_id: str, plant_id: int):
+    state = await conversation.store.get(session, user_id)
+    await conversation.store.update(session, state, current_predict=plant_id)
+
+
+async def run(mode: str, args) -> dict:
+    with Session(db.engine) as session:
+        session.exec(delete(models.Registed))
+        session.exec(delete(models.User))
+        session.commit()
+    conversation.store = conversation.ConversationStateStore()
+    text, predict = (legacy_text, legacy_predict) if mode == "legacy" else (store_text, store_predict)
+    counter = {"statements": 0, "commits": 0}
+    engine = db.async_engine.sync_engine
+
+    def count_statement(*_):
+        counter["statements"] += 1
+
+    def count_commit(*_):
+        counter["commits"] += 1
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    event.listen(engine, "commit", count_commit)
+
+    async def converse(user_index: int):
+        user_id = f"U{user_index:032x}"
+        for _ in range(args.rounds):
+            for kind, value in script(user_index, args.plants):
+                async with db.async_session() as session:
+                    if kind == "text":
+                        await text(session, user_id, value)
+                    else:
+                        await predict(session, user_id, value)
+
+    messages = args.users * args.rounds * len(script(0, args.plants))
+    started = time.perf_counter()
+    await asyncio.gather(*(converse(i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "before_cursor_execute", count_statement)
+    event.remove(engine, "commit", count_commit)
+    with Session(db.engine) as session:
+        remaining = len(session.exec(select(models.Registed)).all())
+    return {
+        "messages": messages,
+        "per_second": messages / elapsed,
+        "statements": counter["statements"] / messages,
+        "commits": counter["commits"] / messages,
+        "remaining": remaining,
+        "stats": conversation.store.stats.snapshot(),
+    }
+
+
+async def main_async():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--plants", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    main.async_line_bot_api = FakeAsyncMessagingApi()
+    main.watering_scheduler = FakeScheduler()
+    build_database(args.plants)
+    print(f"{'mode':>6} {'messages/s':>11} {'SQL文/件':>9} {'コミット/件':>11} {'ヒット率':>8}")
+    for mode in ("legacy", "store"):
+        result = await run(mode, args)
+        hit_rate = f"{result['stats']['hit_rate']:.2f}" if mode == "store" else "-"
+        print(
+            f"{mode:>6} {result['per_second']:>11.0f} {result['statements']:>9.2f} "
+            f"{result['commits']:>11.2f} {hit_rate:>8}"
+        )
+        # 登録と削除を同じ回数行うので、最後は登録が残らない
+        assert result["remaining"] == 0, result["remaining"]
+    await db.async_engine.dispose()
+    db.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
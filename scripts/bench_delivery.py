@@ -0,0 +1,179 @@
+"""
+LINEへの送信 (app/delivery.py) のベンチマーク。
+
+偽サーバー (fake_line_server.py) に対して、--users 人に合計 --messages 件の通知を送る。
+通知の本文は --plants 種類の植物の水やり通知のいずれかで、同じ植物なら同じ本文になる。
+1件ずつその場でプッシュする従来の方式 (inline) と、outbox 経由で DeliveryService が
+まとめて送る方式 (outbox: 同じ本文はマルチキャスト、残りはユーザーごとに最大5件のプッシュ) の
+所要時間・APIの呼び出し回数・コネクション数を表示する。
+outbox では偽サーバーがエラーを返したり応答を失ったりしても、すべてのメッセージが
+一度だけ届くこと、送信レートが --rate 以下に収まることも確認する。
+
+    uv run python scripts/bench_delivery.py --messages 2000 --users 1000 --plants 20
+"""
+
+import argparse
+import logging
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from fake_line_server import FakeLineServer
+from linebot.v3.messaging import ApiClient, Configuration, MessagingApi
+from sqlmodel import Session, SQLModel, func, select
+
+from app import db, models
+from app.delivery import DELIVERY_MULTICAST_MIN_RECIPIENTS, DeliveryService, DirectSender
+
+
+def make_messages(
+    messages: int, users: int, plants: int, seed: int = 0
+) -> list[tuple[str, str]]:
+    """(ユーザー, 植物) の重複がない (user_id, text) のリスト"""
+    rng = random.Random(seed)
+    pairs = set()
+    while len(pairs) < min(messages, users * plants):
+        pairs.add((rng.randrange(users), rng.randrange(plants)))
+    return [
+        (f"U{user:032x}", f"植物{plant}の水やりが必要です。\n水やり頻度: 3日に1回\n水やり量: たっぷり")
+        for user, plant in sorted(pairs, key=lambda pair: rng.random())
+    ]
+
+
+def messaging_api(server: FakeLineServer, pool_size: int) -> MessagingApi:
+    configuration = Configuration(host=server.url, access_token="dummy")
+    configuration.connection_pool_maxsize = pool_size
+    configuration.retries = 0
+    return MessagingApi(ApiClient(configuration))
+
+
+def bench_inline(messages, latency_ms: float) -> dict:
+    server = FakeLineServer(latency_ms=latency_ms).start()
+    sender = DirectSender(messaging_api(server, 1))
+    started = time.perf_counter()
+    for user_id, text in messages:
+        sender.send(None, user_id, text)
+    elapsed = time.perf_counter() - started
+    server.stop()
+    return {
+        "elapsed": elapsed,
+        "requests": server.requests,
+        "connections": server.connections,
+        "delivered": server.messages(),
+    }
+
+
+def bench_outbox(messages, args, workdir: Path) -> dict:
+    server = FakeLineServer(
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        lost_rate=args.lost_rate,
+        seed=1,
+    ).start()
+    engine = db.create_sqlite_engine(f"sqlite:///{workdir / 'outbox.db'}")
+    SQLModel.metadata.create_all(engine)
+    service = DeliveryService(
+        messaging_api(server, args.workers),
+        engine=engine,
+        workers=args.workers,
+        rate=args.rate,
+        burst=max(1, args.workers),
+        backoff_seconds=0.05,
+        backoff_max_seconds=0.5,
+        poll_seconds=0.05,
+        timeout_seconds=5,
+        multicast_min_recipients=DELIVERY_MULTICAST_MIN_RECIPIENTS if args.multicast else 10**9,
+    )
+    service.start()
+    started = time.perf_counter()
+    with Session(engine) as session:
+        for user_id, text in messages:
+            service.send(session, user_id, text)
+        session.commit()
+    enqueued = time.perf_counter() - started
+    while service.pending_count():
+        time.sleep(0.02)
+    elapsed = time.perf_counter() - started
+    service.stop()
+    with Session(engine) as session:
+        failed = session.exec(
+            select(func.count())
+            .select_from(models.OutboxMessage)
+            .where(models.OutboxMessage.status == "failed")
+        ).one()
+    engine.dispose()
+    server.stop()
+    times = server.request_times
+    peak = max(
+        (sum(1 for t in times if start <= t < start + 1) for start in times[:: max(1, len(times) // 200)]),
+        default=0,
+    )
+    return {
+        "elapsed": elapsed,
+        "enqueued": enqueued,
+        "requests": server.requests,
+        "paths": dict(server.paths),
+        "connections": server.connections,
+        "statuses": dict(sorted(server.statuses.items())),
+        "delivered": server.messages(),
+        "duplicates": server.duplicates(),
+        "failed": failed,
+        "peak_rate": peak,
+        "stats": service.stats.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--plants", type=int, default=20)
+    parser.add_argument(
+        "--no-multicast", dest="multicast", action="store_false", help="マルチキャストを使わない"
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=200, help="送信レートの上限 (リクエスト/秒)")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--lost-rate", type=float, default=0.02)
+    parser.add_argument("--inline-messages", type=int, default=300)
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    messages = make_messages(args.messages, args.users, args.plants)
+
+    inline = bench_inline(messages[: args.inline_messages], args.latency_ms)
+    per_second = args.inline_messages / inline["elapsed"]
+    print(f"inline ({args.inline_messages} 件, エラーなし)")
+    print(f"  所要時間     : {inline['elapsed']:8.2f} s ({per_second:,.0f} 件/s)")
+    print(f"  リクエスト   : {inline['requests']:8d}  コネクション {inline['connections']}")
+    print(
+        f"  {len(messages)} 件の換算 : {len(messages) / per_second:8.2f} s "
+        f"(リクエスト {len(messages)})"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = bench_outbox(messages, args, Path(tmp))
+    print(
+        f"\noutbox ({len(messages)} 件, workers={args.workers}, rate={args.rate:g}/s, "
+        f"エラー率 {args.error_rate:g}, 応答の喪失率 {args.lost_rate:g})"
+    )
+    print(f"  所要時間     : {result['elapsed']:8.2f} s ({len(messages) / result['elapsed']:,.0f} 件/s)")
+    print(f"  outbox に追加: {result['enqueued']:8.2f} s")
+    print(f"  リクエスト   : {result['requests']:8d}  コネクション {result['connections']}")
+    print(f"  パス         : {result['paths']}")
+    print(f"  応答         : {result['statuses']}")
+    print(f"  1回の呼び出し: {result['stats']['messages_per_call']:8.2f} 件")
+    print(f"  最大レート   : {result['peak_rate']:8d} リクエスト/s")
+    print(
+        f"  届いた件数   : {result['delivered']} (重複 {result['duplicates']}, 送信失敗 {result['failed']})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+バッチ推論エンジンのベンチマーク。
+
+複数スレッドから同時に画像を送信し、max_batch_size / max_wait_ms の組み合わせごとに
+スループット、レイテンシ、バッチサイズ、キュー待ち時間を表示する。
+
+    uv run python scripts/bench_inference.py --clients 16 --requests 8
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from PIL import Image
+
+from app.ai import predict_batch
+from app.inference import BatchInferenceEngine
+
+
+def make_jpeg(width: int, height: int, seed: int) -> bytes:
+    img = Image.new("RGB", (width, height), ((seed * 37) % 256, (seed * 91) % 256, 80))
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def run(engine: BatchInferenceEngine, images: list[bytes], clients: int, requests: int):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(client_id: int):
+        for i in range(requests):
+            image = images[(client_id + i) % len(images)]
+            started = time.perf_counter()
+            engine.predict(image)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / total,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[5, 20])
+    parser.add_argument("--image-size", type=int, nargs=2, default=[1024, 768])
+    args = parser.parse_args()
+
+    images = [make_jpeg(*args.image_size, seed) for seed in range(8)]
+    # ウォームアップ
+    predict_batch(images[:1])
+
+    print(
+        f"{'batch':>5} {'wait_ms':>7} {'req/s':>8} {'p50_ms':>8} {'p99_ms':>8} "
+        f"{'avg_bs':>6} {'qwait_p99':>9}"
+    )
+    for max_batch_size in args.batch_sizes:
+        for max_wait_ms in args.max_wait_ms:
+            engine = BatchInferenceEngine(
+                predict_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+            )
+            engine.start()
+            try:
+                result = run(engine, images, args.clients, args.requests)
+            finally:
+                engine.stop()
+            stats = engine.stats.snapshot()
+            print(
+                f"{max_batch_size:>5} {max_wait_ms:>7.0f} {result['throughput']:>8.2f} "
+                f"{result['p50']:>8.1f} {result['p99']:>8.1f} "
+                f"{stats['avg_batch_size']:>6.2f} {stats['queue_wait_ms']['p99']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+推論デーモン (app.inference_service) のベンチマーク。
+
+一時的なソケットで推論デーモンを起動し、--clients 個のプロセス（uvicorn のワーカーの代わり）から
+InferenceClient で同時に画像を送り、スループットとレイテンシ、デーモンでのバッチサイズを表示する。
+--fake を指定すると、モデルの代わりに画像のデコードと一定時間の待ちだけを行うデーモンを使い、
+torch なしでプロセス間通信と共有メモリの受け渡しのオーバーヘッドを測る。
+
+    uv run python scripts/bench_inference_service.py --clients 1 2 4 8 --requests 32
+    uv run python scripts/bench_inference_service.py --fake --batch-ms 20
+"""
+
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from PIL import Image
+
+from app.inference_service import InferenceClient, InferenceServiceError
+
+ROOT = Path(__file__).parent.parent
+
+
+def make_jpeg(width: int, height: int, seed: int) -> bytes:
+    img = Image.new("RGB", (width, height), ((seed * 37) % 256, (seed * 91) % 256, 80))
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def serve_fake(path: str, batch_ms: float):
+    """モデルの代わりに、画像をデコードして batch_ms だけ待つデーモン"""
+    from app.ai import Prediction
+    from app.inference import BatchInferenceEngine
+    from app.inference_service import InferenceServer
+
+    def predict_batch(image_binaries):
+        results = []
+        for image_binary in image_binaries:
+            Image.open(BytesIO(image_binary)).load()
+            results.append(Prediction("1355868", 0.9, (("1355868", 0.9),)))
+        time.sleep(batch_ms / 1000)
+        return results
+
+    async def run():
+        engine = BatchInferenceEngine(predict_batch)
+        engine.start()
+        server = InferenceServer(engine, path)
+        await server.start()
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await stop.wait()
+        await server.close()
+        engine.stop()
+        stats = engine.stats.snapshot()
+        print(f"avg_batch_size {stats['avg_batch_size']:.2f}", flush=True)
+
+    asyncio.run(run())
+
+
+def client(path: str, images: list[bytes], requests: int, start, latencies):
+    inference_client = InferenceClient(path)
+    # 接続と共有メモリの作成を計測に含めない
+    inference_client.predict_batch(images[:1])
+    start.wait()
+    for i in range(requests):
+        started = time.perf_counter()
+        inference_client.predict_batch([images[i % len(images)]])
+        latencies.append(time.perf_counter() - started)
+    inference_client.close()
+
+
+def wait_ready(path: str, timeout: float):
+    inference_client = InferenceClient(path)
+    started = time.perf_counter()
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if inference_client.status()["model_loaded"]:
+                    return
+            except InferenceServiceError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("推論デーモンが起動しませんでした")
+    finally:
+        inference_client.close()
+
+
+def run(path: str, images: list[bytes], clients: int, requests: int) -> dict:
+    ctx = mp.get_context("spawn")
+    manager = ctx.Manager()
+    latencies = manager.list()
+    start = ctx.Barrier(clients + 1)
+    processes = [
+        ctx.Process(target=client, args=(path, images, requests, start, latencies))
+        for _ in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    start.wait()
+    started = time.perf_counter()
+    for process in processes:
+        process.join()
+    total = time.perf_counter() - started
+    values = sorted(latencies)
+    manager.shutdown()
+    return {
+        "throughput": len(values) / total,
+        "p50": statistics.median(values) * 1000,
+        "p99": values[min(len(values) - 1, int(len(values) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--image-size", type=int, nargs=2, default=[1024, 768])
+    parser.add_argument("--fake", action="store_true")
+    parser.add_argument("--batch-ms", type=float, default=20)
+    parser.add_argument("--serve-fake", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_fake:
+        serve_fake(args.serve_fake, args.batch_ms)
+        return
+
+    images = [make_jpeg(*args.image_size, seed) for seed in range(8)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "inference.sock")
+        if args.fake:
+            command = [sys.executable, __file__, "--serve-fake", path]
+            command += ["--batch-ms", str(args.batch_ms)]
+        else:
+            command = [sys.executable, "-m", "app.inference_service"]
+        daemon = subprocess.Popen(
+            command, cwd=ROOT, env={**os.environ, "INFERENCE_SOCKET": path}
+        )
+        try:
+            wait_ready(path, 300)
+            print(f"{'clients':>7} {'req/s':>8} {'p50_ms':>8} {'p99_ms':>8}")
+            for clients in args.clients:
+                result = run(path, images, clients, args.requests)
+                print(
+                    f"{clients:>7} {result['throughput']:>8.2f} "
+                    f"{result['p50']:>8.1f} {result['p99']:>8.1f}"
+                )
+        finally:
+            daemon.send_signal(signal.SIGTERM)
+            daemon.wait(30)
+
+
+if __name__ == "__main__":
+    main()
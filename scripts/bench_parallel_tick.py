@@ -0,0 +1,85 @@
+"""
+水やりの判定をプロセスに分けたときの tick のベンチマーク。
+
+bench_watering_tick.py と同じデータで run_watering_check を実行し、判定を行うプロセス数
+(--workers) ごとの tick の時間を比較する。プロセスの起動時間を含めないよう、
+プロセス数ごとに1回目の tick は計測せずに捨てる。判定の結果（通知の数）が
+プロセス数によらず同じことも確認する。
+
+    uv run python scripts/bench_parallel_tick.py --users 20000 --workers 1 2 4 8
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from bench_watering_tick import FakeLineBotApi, build_database, fake_humidity
+from sqlmodel import Session, create_engine
+
+from app import handler, partition
+from app.delivery import DirectSender
+
+
+def run_tick(base: Path, path: Path, current_time: datetime) -> tuple[float, int]:
+    shutil.copy(base, path)
+    engine = create_engine(f"sqlite:///{path}")
+    line_bot_api = FakeLineBotApi()
+    with Session(engine, expire_on_commit=False) as session:
+        started = time.perf_counter()
+        handler.run_watering_check(
+            session, DirectSender(line_bot_api), current_time, fake_humidity
+        )
+        elapsed = time.perf_counter() - started
+    engine.dispose()
+    return elapsed, line_bot_api.pushed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--plants", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    current_time = datetime.now()
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        base = workdir / "base.db"
+        build_database(base, args.users, args.plants)
+        print(f"ユーザー {args.users} 人, CPU {os.cpu_count()} 個")
+        print(f"{'workers':>8} {'tick (中央値)':>14} {'1 に対する比':>12} {'通知':>8}")
+        baseline = None
+        pushed_by_workers = {}
+        for workers in args.workers:
+            partition.evaluator = partition.ShardedEvaluator(workers, min_tasks=0)
+            try:
+                # 1回目はプロセスの起動を含むため捨てる
+                run_tick(base, workdir / "warmup.db", current_time)
+                timings = []
+                for i in range(args.repeat):
+                    elapsed, pushed = run_tick(base, workdir / f"run{i}.db", current_time)
+                    timings.append(elapsed)
+            finally:
+                partition.evaluator.close()
+            median = sorted(timings)[len(timings) // 2]
+            baseline = baseline or median
+            pushed_by_workers[workers] = pushed
+            print(f"{workers:>8} {median:>12.3f} s {baseline / median:>11.2f}x {pushed:>8}")
+        if len(set(pushed_by_workers.values())) != 1:
+            print(f"[NG] プロセス数によって通知の数が違います: {pushed_by_workers}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
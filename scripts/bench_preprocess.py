@@ -0,0 +1,136 @@
+"""
+画像の前処理のベンチマーク。
+
+torchvision の Compose（PIL で全解像度デコード → Resize → CenterCrop → ToTensor → Normalize）と
+FastPreprocessor（draft デコード → 切り出し範囲のみの resize → 確保済みテンソル上で正規化）を
+段階ごとに計測する。--images でJPEGのディレクトリを指定しない場合は 12MP の画像を生成して使う。
+
+    uv run python scripts/bench_preprocess.py --images ./photos --batch-size 8
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from app.preprocess import IMAGENET_MEAN, IMAGENET_STD, FastPreprocessor
+
+
+def make_corpus(count: int) -> list[bytes]:
+    rng = np.random.default_rng(0)
+    corpus = []
+    for _ in range(count):
+        # 写真に近いデータ量になるよう、なめらかな模様にノイズを足す
+        base = rng.integers(0, 256, (30, 40, 3), dtype=np.uint8)
+        img = Image.fromarray(base).resize((4032, 3024), Image.BICUBIC)
+        noise = rng.integers(-12, 12, (3024, 4032, 3))
+        pixels = np.clip(np.asarray(img).astype(np.int16) + noise, 0, 255)
+        buf = BytesIO()
+        Image.fromarray(pixels.astype(np.uint8)).save(buf, format="JPEG", quality=90)
+        corpus.append(buf.getvalue())
+    return corpus
+
+
+def stage(timings: dict, name: str, started: float) -> float:
+    now = time.perf_counter()
+    timings.setdefault(name, []).append(now - started)
+    return now
+
+
+def bench_baseline(corpus: list[bytes], image_size: int, crop_size: int) -> dict:
+    resize = transforms.Resize(image_size)
+    crop = transforms.CenterCrop(crop_size)
+    to_tensor = transforms.ToTensor()
+    normalize = transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    timings: dict = {}
+    for image_binary in corpus:
+        t = time.perf_counter()
+        img = Image.open(BytesIO(image_binary)).convert("RGB")
+        t = stage(timings, "decode", t)
+        img = crop(resize(img))
+        t = stage(timings, "resize+crop", t)
+        tensor = normalize(to_tensor(img))
+        stage(timings, "tensor+normalize", t)
+    timings["_last"] = tensor
+    return timings
+
+
+def bench_fast(corpus: list[bytes], preprocessor: FastPreprocessor) -> dict:
+    timings: dict = {}
+    for image_binary in corpus:
+        t = time.perf_counter()
+        array = preprocessor.load(image_binary)
+        t = stage(timings, "decode+resize+crop", t)
+        tensor = preprocessor.to_tensor([array])
+        stage(timings, "tensor+normalize", t)
+    timings["_last"] = tensor[0].clone()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=Path, default=None)
+    parser.add_argument("--count", type=int, default=8, help="生成する画像の枚数")
+    parser.add_argument("--image-size", type=int, default=256)
+    parser.add_argument("--crop-size", type=int, default=224)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.images:
+        corpus = [
+            p.read_bytes()
+            for p in sorted(args.images.iterdir())
+            if p.suffix.lower() in {".jpg", ".jpeg"}
+        ]
+    else:
+        corpus = make_corpus(args.count)
+    print(f"{len(corpus)} 枚, 平均 {statistics.mean(map(len, corpus)) / 1e6:.1f} MB")
+
+    preprocessor = FastPreprocessor(args.image_size, args.crop_size)
+
+    for name, timings in (
+        ("torchvision", bench_baseline(corpus, args.image_size, args.crop_size)),
+        ("fast", bench_fast(corpus, preprocessor)),
+    ):
+        last = timings.pop("_last")
+        total = sum(statistics.mean(v) for v in timings.values())
+        print(f"\n[{name}] 1枚あたり合計 {total * 1000:.1f} ms")
+        for stage_name, values in timings.items():
+            print(f"  {stage_name:>20}: {statistics.mean(values) * 1000:8.2f} ms")
+        if name == "torchvision":
+            reference = last
+
+    diff = (reference - last).abs()
+    print(f"\n最後の画像の差分 (正規化後): mean={diff.mean():.4f} max={diff.max():.4f}")
+
+    batch = corpus[: args.batch_size]
+    started = time.perf_counter()
+    preprocessor.load_many(batch)
+    threaded = time.perf_counter() - started
+    started = time.perf_counter()
+    for image_binary in batch:
+        preprocessor.load(image_binary)
+    sequential = time.perf_counter() - started
+    print(
+        f"\nバッチ {len(batch)} 枚のデコード: 逐次 {sequential * 1000:.1f} ms, "
+        f"スレッドプール {threaded * 1000:.1f} ms"
+    )
+
+    torch.set_num_threads(1)
+    started = time.perf_counter()
+    tensor, _ = preprocessor(batch)
+    print(f"バッチ全体 (FastPreprocessor): {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+水やりの判定のマイクロベンチマーク。
+
+- 判定: 毎回 frequency を小文字にして正規表現で日数を取り出す従来の check_watering_schedule と、
+  コンパイル済みの WateringRule を使う現在の check_watering_schedule の判定回数/秒
+- 水やりデータの取得: 判定ごとに get_watering_data で waterings を引く方式と、
+  rules.registry の表から引く方式の取得回数/秒
+
+    uv run python scripts/bench_rules.py --plants 200 --decisions 200000
+"""
+
+import argparse
+import logging
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from app import handler, models, rules
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_check_watering_schedule(
+    watering_data, current_time, humidity=None, last_watering_date=None
+):
+    """変更前の check_watering_schedule"""
+    logger.info(watering_data)
+    frequency = watering_data.frequency.lower()
+    logger.info(f"Frequency: {frequency}")
+    has_number = re.search(r"\d+", frequency)
+    if has_number:
+        if last_watering_date is None:
+            return True
+        days_match = re.search(r"(\d+)", frequency)
+        if days_match:
+            target_days = int(days_match.group(1))
+            days_since_last_watering = (
+                current_time.date() - last_watering_date.date()
+            ).days
+            logger.info(f"{days_since_last_watering} / {target_days}")
+            return days_since_last_watering >= target_days
+    else:
+        if humidity is None:
+            return False
+        logger.info(f"{humidity} / {watering_data.humidity_when_dry}")
+        return humidity >= watering_data.humidity_when_dry
+    return False
+
+
+def make_waterings(plants: int, seed: int = 0) -> list[models.Watering]:
+    rng = random.Random(seed)
+    waterings = []
+    for plant_id in range(1, plants + 1):
+        for month in range(1, 13):
+            frequency = (
+                f"{rng.randint(2, 14)}日に1回" if plant_id % 2 else "土の表面が乾いたら"
+            )
+            waterings.append(
+                models.Watering(
+                    id=len(waterings) + 1,
+                    plant_id=plant_id,
+                    month=str(month),
+                    frequency=frequency,
+                    amount="鉢底から流れ出るくらい",
+                    humidity_when_dry=500,
+                    humidity_when_watered=300,
+                )
+            )
+    return waterings
+
+
+def rate(func, count: int) -> float:
+    started = time.perf_counter()
+    func()
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--plants", type=int, default=200)
+    parser.add_argument("--decisions", type=int, default=200_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    waterings = make_waterings(args.plants)
+    now = datetime.now()
+    rng = random.Random(1)
+    cases = [
+        (
+            rng.choice(waterings),
+            rng.randint(200, 800),
+            now - timedelta(days=rng.randint(0, 20)),
+        )
+        for _ in range(1000)
+    ]
+    compiled = [(rules.WateringRule.compile(w), h, d) for w, h, d in cases]
+    repeat = max(1, args.decisions // len(cases))
+    decisions = repeat * len(cases)
+
+    def run_legacy():
+        for _ in range(repeat):
+            for watering, humidity, last in cases:
+                legacy_check_watering_schedule(watering, now, humidity, last)
+
+    def run_rules():
+        for _ in range(repeat):
+            for rule, humidity, last in compiled:
+                handler.check_watering_schedule(rule, now, humidity, last)
+
+    for (w, h, d), (r, _, _) in zip(cases, compiled):
+        assert legacy_check_watering_schedule(w, now, h, d) == handler.check_watering_schedule(r, now, h, d)
+
+    print(f"判定 ({decisions:,} 回)")
+    print(f"  regex  : {rate(run_legacy, decisions):12,.0f} 回/s")
+    print(f"  rules  : {rate(run_rules, decisions):12,.0f} 回/s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'rules.db'}")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            for plant_id in range(1, args.plants + 1):
+                session.add(models.Plant(id=plant_id, name_jp=f"植物{plant_id}", name_en=f"p{plant_id}"))
+            session.add_all(make_waterings(args.plants))
+            session.commit()
+
+        keys = [(rng.randint(1, args.plants), rng.randint(1, 12)) for _ in range(args.lookups)]
+        with Session(engine) as session:
+            started = time.perf_counter()
+            table = rules.compile_rules(session)
+            compile_ms = (time.perf_counter() - started) * 1000
+
+            def run_query():
+                for plant_id, month in keys:
+                    handler.get_watering_data(session, month, plant_id)
+
+            def run_table():
+                registry = rules.RuleRegistry()
+                for plant_id, month in keys:
+                    registry.get(session).get(plant_id, month)
+
+            print(f"\n水やりデータの取得 ({args.lookups:,} 回)")
+            print(f"  query  : {rate(run_query, args.lookups):12,.0f} 回/s")
+            print(f"  rules  : {rate(run_table, args.lookups):12,.0f} 回/s")
+            print(f"  規則の表の作成: {compile_ms:.1f} ms ({len(table)} 件)")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+水やりチェックのスケジューラのベンチマーク。
+
+bench_watering_tick.py と同じデータで、60秒ごとに全登録を判定する従来の方式 (scan) と
+WateringScheduler で判定が必要な登録だけを判定する方式 (scheduler) を、--hours 時間分の
+60秒ごとの tick で比較する。scan は時間がかかるため最初の --scan-ticks 回だけ実行して
+1日あたりに換算する。途中 (--dry-at 時間後) でセンサー CH0 の値を乾燥側に変え、
+湿度で判定する植物がしきい値越えで判定されることも確認する。
+
+    uv run python scripts/bench_scheduler.py --users 2000 --hours 48
+"""
+
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from bench_watering_tick import FakeLineBotApi, build_database
+from sqlalchemy import event
+from sqlmodel import Session, create_engine
+
+from app import handler
+from app.delivery import DirectSender
+from app.scheduler import WateringScheduler
+
+TICK = timedelta(seconds=60)
+
+
+class FakeSensor:
+    def __init__(self):
+        self.values = {channel: 300 + channel * 50 for channel in range(8)}
+
+    def read(self, channel: int) -> int:
+        return self.values[channel]
+
+
+def open_engine(base: Path, path: Path):
+    shutil.copy(base, path)
+    engine = create_engine(f"sqlite:///{path}")
+    counter = {"statements": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(*args):
+        counter["statements"] += 1
+
+    return engine, counter
+
+
+def bench_scan(base: Path, workdir: Path, start: datetime, ticks: int) -> dict:
+    engine, counter = open_engine(base, workdir / "scan.db")
+    sensor = FakeSensor()
+    line_bot_api = FakeLineBotApi()
+    timings = []
+    for i in range(ticks):
+        with Session(engine, expire_on_commit=False) as session:
+            started = time.perf_counter()
+            handler.run_watering_check(
+                session, DirectSender(line_bot_api), start + i * TICK, sensor.read
+            )
+            timings.append(time.perf_counter() - started)
+    engine.dispose()
+    # 1回目は通知の送信を含むため、定常状態の tick は2回目以降で見る
+    steady = timings[1:] or timings
+    return {
+        "first": timings[0],
+        "steady": sum(steady) / len(steady),
+        "statements": counter["statements"],
+        "pushed": line_bot_api.pushed,
+    }
+
+
+def bench_scheduler(
+    base: Path, workdir: Path, start: datetime, ticks: int, dry_at: int
+) -> dict:
+    engine, counter = open_engine(base, workdir / "scheduler.db")
+    sensor = FakeSensor()
+    scheduler = WateringScheduler(read_humidity=sensor.read)
+    line_bot_api = FakeLineBotApi()
+    sender = DirectSender(line_bot_api)
+    busy_ticks = 0
+    evaluations_after_dry = 0
+    started = time.perf_counter()
+    first = None
+    for i in range(ticks):
+        if i == dry_at:
+            sensor.values[0] = 800
+            evaluations_before = scheduler.evaluations
+            scheduler.on_sample(time.time(), [sensor.read(ch) for ch in range(8)])
+        with Session(engine, expire_on_commit=False) as session:
+            tick_started = time.perf_counter()
+            evaluated = scheduler.run_due(session, sender, start + i * TICK)
+            if first is None:
+                first = time.perf_counter() - tick_started
+        busy_ticks += evaluated > 0
+        if i == dry_at:
+            evaluations_after_dry = scheduler.evaluations - evaluations_before
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return {
+        "first": first,
+        "total": elapsed,
+        "statements": counter["statements"],
+        "pushed": line_bot_api.pushed,
+        "evaluations": scheduler.evaluations,
+        "busy_ticks": busy_ticks,
+        "triggered": evaluations_after_dry,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--plants", type=int, default=20)
+    parser.add_argument("--hours", type=float, default=48)
+    parser.add_argument("--scan-ticks", type=int, default=5)
+    parser.add_argument("--dry-at", type=float, default=12, help="CH0 を乾燥させる時間")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    ticks = int(args.hours * 60)
+    ticks_per_day = 24 * 60
+    start = datetime.now()
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        base = workdir / "base.db"
+        build_database(base, args.users, args.plants)
+
+        scan = bench_scan(base, workdir, start, args.scan_ticks)
+        print(f"scan ({args.scan_ticks} tick を実行)")
+        print(f"  1回目の tick     : {scan['first']:8.2f} s")
+        print(f"  定常状態の tick  : {scan['steady']:8.3f} s")
+        print(f"  1日あたり (換算) : {scan['steady'] * ticks_per_day:8.1f} s")
+        print(f"  SQL文/tick       : {scan['statements'] / args.scan_ticks:8.0f}")
+
+        result = bench_scheduler(
+            base, workdir, start, ticks, int(args.dry_at * 60)
+        )
+        days = ticks / ticks_per_day
+        print(f"\nscheduler ({ticks} tick = {args.hours:g} 時間を実行)")
+        print(f"  1回目の tick     : {result['first']:8.2f} s")
+        print(f"  1日あたり        : {result['total'] / days:8.1f} s")
+        print(f"  SQL文/日         : {result['statements'] / days:8.0f}")
+        print(f"  判定した件数     : {result['evaluations']} (判定があった tick {result['busy_ticks']})")
+        print(f"  CH0 の乾燥で判定 : {result['triggered']} 件")
+        print(f"  通知             : {result['pushed']}")
+
+
+if __name__ == "__main__":
+    main()
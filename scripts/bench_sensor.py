@@ -0,0 +1,95 @@
+"""
+湿度センサーの読み取りのベンチマーク。
+
+水やりチェック1回分（--registrations 件）の湿度取得について、読み取りのたびにバックエンドを
+作り直す従来の方式 (legacy: 毎回 SpiDev を open して close しない) と、SensorSampler の
+メモリ上の平均値を読む方式 (sampler) を比較する。あわせてサンプラーが全チャンネルを
+読める最大の頻度と、開いているファイルディスクリプタの増加数を表示する。
+実機では --backend spidev を指定する。
+
+    uv run python scripts/bench_sensor.py --backend fake --registrations 10000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app import sensor
+
+
+def open_fds() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except FileNotFoundError:
+        return -1
+
+
+def bench_legacy(backend_name: str, registrations: int) -> tuple[float, int]:
+    fds = open_fds()
+    backends = []
+    started = time.perf_counter()
+    for i in range(registrations):
+        backend = sensor.create_backend(backend_name)
+        backend.read(i % sensor.NUM_CHANNELS)
+        backends.append(backend)  # 従来の実装と同じく閉じない
+    elapsed = time.perf_counter() - started
+    leaked = open_fds() - fds
+    for backend in backends:
+        backend.close()
+    return elapsed, leaked
+
+
+def bench_sampler(backend_name: str, registrations: int, samples: int) -> dict:
+    fds = open_fds()
+    sampler = sensor.SensorSampler(
+        sensor.create_backend(backend_name), sample_hz=0, buffer_size=600
+    )
+    started = time.perf_counter()
+    for _ in range(samples):
+        sampler.sample_once()
+    sample_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(registrations):
+        sampler.read(i % sensor.NUM_CHANNELS)
+    read_elapsed = time.perf_counter() - started
+    leaked = open_fds() - fds
+    sampler.stop()
+    return {
+        "sample_hz": samples / sample_elapsed,
+        "read": read_elapsed,
+        "leaked": leaked,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=("fake", "spidev"), default="fake")
+    parser.add_argument("--registrations", type=int, default=10000)
+    parser.add_argument("--samples", type=int, default=1000, help="頻度の計測に使う全チャンネル読み取り回数")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    legacy, legacy_leaked = bench_legacy(args.backend, args.registrations)
+    result = bench_sampler(args.backend, args.registrations, args.samples)
+
+    print(f"湿度の取得 {args.registrations} 件")
+    print(
+        f"  legacy : {legacy * 1000:10.2f} ms ({legacy / args.registrations * 1e6:8.2f} us/件)"
+        f"  fd 増加 {legacy_leaked}"
+    )
+    print(
+        f"  sampler: {result['read'] * 1000:10.2f} ms"
+        f" ({result['read'] / args.registrations * 1e6:8.2f} us/件)  fd 増加 {result['leaked']}"
+    )
+    print(f"全{sensor.NUM_CHANNELS}チャンネルの最大サンプリング頻度: {result['sample_hz']:.0f} Hz")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+SQLite の同時書き込み・読み込みのベンチマーク。
+
+書き込みスレッドは通知履歴を1件ずつ追加してコミットし、読み込みスレッドは最新の通知を
+繰り返し取得する。従来の設定 (create_engine のみ) と db.create_sqlite_engine の設定で、
+コミットのレイテンシ (p50/p99)、"database is locked" などのエラー数、読み込み回数を比較する。
+
+    uv run python scripts/bench_sqlite_concurrency.py --writers 4 --readers 8 --seconds 10
+"""
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine
+
+from app import db, handler, models
+
+USER_ID = "U0000000000000000000000000000000"
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def prepare(engine):
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(models.Plant(id=1, name_jp="テスト", name_en="test"))
+        session.add(models.User(id=USER_ID))
+        session.commit()
+
+
+def run(engine, writers: int, readers: int, seconds: float) -> dict:
+    stop = threading.Event()
+    lock = threading.Lock()
+    commit_latencies: list[float] = []
+    result = {"errors": 0, "reads": 0}
+
+    def writer():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with Session(engine) as session:
+                    session.add(
+                        models.NotificationHistory(
+                            user_id=USER_ID, plant_id=1, message="bench", humidity=500
+                        )
+                    )
+                    session.commit()
+            except OperationalError:
+                with lock:
+                    result["errors"] += 1
+                continue
+            with lock:
+                commit_latencies.append(time.perf_counter() - started)
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with Session(engine) as session:
+                    handler.get_latest_notification(session, USER_ID, 1)
+            except OperationalError:
+                with lock:
+                    result["errors"] += 1
+                continue
+            with lock:
+                result["reads"] += 1
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return {
+        "commits": len(commit_latencies),
+        "p50": percentile(commit_latencies, 0.50) * 1000,
+        "p99": percentile(commit_latencies, 0.99) * 1000,
+        **result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(
+        f"{'engine':>8} {'commits':>8} {'p50_ms':>8} {'p99_ms':>8} {'errors':>7} {'reads':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in (
+            ("default", create_engine),
+            ("tuned", db.create_sqlite_engine),
+        ):
+            engine = factory(f"sqlite:///{Path(tmp) / f'{name}.db'}")
+            prepare(engine)
+            r = run(engine, args.writers, args.readers, args.seconds)
+            engine.dispose()
+            print(
+                f"{name:>8} {r['commits']:>8} {r['p50']:>8.2f} {r['p99']:>8.2f} "
+                f"{r['errors']:>7} {r['reads']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+起動時間のベンチマーク。
+
+新しいPythonプロセスで以下の処理時間をそれぞれ計測する。
+- lazy:  `import app.ai` のみ（現在の起動時の処理）
+- checkpoint: `import app.ai` に加えてモデルを学習時のチェックポイントからロード
+  （従来の import 時の処理と同等）
+- deploy: `import app.ai` に加えてモデルを配布用の重みファイル（scripts/export_weights.py で作成）からロード
+ロードを含む場合は、プロセスの最大メモリ使用量 (maxrss) も表示する。
+
+    uv run python scripts/bench_startup.py --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+LOAD = "import app.ai; app.ai.registry.get()"
+# (実行するコード, 環境変数)
+CASES = {
+    "lazy": ("import app.ai", {}),
+    "checkpoint": (LOAD, {"MODEL_DEPLOY_WEIGHTS": "0"}),
+    "deploy": (LOAD, {"MODEL_DEPLOY_WEIGHTS": "1"}),
+}
+
+TEMPLATE = """
+import time
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+import resource
+import sys
+heavy = [m for m in ("torch", "torchvision", "timm") if m in sys.modules]
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, ",".join(heavy) or "-")
+"""
+
+
+def measure(code: str, env: dict) -> tuple[float, int, str]:
+    output = subprocess.run(
+        [sys.executable, "-c", TEMPLATE.format(code=code)],
+        cwd=ROOT,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    return float(output[-3]), int(output[-2]), output[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'case':>10} {'min_s':>8} {'median_s':>9} {'maxrss_MB':>10}  loaded modules")
+    for name, (code, env) in CASES.items():
+        results = [measure(code, env) for _ in range(args.runs)]
+        times = [t for t, _, _ in results]
+        maxrss = max(r for _, r, _ in results) / 1024
+        print(
+            f"{name:>10} {min(times):>8.3f} {statistics.median(times):>9.3f} "
+            f"{maxrss:>10.0f}  {results[-1][2]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+センサー値の時系列ストア (app/timeseries.py) のベンチマーク。
+
+--devices 台のセンサーが1秒ごとに値を出したものとして --points 件を書き込み、
+1件ずつINSERTしてコミットする方式 (naive, --naive-points 件で計測) と
+TimeSeriesStore.write によるバッチ書き込み（集計の更新を含む）の速度、
+1件あたりのファイルサイズ、範囲検索と保持期間の削除にかかる時間を表示する。
+
+    uv run python scripts/bench_timeseries.py --points 5000000 --batch-size 4096
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.timeseries import TimeSeriesStore
+
+
+def generate(points: int, devices: int, start: int, batch_size: int, seed: int = 0):
+    """(device_id, ts, value) のバッチを順に返す。値はデバイスごとのランダムウォーク"""
+    rng = random.Random(seed)
+    values = [300 + 50 * d for d in range(devices)]
+    batch = []
+    for i in range(points):
+        device_id = i % devices
+        values[device_id] = max(0, min(1023, values[device_id] + rng.randint(-3, 3)))
+        batch.append((device_id, start + i // devices, values[device_id]))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bench_naive(path: Path, points: int, devices: int, start: int) -> float:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE readings (id INTEGER PRIMARY KEY, device_id INTEGER, ts INTEGER, value INTEGER)"
+    )
+    started = time.perf_counter()
+    for batch in generate(points, devices, start, 1):
+        conn.execute(
+            "INSERT INTO readings (device_id, ts, value) VALUES (?, ?, ?)", batch[0]
+        )
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return points / elapsed
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=5_000_000)
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--naive-points", type=int, default=20_000)
+    args = parser.parse_args()
+
+    duration = args.points // args.devices
+    now = int(time.time())
+    start = now - duration
+
+    with tempfile.TemporaryDirectory() as tmp:
+        naive = bench_naive(Path(tmp) / "naive.db", args.naive_points, args.devices, start)
+        print(f"naive (1件ずつコミット): {naive:12,.0f} 件/s")
+
+        path = Path(tmp) / "timeseries.db"
+        store = TimeSeriesStore(str(path), batch_size=args.batch_size)
+        started = time.perf_counter()
+        for batch in generate(args.points, args.devices, start, args.batch_size):
+            store.write(batch)
+        elapsed = time.perf_counter() - started
+        store.flush()
+        size = sum(
+            os.path.getsize(p) for p in Path(tmp).glob("timeseries.db*")
+        )
+        print(
+            f"batch (集計を含む)     : {args.points / elapsed:12,.0f} 件/s "
+            f"({args.points:,} 件, {elapsed:.1f} s, {duration / 86400:.1f} 日分)"
+        )
+        print(f"ファイルサイズ: {size / 1e6:.1f} MB ({size / args.points:.1f} B/件)")
+
+        print("\n範囲検索 (device_id=3)")
+        for label, resolution, span in (
+            ("直近1時間の生データ", "raw", 3600),
+            ("直近1日の1分集計", "1m", 86400),
+            ("全期間の1時間集計", "1h", duration),
+            ("全期間の1日集計", "1d", duration),
+        ):
+            rows, ms = timed(store.query, 3, now - span, now + 1, resolution)
+            print(f"  {label:<14}: {ms:8.2f} ms ({len(rows)} 行)")
+
+        store.retention_days = {"raw": 2, "1m": 5, "1h": 0, "1d": 0}
+        deleted, ms = timed(store.apply_retention, now)
+        print(f"\n保持期間の削除: {ms:.0f} ms {deleted}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
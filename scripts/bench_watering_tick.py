@@ -0,0 +1,217 @@
+"""
+水やりチェック1回分（1 tick）のベンチマーク。
+
+一時的なSQLiteデータベースに --users 人分の登録と通知履歴を作り、
+ユーザー・植物ごとにクエリを発行する従来の処理と run_watering_check を比較する。
+LINEへの送信と湿度センサーはダミーを使う。
+
+    uv run python scripts/bench_watering_tick.py --users 10000
+"""
+
+import argparse
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine, desc, select
+
+from app import handler, models
+from app.delivery import DirectSender
+
+
+class FakeLineBotApi:
+    def __init__(self):
+        self.pushed = 0
+
+    def push_message_with_http_info(self, push_message_request):
+        self.pushed += 1
+
+
+def fake_humidity(channel: int) -> int:
+    return 300 + channel * 50
+
+
+def build_database(path: Path, users: int, plants: int, seed: int = 0):
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    now = datetime.now()
+    with Session(engine) as session:
+        for plant_id in range(1, plants + 1):
+            session.add(
+                models.Plant(id=plant_id, name_jp=f"植物{plant_id}", name_en=f"plant{plant_id}")
+            )
+            for month in range(1, 13):
+                # 半分の植物は日数ベース、残りは湿度ベース
+                frequency = f"{rng.randint(2, 7)}日に1回" if plant_id % 2 else "土が乾いたら"
+                session.add(
+                    models.Watering(
+                        plant_id=plant_id,
+                        month=str(month),
+                        frequency=frequency,
+                        amount="たっぷり",
+                        humidity_when_dry=500,
+                        humidity_when_watered=300,
+                    )
+                )
+        for device_id in range(8):
+            session.add(models.Device(id=device_id, name=f"センサー{device_id}"))
+        session.commit()
+
+        registed_id = 1
+        for u in range(users):
+            user_id = f"U{u:032x}"
+            session.add(models.User(id=user_id))
+            for plant_id in rng.sample(range(1, plants + 1), rng.randint(1, 2)):
+                session.add(
+                    models.Registed(
+                        id=registed_id,
+                        user_id=user_id,
+                        plant_id=plant_id,
+                        device_id=rng.randrange(8),
+                    )
+                )
+                registed_id += 1
+                for days in (7, 4, rng.randint(1, 3)):
+                    session.add(
+                        models.NotificationHistory(
+                            user_id=user_id,
+                            plant_id=plant_id,
+                            notification_type="watering",
+                            message="水やりが必要です",
+                            sent_at=now - timedelta(days=days),
+                            humidity=400,
+                        )
+                    )
+        session.commit()
+    engine.dispose()
+
+
+def legacy_tick(session: Session, line_bot_api, current_time: datetime):
+    """変更前の handler と同じ順序・回数でクエリを発行する処理"""
+
+    def latest(user_id, plant_id):
+        return session.exec(
+            select(models.NotificationHistory)
+            .where(
+                models.NotificationHistory.user_id == user_id,
+                models.NotificationHistory.plant_id == plant_id,
+            )
+            .order_by(desc(models.NotificationHistory.sent_at))
+        ).first()
+
+    for user in session.exec(select(models.User)).all():
+        session.refresh(user)
+        for registed in user.registed_plants:
+            latest_notification = latest(user.id, registed.plant_id)
+            watering = session.exec(
+                select(models.Watering).where(
+                    models.Watering.plant_id == registed.plant_id,
+                    models.Watering.month == f"{current_time.month}",
+                )
+            ).first()
+            humidity = fake_humidity(registed.device_id)
+            # check_watering_effectiveness 内の重複クエリ
+            effectiveness = handler.check_watering_effectiveness(
+                latest(user.id, registed.plant_id), humidity, watering
+            )
+            if effectiveness:
+                line_bot_api.push_message_with_http_info(None)
+                session.add(
+                    models.NotificationHistory(
+                        user_id=user.id,
+                        plant_id=registed.plant_id,
+                        notification_type="watering_feedback",
+                        message=f"{registed.plant.name_jp}: {effectiveness['message']}",
+                        humidity=humidity,
+                    )
+                )
+                session.commit()
+            if latest_notification and latest_notification.sent_at > current_time.replace(
+                hour=0, minute=0, second=0
+            ):
+                continue
+            latest_watering = latest(user.id, registed.plant_id)
+            if handler.check_watering_schedule(
+                watering,
+                current_time,
+                humidity,
+                last_watering_date=latest_watering.sent_at if latest_watering else None,
+            ):
+                # 変更前の通知履歴の記録（1件ずつコミット）
+                session.add(
+                    models.NotificationHistory(
+                        user_id=user.id,
+                        plant_id=registed.plant_id,
+                        notification_type="watering",
+                        message=f"{registed.plant.name_jp}の水やりが必要です。\n水やり頻度: {watering.frequency}\n水やり量: {watering.amount}",
+                        humidity=humidity,
+                    )
+                )
+                session.commit()
+                line_bot_api.push_message_with_http_info(None)
+
+
+def new_tick(session: Session, line_bot_api, current_time: datetime):
+    handler.run_watering_check(
+        session, DirectSender(line_bot_api), current_time, fake_humidity
+    )
+
+
+def run(name: str, tick, base: Path, workdir: Path, **session_kwargs):
+    path = workdir / f"{name}.db"
+    shutil.copy(base, path)
+    engine = create_engine(f"sqlite:///{path}")
+    statements = 0
+    commits = 0
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    @event.listens_for(engine, "commit")
+    def count_commit(*args):
+        nonlocal commits
+        commits += 1
+
+    line_bot_api = FakeLineBotApi()
+    with Session(engine, **session_kwargs) as session:
+        started = time.perf_counter()
+        tick(session, line_bot_api, datetime.now())
+        elapsed = time.perf_counter() - started
+    engine.dispose()
+    print(
+        f"{name:>8}: {elapsed:8.2f} s  SQL文 {statements:>8}  コミット {commits:>6}  "
+        f"通知 {line_bot_api.pushed:>6}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--plants", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        base = workdir / "base.db"
+        started = time.perf_counter()
+        build_database(base, args.users, args.plants)
+        print(f"データ作成: {time.perf_counter() - started:.1f} s ({args.users} ユーザー)")
+        run("legacy", legacy_tick, base, workdir)
+        run("bulk", new_tick, base, workdir, expire_on_commit=False)
+
+
+if __name__ == "__main__":
+    main()
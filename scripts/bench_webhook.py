@@ -0,0 +1,129 @@
+"""
+Webhook処理の負荷テスト。
+
+画像イベント（推論）を継続的に投入して推論を飽和させながら、テキストイベントの
+受信から処理完了までのレイテンシを計測する。イベントループ上で同期的に処理する
+従来方式 (inline) と EventDispatcher を使う方式 (dispatcher) を比較する。
+
+    uv run python scripts/bench_webhook.py --inference-ms 300 --image-rate 20
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.dispatcher import EventDispatcher
+from app.inference import BatchInferenceEngine
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(mode: str, args, saturate: bool) -> list[float]:
+    def fake_predict_batch(images: list[bytes]):
+        # 推論はバッチの大きさにかかわらず一定時間かかるものとする
+        time.sleep(args.inference_ms / 1000)
+        return [("1363117", 0.9) for _ in images]
+
+    engine = BatchInferenceEngine(fake_predict_batch, max_batch_size=8, max_wait_ms=10)
+    engine.start()
+
+    def handle_image(event):
+        time.sleep(args.io_ms / 1000)  # 画像のダウンロード
+        engine.predict(b"image")
+        time.sleep(args.io_ms / 1000)  # 返信
+
+    def handle_text(event):
+        time.sleep(args.io_ms / 1000)  # DBアクセスと返信
+
+    dispatcher = EventDispatcher(max_pending=10_000)
+    dispatcher.start()
+    loop = asyncio.get_running_loop()
+    # 同期のハンドラは、画像とそれ以外で別々のスレッドプールに渡すコルーチンで包む
+    executor = ThreadPoolExecutor(args.workers, thread_name_prefix="webhook")
+    image_executor = ThreadPoolExecutor(args.image_workers, thread_name_prefix="webhook-image")
+
+    async def deliver(user_id: str, func, heavy: bool):
+        if mode == "inline":
+            func(None)
+        else:
+
+            async def run_in_pool(event):
+                await loop.run_in_executor(image_executor if heavy else executor, func, event)
+
+            await dispatcher.submit(user_id, run_in_pool, None)
+
+    text_latencies: list[float] = []
+    stop = asyncio.Event()
+
+    async def image_sender():
+        i = 0
+        while not stop.is_set():
+            await deliver(f"image-user-{i % 1000}", handle_image, True)
+            i += 1
+            await asyncio.sleep(1 / args.image_rate)
+
+    async def text_sender():
+        # レイテンシは予定到着時刻から計測する（イベントループが塞がっている間の待ちも含める）
+        first_arrival = time.perf_counter() + 0.5
+        for i in range(args.texts):
+            started = first_arrival + i / args.text_rate
+            await asyncio.sleep(max(0.0, started - time.perf_counter()))
+            done = loop.create_future()
+
+            def handle_and_measure(event, done=done, started=started):
+                handle_text(event)
+                elapsed = time.perf_counter() - started
+                loop.call_soon_threadsafe(done.set_result, elapsed)
+
+            if mode == "inline":
+                handle_and_measure(None)
+            else:
+                await deliver(f"text-user-{i}", handle_and_measure, False)
+            text_latencies.append(await done)
+
+    senders = [asyncio.create_task(image_sender())] if saturate else []
+    await text_sender()
+    stop.set()
+    await asyncio.gather(*senders)
+    await dispatcher.shutdown()
+    executor.shutdown()
+    image_executor.shutdown()
+    engine.stop()
+    return text_latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inference-ms", type=float, default=300)
+    parser.add_argument("--io-ms", type=float, default=20)
+    parser.add_argument("--image-rate", type=float, default=20, help="画像イベント/秒")
+    parser.add_argument("--text-rate", type=float, default=10, help="テキストイベント/秒")
+    parser.add_argument("--texts", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--image-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'mode':>10} {'images':>8} {'p50_ms':>8} {'p99_ms':>8} {'max_ms':>8}")
+    for mode in ("inline", "dispatcher"):
+        for saturate in (False, True):
+            latencies = await run(mode, args, saturate)
+            print(
+                f"{mode:>10} {'on' if saturate else 'off':>8} "
+                f"{statistics.median(latencies) * 1000:>8.1f} "
+                f"{percentile(latencies, 0.99) * 1000:>8.1f} "
+                f"{max(latencies) * 1000:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
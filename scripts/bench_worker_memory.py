@@ -0,0 +1,92 @@
+"""
+ワーカープロセスごとのメモリ使用量のベンチマーク。
+
+uvicorn --workers N と同じように N 個の新しいPythonプロセスでモデルをロードし、1回推論して
+重みをすべて読み込んだ状態で、各プロセスの RSS と PSS (/proc/<pid>/smaps_rollup) を計測する。
+重みをメモリマップで共有する場合 (MODEL_WEIGHTS_MMAP=1) と、プロセスごとにコピーする場合
+(MODEL_WEIGHTS_MMAP=0) を比較する。PSS は共有しているページを共有しているプロセス数で
+割った値なので、合計がそのワーカー数で実際に使うメモリになる。Linux でのみ動作する。
+
+    uv run python scripts/bench_worker_memory.py --workers 1 2 4 8
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+WORKER = """
+import io
+import sys
+
+from PIL import Image
+
+from app import ai
+
+buffer = io.BytesIO()
+Image.new("RGB", (640, 480), (90, 140, 60)).save(buffer, format="JPEG")
+# 推論を1回行い、すべての重みを読み込む
+ai.predict_batch([buffer.getvalue()])
+print("ready", ai.registry.get().backend, flush=True)
+sys.stdin.read()
+"""
+
+
+def memory_kb(pid: int) -> dict[str, int]:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                values[name] = int(rest.split()[0])
+    return values
+
+
+def measure(workers: int, mmap: bool) -> list[dict[str, int]]:
+    env = {**os.environ, "MODEL_WEIGHTS_MMAP": "1" if mmap else "0", "MODEL_WARMUP": "0"}
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", WORKER],
+            cwd=ROOT,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        for _ in range(workers)
+    ]
+    try:
+        for process in processes:
+            line = process.stdout.readline()
+            if not line.startswith("ready"):
+                raise RuntimeError(f"ワーカーがモデルをロードできませんでした (PID {process.pid})")
+        return [memory_kb(process.pid) for process in processes]
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'mmap':>5} {'workers':>8} {'RSS/worker':>12} {'PSS/worker':>12} {'PSS 合計':>12}")
+    for mmap in (False, True):
+        for workers in args.workers:
+            usage = measure(workers, mmap)
+            rss = sum(u["Rss"] for u in usage) / workers / 1024
+            pss = sum(u["Pss"] for u in usage) / 1024
+            print(
+                f"{'on' if mmap else 'off':>5} {workers:>8} {rss:>9.0f} MB "
+                f"{pss / workers:>9.0f} MB {pss:>9.0f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+「一覧」「削除」の返信で発行されるSQL文の数が登録数によらず一定であることを確認する。
+
+一時的なデータベースに登録数が 0, 1, --max-plants 件のユーザーを作り、app.main の
+テキストメッセージの処理 (_reply_to_text) で「一覧」「一覧 2」「削除」「キャンセル」を
+送ったときのSQL文の数を数える。登録ごとに植物を読み込む (N+1) ようになっていたり、
+1ページに表示する件数 (LIST_PAGE_SIZE) を超えて返信したりした場合は終了コード1で終了する。
+
+    uv run python scripts/check_listing_queries.py --max-plants 100
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+TMP = tempfile.TemporaryDirectory()
+os.environ["DB_URL"] = f"sqlite:///{Path(TMP.name) / 'listing.db'}"
+os.environ.pop("ASYNC_DB_URL", None)
+os.environ.setdefault("LINE_CHANNEL_SECRET", "check")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "check")
+os.environ["MODEL_WARMUP"] = "0"
+
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel
+
+from app import catalog, db, main, models
+
+MESSAGES = ["一覧", "一覧 2", "削除", "キャンセル"]
+
+
+def build_database(max_plants: int) -> dict[int, str]:
+    """登録数ごとのユーザーID"""
+    SQLModel.metadata.create_all(db.engine)
+    users = {}
+    with Session(db.engine) as session:
+        for plant_id in range(1, max_plants + 1):
+            session.add(
+                models.Plant(id=plant_id, name_jp=f"植物{plant_id}", name_en=f"plant{plant_id}")
+            )
+            session.add(models.Device(id=plant_id, name=f"センサー{plant_id}"))
+        for count in sorted({0, 1, max_plants}):
+            user_id = f"U{count:032x}"
+            users[count] = user_id
+            session.add(models.User(id=user_id))
+            for plant_id in range(1, count + 1):
+                session.add(
+                    models.Registed(user_id=user_id, plant_id=plant_id, device_id=plant_id)
+                )
+        session.commit()
+    return users
+
+
+async def count_statements(user_id: str) -> tuple[dict[str, int], dict[str, str]]:
+    counts, replies = {}, {}
+    counter = [0]
+
+    def count(*_):
+        counter[0] += 1
+
+    engine = db.async_engine.sync_engine
+    async with db.async_session() as session:
+        # 会話の状態と植物の一覧を読み込んでおく
+        await main.conversation.store.get(session, user_id)
+        await catalog.registry.get_async(session)
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            for text in MESSAGES:
+                counter[0] = 0
+                replies[text] = await main._reply_to_text(session, user_id, text)
+                counts[text] = counter[0]
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+    return counts, replies
+
+
+async def run(max_plants: int) -> int:
+    users = build_database(max_plants)
+    results = {}
+    for plants, user_id in users.items():
+        results[plants], replies = await count_statements(user_id)
+        listed = sum(line.startswith("- ") for line in replies["一覧"].splitlines())
+        if listed > main.LIST_PAGE_SIZE:
+            print(f"[NG] 登録 {plants} 件: 「一覧」で {listed} 件表示しました")
+            return 1
+
+    print(f"{'登録数':>6} " + " ".join(f"{text:>8}" for text in MESSAGES))
+    for plants, counts in results.items():
+        print(f"{plants:>8} " + " ".join(f"{counts[text]:>8}" for text in MESSAGES))
+
+    # 登録がある場合の文の数は登録数によらない（登録なしの「削除」は状態を更新しない）
+    with_plants = [counts for plants, counts in results.items() if plants]
+    ok = all(counts == with_plants[0] for counts in with_plants)
+    ok = ok and all(results[0][text] == with_plants[0][text] for text in ("一覧", "一覧 2"))
+    print("[OK] SQL文の数は登録数によらず一定です" if ok else "[NG] SQL文の数が登録数で変わります")
+    await db.async_engine.dispose()
+    db.engine.dispose()
+    return 0 if ok else 1
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-plants", type=int, default=100)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    return asyncio.run(run(args.max_plants))
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,139 @@
+"""
+よく実行されるクエリの実行計画 (EXPLAIN QUERY PLAN) を確認する。
+
+一時的なデータベースに現在のスキーマを作り、app/handler.py・app/crud/utils.py の関数と
+app/main.py のクエリを実行して発行されたSELECT文の実行計画を検査する。
+期待するインデックスが使われていない場合は終了コード1で終了するため、マージ前に
+scripts/run_checks.py で実行することで、インデックスの削除や変更によるフルスキャンへの退行を検出できる。
+
+    uv run python scripts/check_query_plans.py
+"""
+
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app import handler, models
+from app.crud import utils as crud
+
+USER_ID = "U0000000000000000000000000000000"
+
+
+def main_delete_query(session: Session):
+    session.exec(
+        select(models.Registed).where(
+            models.Registed.plant_id == 1,
+            models.Registed.user_id == USER_ID,
+        )
+    ).first()
+
+
+def main_list_query(session: Session):
+    crud.list_registed_plants(session, USER_ID, 21)
+
+
+# (名前, 実行する処理, 実行計画に含まれるべき文字列, 含まれてはいけない文字列)
+CHECKS = [
+    (
+        "handler.get_latest_notification",
+        lambda s: handler.get_latest_notification(s, USER_ID, 1),
+        ["ix_notification_histories_user_plant_sent_at"],
+        ["USE TEMP B-TREE"],
+    ),
+    (
+        "handler.get_latest_notifications",
+        handler.get_latest_notifications,
+        ["ix_notification_histories_user_plant_sent_at"],
+        ["USE TEMP B-TREE FOR ORDER BY"],
+    ),
+    (
+        "handler.get_watering_data",
+        lambda s: handler.get_watering_data(s, datetime.now().month, 1),
+        ["ix_waterings_plant_id_month"],
+        ["SCAN waterings"],
+    ),
+    (
+        "handler.get_registrations",
+        handler.get_registrations,
+        ["INTEGER PRIMARY KEY"],
+        ["SCAN plants"],
+    ),
+    (
+        "crud.get_create_user",
+        lambda s: crud.get_create_user(s, USER_ID),
+        ["sqlite_autoindex_users_1"],
+        ["SCAN users"],
+    ),
+    (
+        "crud.plant_regist",
+        lambda s: crud.plant_regist(s, 1, USER_ID, 1),
+        ["ix_registed_plants_user_plant_device"],
+        ["SCAN registed_plants"],
+    ),
+    (
+        "main.handle_message (登録の削除)",
+        main_delete_query,
+        ["ix_registed_plants_user_plant_device"],
+        ["SCAN registed_plants"],
+    ),
+    (
+        "main.handle_message (一覧)",
+        main_list_query,
+        ["ix_registed_plants_user_plant_device", "INTEGER PRIMARY KEY"],
+        ["SCAN registed_plants", "SCAN plants"],
+    ),
+]
+
+
+def explain(engine, statements: list) -> list[str]:
+    plans = []
+    with engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        for statement, parameters in statements:
+            rows = cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            plans.append("\n".join(row[3] for row in rows))
+    return plans
+
+
+def main() -> int:
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'plan.db'}")
+        SQLModel.metadata.create_all(engine)
+        captured = []
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                captured.append((statement, parameters))
+
+        for name, run, required, forbidden in CHECKS:
+            captured.clear()
+            with Session(engine) as session:
+                run(session)
+            plan = "\n".join(explain(engine, list(captured)))
+            missing = [r for r in required if r not in plan]
+            found = [f for f in forbidden if f in plan]
+            ok = not missing and not found
+            failures += not ok
+            print(f"[{'OK' if ok else 'NG'}] {name}")
+            if not ok:
+                for r in missing:
+                    print(f"    期待するインデックスが使われていません: {r}")
+                for f in found:
+                    print(f"    望ましくない実行計画です: {f}")
+                print("    " + plan.replace("\n", "\n    "))
+        engine.dispose()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+水やりの仕組みのリース (app.lease) が複数プロセスで1つだけ動くことを確認する。
+
+一時的なデータベースを使い、--workers 個のプロセスでそれぞれ LeaseRunner を起動する
+（uvicorn --workers N と同じ状況）。処理の代わりに、動いているプロセスの数を共有メモリで数える。
+リースを持っているプロセスを SIGKILL で止めて、残りのプロセスが期限後に引き継ぐことも確認する。
+同時に2つ以上動いた場合や、引き継がれなかった場合は終了コード1で終了する。
+
+    uv run python scripts/check_watering_lease.py --workers 4
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlmodel import SQLModel
+
+from app import db, models  # noqa: F401
+
+TTL_SECONDS = 2.0
+HEARTBEAT_SECONDS = 0.5
+
+
+def worker(db_url: str, running, active, holder_pid, stop):
+    from app.lease import DatabaseLease, LeaseRunner
+
+    engine = db.create_sqlite_engine(db_url)
+
+    def on_start():
+        with running.get_lock():
+            running.value += 1
+            active.value = max(active.value, running.value)
+        holder_pid.value = os.getpid()
+
+    def on_stop():
+        with running.get_lock():
+            running.value -= 1
+
+    lease = DatabaseLease("watering", ttl_seconds=TTL_SECONDS, engine=engine)
+    runner = LeaseRunner(lease, on_start, on_stop, heartbeat_seconds=HEARTBEAT_SECONDS)
+    runner.start()
+    # SIGKILL したプロセスが待っていると Event.set() が終わらないため、値を見て待つ
+    while not stop.value:
+        time.sleep(0.1)
+    runner.stop()
+
+
+def wait_for_holder(holder_pid, exclude: int, timeout: float) -> tuple[int, float]:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if holder_pid.value not in (0, exclude):
+            return holder_pid.value, time.perf_counter() - started
+        time.sleep(0.05)
+    return 0, timeout
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_url = f"sqlite:///{Path(tmp.name) / 'lease.db'}"
+    SQLModel.metadata.create_all(db.create_sqlite_engine(db_url))
+    ctx = mp.get_context("spawn")
+    running = ctx.Value("i", 0)
+    active = ctx.Value("i", 0)
+    holder_pid = ctx.Value("i", 0)
+    stop = ctx.Value("b", 0)
+    processes = [
+        ctx.Process(target=worker, args=(db_url, running, active, holder_pid, stop))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    ok = True
+    first, elapsed = wait_for_holder(holder_pid, 0, 30)
+    if not first:
+        print("[NG] どのプロセスもリースを取得しませんでした")
+        ok = False
+    else:
+        print(f"[OK] PID {first} がリースを取得しました ({elapsed:.2f} 秒)")
+        time.sleep(args.seconds)
+
+        # リースを持っているプロセスを解放させずに止める
+        os.kill(first, signal.SIGKILL)
+        with running.get_lock():
+            running.value -= 1
+        second, elapsed = wait_for_holder(holder_pid, first, TTL_SECONDS * 5)
+        if second:
+            print(f"[OK] PID {second} が {elapsed:.2f} 秒後に引き継ぎました (TTL {TTL_SECONDS} 秒)")
+            time.sleep(args.seconds)
+        else:
+            print("[NG] リースが引き継がれませんでした")
+            ok = False
+
+    stop.value = 1
+    for process in processes:
+        process.join(10)
+    print(f"同時に動いたプロセスの最大数: {active.value}")
+    if active.value > 1:
+        print("[NG] 複数のプロセスで同時に動きました")
+        ok = False
+    tmp.cleanup()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
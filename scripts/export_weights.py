@@ -0,0 +1,28 @@
+"""
+学習時のチェックポイント (data/xp1_weights_best_acc.tar) から、配布用の重みファイルを作る。
+
+モデルの重みと、モデル名・画像サイズ・クラスIDの順序だけを保存する。サーバーは起動時にこのファイルを
+weights_only かつメモリマップで読み込むため、チェックポイント全体の読み込みと xp1.pkl が不要になる。
+チェックポイントを更新した場合は作り直すこと（古い場合はチェックポイントが使われる）。
+
+    uv run python scripts/export_weights.py
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app import ai
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=Path, default=ai.DEPLOY_WEIGHTS_FILE)
+    args = parser.parse_args()
+
+    output = ai.export_deploy_weights(args.output)
+    size = output.stat().st_size / 1024 / 1024
+    source = ai.MODEL_WEIGHTS_FILE.stat().st_size / 1024 / 1024
+    print(f"{output} ({size:.1f} MB, チェックポイント {source:.1f} MB)")
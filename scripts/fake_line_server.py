@@ -0,0 +1,203 @@
+"""
+動作確認用の LINE Messaging API の偽サーバー。
+
+プッシュメッセージ (/v2/bot/message/push) とマルチキャスト (/v2/bot/message/multicast) を
+受け付けて、ユーザーごとに受け取ったメッセージを記録する。
+応答の遅延、5xx・429 の応答、受け付けたのに応答が失われる場合（タイムアウト相当）、
+チャネル全体のレート制限を再現できる。X-Line-Retry-Key が受け付け済みのものなら
+LINE と同じく 409 を返す。
+
+    uv run python scripts/fake_line_server.py --port 8080 --latency-ms 30 --error-rate 0.05
+
+Configuration(host="http://127.0.0.1:8080", access_token="dummy") を使うと、
+MessagingApi の送信先をこのサーバーにできる。
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.delivery import TokenBucket
+
+PUSH_PATH = "/v2/bot/message/push"
+MULTICAST_PATH = "/v2/bot/message/multicast"
+
+
+class FakeLineServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        lost_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.lost_rate = lost_rate
+        self.bucket = TokenBucket(rate_limit, max(1, int(rate_limit))) if rate_limit else None
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.paths: dict[str, int] = defaultdict(int)
+        self.connections = 0
+        self.statuses: dict[int, int] = defaultdict(int)
+        self.received: dict[str, list[str]] = defaultdict(list)
+        self.accepted_retry_keys: set[str] = set()
+        self.request_times: list[float] = []
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeLineServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def messages(self) -> int:
+        with self.lock:
+            return sum(len(texts) for texts in self.received.values())
+
+    def duplicates(self) -> int:
+        """同じユーザーに同じ本文が複数回届いた数"""
+        with self.lock:
+            return sum(len(texts) - len(set(texts)) for texts in self.received.values())
+
+    def _decide(self, path, retry_key):
+        """(status, 受け付けたか) を決める"""
+        with self.lock:
+            self.requests += 1
+            self.paths[path] += 1
+            self.request_times.append(time.monotonic())
+            if retry_key and retry_key in self.accepted_retry_keys:
+                return 409, False
+            if self.bucket is not None and self.bucket.try_acquire() > 0:
+                return 429, False
+            roll = self.rng.random()
+            if roll < self.error_rate:
+                return self.rng.choice((500, 503, 429)), False
+            if roll < self.error_rate + self.lost_rate:
+                # 受け付けたが応答が届かなかった
+                return 504, True
+            return 200, True
+
+    def _accept(self, retry_key, recipients, texts):
+        with self.lock:
+            if retry_key:
+                self.accepted_retry_keys.add(retry_key)
+            for to in recipients:
+                self.received[to].extend(texts)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: dict):
+                data = json.dumps(body).encode()
+                with server.lock:
+                    server.statuses[status] += 1
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    self._reply(401, {"message": "Authentication failed"})
+                    return
+                if self.path not in (PUSH_PATH, MULTICAST_PATH):
+                    self._reply(404, {"message": "Not found"})
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+                retry_key = self.headers.get("X-Line-Retry-Key")
+                status, accepted = server._decide(self.path, retry_key)
+                texts = [m.get("text", "") for m in payload.get("messages", [])]
+                multicast = self.path == MULTICAST_PATH
+                if accepted:
+                    recipients = payload["to"] if multicast else [payload["to"]]
+                    server._accept(retry_key, recipients, texts)
+                if status == 200 and multicast:
+                    self._reply(200, {})
+                elif status == 200:
+                    self._reply(
+                        200,
+                        {
+                            "sentMessages": [
+                                {"id": uuid.uuid4().hex, "quoteToken": uuid.uuid4().hex}
+                                for _ in texts
+                            ]
+                        },
+                    )
+                elif status == 409:
+                    self._reply(409, {"message": "The retry key is already accepted"})
+                else:
+                    self._reply(status, {"message": "fake error"})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--lost-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=0, help="リクエスト/秒 (0 は無制限)")
+    args = parser.parse_args()
+
+    server = FakeLineServer(
+        args.host,
+        args.port,
+        args.latency_ms,
+        args.error_rate,
+        args.lost_rate,
+        args.rate_limit,
+    )
+    print(f"{server.url} で待ち受けます")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"リクエスト {server.requests} 件, メッセージ {server.messages()} 件")
+
+
+if __name__ == "__main__":
+    main()
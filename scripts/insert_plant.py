@@ -1,5 +1,6 @@
 import csv
 import sqlite3
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -33,6 +34,20 @@ for row in data:
         ),
     )
 
+# 起動中のアプリに植物の一覧の読み込み直しを知らせる (app.rules.bump_catalog_version と同じ)
+try:
+    cursor.execute(
+        """
+        INSERT INTO catalog_versions (name, version, created_at, updated_at)
+        VALUES ('plants', ?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET version = excluded.version, updated_at = excluded.updated_at
+        """,
+        (time.time_ns(), datetime.now(), datetime.now()),
+    )
+except sqlite3.OperationalError as e:
+    # catalog_versions はアプリの起動時に作成される
+    print(f"Skipped updating catalog_versions: {e}")
+
 # Commit the changes and close the connection
 conn.commit()
 cursor.close()
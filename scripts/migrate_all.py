@@ -57,6 +57,12 @@ if __name__ == "__main__":
                 humidity_when_watered=int(row["humidity_when_watered"]),
             )
             session.add(watering)
+        # 起動中のアプリに水やりの規則と植物の一覧の読み込み直しを知らせる
+        from app.catalog import PLANTS
+        from app.rules import bump_catalog_version
+
+        bump_catalog_version(session)
+        bump_catalog_version(session, PLANTS)
         session.commit()
         
         # 登録済みの植物一覧表示
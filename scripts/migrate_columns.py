@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app import db
+
+if __name__ == "__main__":
+    added = db.migrate_columns()
+    if added:
+        for column in added:
+            print(f"追加: {column}")
+    else:
+        print("追加する列はありません")
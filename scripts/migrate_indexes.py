@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import inspect
+
+from app import db
+
+if __name__ == "__main__":
+    db.migrate_indexes()
+    inspector = inspect(db.engine)
+    for table in inspector.get_table_names():
+        for index in inspector.get_indexes(table):
+            print(f"{table}: {index['name']} ({', '.join(index['column_names'])})")
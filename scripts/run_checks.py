@@ -0,0 +1,49 @@
+"""
+scripts/check_*.py をすべて実行し、1つでも失敗した場合は終了コード1で終了する。
+
+CI はないため、データベースのスキーマ・インデックス・クエリ・リースに関わる変更をマージする前に
+手元で実行する。各チェックは一時的なデータベースを使うため、data/ のデータベースには触れない。
+
+    uv run python scripts/run_checks.py
+    uv run python scripts/run_checks.py check_query_plans check_listing_queries
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS = Path(__file__).parent
+ROOT = SCRIPTS.parent
+
+
+def main() -> int:
+    checks = sorted(path.stem for path in SCRIPTS.glob("check_*.py"))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("checks", nargs="*", default=checks, help=", ".join(checks))
+    args = parser.parse_args()
+    unknown = set(args.checks) - set(checks)
+    if unknown:
+        parser.error(f"不明なチェックです: {', '.join(sorted(unknown))}")
+
+    failed = []
+    for name in args.checks:
+        print(f"=== {name}", flush=True)
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, str(SCRIPTS / f"{name}.py")], cwd=ROOT)
+        elapsed = time.perf_counter() - started
+        status = "OK" if result.returncode == 0 else f"NG (終了コード {result.returncode})"
+        print(f"=== {name}: {status} ({elapsed:.1f} s)", flush=True)
+        if result.returncode != 0:
+            failed.append(name)
+
+    if failed:
+        print(f"失敗したチェック: {', '.join(failed)}")
+        return 1
+    print(f"すべてのチェックに成功しました ({len(args.checks)} 件)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())